@@ -1,3 +1,3 @@
-from .core import Core
-from .mars import MARS
+from .core import Core, ArrayCore, PackedCore
+from .mars import MARS, WarriorState
 from .redcode import parse, Warrior, Instruction
\ No newline at end of file
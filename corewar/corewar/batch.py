@@ -0,0 +1,298 @@
+# coding: utf-8
+
+import random
+
+import numpy as np
+
+from .core import DEFAULT_INITIAL_INSTRUCTION
+from .redcode import *
+
+__all__ = ['BatchMARS']
+
+def _table(modifiers):
+    "A boolean lookup table indexed by modifier."
+    return np.array([m in modifiers for m in range(M_A, M_I + 1)])
+
+# arithmetic and MOV: which fields of the B-target are written
+WRITES_A = _table((M_A, M_BA, M_F, M_X, M_I))
+WRITES_B = _table((M_B, M_AB, M_F, M_X, M_I))
+# MOV: the A-field is written from ira.a_number (else from ira.b_number)
+MOV_A_FROM_A = _table((M_A, M_F))
+# MOV: the B-field is written from ira.b_number (else from ira.a_number)
+MOV_B_FROM_B = _table((M_B, M_F))
+# arithmetic: the B-result uses ira.a_number (else ira.b_number)
+ARITH_B_FROM_A = _table((M_AB, M_X))
+# arithmetic F/I write the A-field first, X writes the B-field first
+ARITH_A_FIRST = _table((M_F, M_I))
+# JMZ, JMN and DJN test the A-field, the B-field or both
+TESTS_A = _table((M_A, M_BA, M_F, M_X, M_I))
+TESTS_B = _table((M_B, M_AB, M_F, M_X, M_I))
+TESTS_BOTH = _table((M_F, M_X, M_I))
+# comparisons: first pair compares ira.a_number (else ira.b_number) with
+# irb.a_number (else irb.b_number)
+CMP_X_FROM_A = _table((M_A, M_AB, M_F, M_X))
+CMP_Y_FROM_A = _table((M_A, M_BA, M_F))
+# comparisons with a second pair: F compares b to b, X compares b to a
+CMP_TWO_PAIRS = _table((M_F, M_X))
+
+class BatchMARS(object):
+    """A batch of independent rounds of the same warriors, advanced one cycle
+       at a time in lockstep.
+
+       Each round has its own core and task queues, laid out along the first
+       dimension of 2-D arrays (rounds x core size), and every cycle executes
+       the current task of a warrior in all rounds at once with NumPy
+       gather/scatter. Rounds only differ by where the warriors were loaded.
+
+       It follows the semantics of a headless MARS over an ArrayCore: fields
+       are stored modulo the core size, and read/write limits are the core
+       size. `coverage` records every address enqueued by each warrior, as
+       MyMARS does for memory coverage.
+    """
+
+    def __init__(self, warriors, positions, size=8000, max_processes=None,
+                 initial_instruction=DEFAULT_INITIAL_INSTRUCTION):
+        self.warriors = warriors
+        self.size = size
+        self.max_processes = max_processes if max_processes else size
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, len(warriors))
+        self.rounds = len(positions)
+
+        n_cells = self.rounds * size
+        self.opcode = np.full(n_cells, initial_instruction.opcode, dtype=np.int64)
+        self.modifier = np.full(n_cells, initial_instruction.modifier, dtype=np.int64)
+        self.a_mode = np.full(n_cells, initial_instruction.a_mode, dtype=np.int64)
+        self.b_mode = np.full(n_cells, initial_instruction.b_mode, dtype=np.int64)
+        self.a_number = np.full(n_cells, initial_instruction.a_number % size, dtype=np.int64)
+        self.b_number = np.full(n_cells, initial_instruction.b_number % size, dtype=np.int64)
+
+        # task queues are ring buffers of max_processes addresses, one per
+        # (round, warrior) slot
+        n_slots = self.rounds * len(warriors)
+        self.queue = np.zeros((n_slots, self.max_processes), dtype=np.int64)
+        self.head = np.zeros(n_slots, dtype=np.int64)
+        self.count = np.zeros(n_slots, dtype=np.int64)
+        self.coverage = np.zeros((self.rounds, len(warriors), size), dtype=bool)
+
+        self.load_warriors(positions)
+
+    @classmethod
+    def from_seeds(cls, warriors, seeds, size=8000, minimum_separation=100,
+                   max_processes=None):
+        """Create a batch with one round per seed, placing the warriors exactly
+           as MARS.load_warriors does after random.seed(seed).
+        """
+        space = size // len(warriors)
+        positions = []
+        for seed in seeds:
+            random.seed(seed)
+            positions.append([n * space + random.randint(0, max(0, space - len(warrior) -
+                                                                   minimum_separation))
+                              for n, warrior in enumerate(warriors)])
+        return cls(warriors, positions, size=size, max_processes=max_processes)
+
+    def load_warriors(self, positions):
+        "Loads the warriors of every round at the given positions."
+        size = self.size
+        for r, round_positions in enumerate(positions):
+            for n, (warrior, position) in enumerate(zip(self.warriors, round_positions)):
+                slot = r * len(self.warriors) + n
+                self.queue[slot, 0] = (position + warrior.start) % size
+                self.head[slot] = 0
+                self.count[slot] = 1
+                for i, instruction in enumerate(warrior.instructions):
+                    cell = r * size + (position + i) % size
+                    self.opcode[cell] = instruction.opcode
+                    self.modifier[cell] = instruction.modifier
+                    self.a_mode[cell] = instruction.a_mode
+                    self.b_mode[cell] = instruction.b_mode
+                    self.a_number[cell] = instruction.a_number % size
+                    self.b_number[cell] = instruction.b_number % size
+
+    def nprocs(self):
+        "Number of processes of every warrior, shape (rounds, warriors)."
+        return self.count.reshape(self.rounds, len(self.warriors))
+
+    def task_queue(self, round, n):
+        "The task queue of the nth warrior in a round, as a list of addresses."
+        slot = round * len(self.warriors) + n
+        head, count = self.head[slot], self.count[slot]
+        return [int(a) for a in self.queue[slot, (head + np.arange(count)) % self.max_processes]]
+
+    def step(self, running=None):
+        """Run one simulation step in every round (or in the rounds selected
+           by the boolean mask `running`): execute one task of every active
+           warrior.
+        """
+        n_warriors = len(self.warriors)
+        for n in range(n_warriors):
+            active = self.count[n::n_warriors] > 0
+            if running is not None:
+                active &= running
+            rounds = np.flatnonzero(active)
+            if len(rounds):
+                self._execute(rounds, n)
+
+    def _enqueue(self, slots, addresses):
+        "Enqueue one address per slot, where the slot's queue is not full."
+        ok = self.count[slots] < self.max_processes
+        slots, addresses = slots[ok], addresses[ok] % self.size
+        tail = (self.head[slots] + self.count[slots]) % self.max_processes
+        self.queue[slots, tail] = addresses
+        self.count[slots] += 1
+        self.coverage.reshape(-1, self.size)[slots, addresses] = True
+
+    def _operand(self, base, pc, mode, number):
+        """Evaluate an operand, applying pre-decrements. Returns the pointer
+           relative to pc and the post-increment address (or None).
+        """
+        size = self.size
+        pointer = np.where(mode == IMMEDIATE, 0, number)
+        indirect = mode > DIRECT
+        if not indirect.any():
+            return pointer, None
+
+        pip = base + (pc + pointer) % size
+        for predec, field in ((PREDEC_A, self.a_number), (PREDEC_B, self.b_number)):
+            selected = pip[mode == predec]
+            if len(selected):
+                field[selected] = (field[selected] - 1) % size
+
+        use_a = (mode == PREDEC_A) | (mode == INDIRECT_A) | (mode == POSTINC_A)
+        offset = np.where(use_a, self.a_number[pip], self.b_number[pip])
+        pointer = np.where(indirect, (pointer + offset) % size, pointer)
+        return pointer, pip
+
+    def _postincrement(self, pip, mode):
+        if pip is None:
+            return
+        for postinc, field in ((POSTINC_A, self.a_number), (POSTINC_B, self.b_number)):
+            selected = pip[mode == postinc]
+            if len(selected):
+                field[selected] = (field[selected] + 1) % self.size
+
+    def _fetch(self, cells):
+        "Snapshot of the instructions at cells, as a tuple of field arrays."
+        return (self.opcode[cells], self.modifier[cells], self.a_mode[cells],
+                self.a_number[cells], self.b_mode[cells], self.b_number[cells])
+
+    def _execute(self, rounds, n):
+        size = self.size
+        slots = rounds * len(self.warriors) + n
+
+        # pop the process counters
+        pc = self.queue[slots, self.head[slots]]
+        self.head[slots] = (self.head[slots] + 1) % self.max_processes
+        self.count[slots] -= 1
+
+        base = rounds * size
+        opcode, modifier, a_mode, a_number, b_mode, b_number = self._fetch(base + pc)
+
+        pa, pip = self._operand(base, pc, a_mode, a_number)
+        ira = self._fetch(base + (pc + pa) % size)
+        self._postincrement(pip, a_mode)
+
+        pb, pip = self._operand(base, pc, b_mode, b_number)
+        irb = self._fetch(base + (pc + pb) % size)
+        self._postincrement(pip, b_mode)
+
+        target = base + (pc + pb) % size
+        ia, ib = ira[3], ira[5]
+        ba, bb = irb[3], irb[5]
+
+        # by default the next instruction is queued, DAT kills the process
+        next_address = pc + 1
+        queued = opcode != DAT
+
+        group = (opcode == MOV)
+        if group.any():
+            k = np.flatnonzero(group)
+            m = modifier[k]
+            whole = m == M_I
+            if whole.any():
+                cells = target[k[whole]]
+                for field, value in zip((self.opcode, self.modifier, self.a_mode,
+                                         self.a_number, self.b_mode, self.b_number), ira):
+                    field[cells] = value[k[whole]]
+            fields = ~whole & WRITES_B[m]
+            self.b_number[target[k[fields]]] = np.where(MOV_B_FROM_B[m], ib[k], ia[k])[fields]
+            fields = ~whole & WRITES_A[m]
+            self.a_number[target[k[fields]]] = np.where(MOV_A_FROM_A[m], ia[k], ib[k])[fields]
+
+        group = (opcode >= ADD) & (opcode <= MOD)
+        if group.any():
+            k = np.flatnonzero(group)
+            m, op = modifier[k], opcode[k]
+            xa = np.where(m == M_BA, bb[k], ba[k])
+            ya = np.where(m == M_X, ib[k], ia[k])
+            xb = bb[k]
+            yb = np.where(ARITH_B_FROM_A[m], ia[k], ib[k])
+            writes_a, writes_b = WRITES_A[m], WRITES_B[m]
+            division = op >= DIV
+            ok_a = ~writes_a | ~division | (ya != 0)
+            ok_b = ~writes_b | ~division | (yb != 0)
+
+            write = writes_a & ok_a & (ok_b | (m != M_X))
+            self.a_number[target[k[write]]] = self._arithmetic(op, xa, ya)[write] % size
+            write = writes_b & ok_b & (ok_a | ~ARITH_A_FIRST[m])
+            self.b_number[target[k[write]]] = self._arithmetic(op, xb, yb)[write] % size
+            queued[k] = ok_a & ok_b
+
+        group = opcode == JMP
+        if group.any():
+            next_address = np.where(group, pc + pa, next_address)
+
+        group = (opcode >= JMZ) & (opcode <= DJN)
+        if group.any():
+            k = np.flatnonzero(group)
+            m, op = modifier[k], opcode[k]
+            tests_a, tests_b = TESTS_A[m], TESTS_B[m]
+            va, vb = ba[k], bb[k]
+            djn = op == DJN
+            if djn.any():
+                for tests, field in ((tests_a, self.a_number), (tests_b, self.b_number)):
+                    cells = target[k[djn & tests]]
+                    field[cells] = (field[cells] - 1) % size
+                va = np.where(djn & tests_a, va - 1, va)
+                vb = np.where(djn & tests_b, vb - 1, vb)
+            zero_a, zero_b = va == 0, vb == 0
+            is_zero = np.where(TESTS_BOTH[m], zero_a & zero_b, np.where(tests_a, zero_a, zero_b))
+            non_zero = np.where(TESTS_BOTH[m], ~zero_a | ~zero_b, np.where(tests_a, ~zero_a, ~zero_b))
+            jump = np.where(op == JMZ, is_zero, non_zero)
+            next_address = next_address.copy()
+            next_address[k] = pc[k] + np.where(jump, pa[k], 1)
+
+        group = (opcode >= SLT) & (opcode <= SNE)
+        if group.any():
+            k = np.flatnonzero(group)
+            m, op = modifier[k], opcode[k]
+            x1 = np.where(CMP_X_FROM_A[m], ia[k], ib[k])
+            y1 = np.where(CMP_Y_FROM_A[m], ba[k], bb[k])
+            x2 = ib[k]
+            y2 = np.where(m == M_X, ba[k], bb[k])
+            result = (self._compare(op, x1, y1) &
+                      (~CMP_TWO_PAIRS[m] | self._compare(op, x2, y2)))
+            whole = m == M_I
+            if whole.any():
+                equal = np.ones(len(k), dtype=bool)
+                for a, b in zip(ira, irb):
+                    equal &= a[k] == b[k]
+                result = np.where(whole, equal, result)
+            next_address = next_address.copy()
+            next_address[k] = pc[k] + np.where(result, 2, 1)
+
+        self._enqueue(slots[queued], next_address[queued])
+
+        group = opcode == SPL
+        if group.any():
+            self._enqueue(slots[group], (pc + pa)[group])
+
+    @staticmethod
+    def _arithmetic(op, x, y):
+        safe_y = np.where(y == 0, 1, y)
+        return np.select([op == ADD, op == SUB, op == MUL, op == DIV],
+                         [x + y, x - y, x * y, x // safe_y], x % safe_y)
+
+    @staticmethod
+    def _compare(op, x, y):
+        return np.where(op == SLT, x < y, np.where(op == SNE, x != y, x == y))
@@ -1,9 +1,11 @@
 # coding: utf-8
 
+from array import array
 from copy import copy
-from .redcode import Instruction
+from .redcode import *
 
-__all__ = ['DEFAULT_INITIAL_INSTRUCTION', 'Core']
+__all__ = ['DEFAULT_INITIAL_INSTRUCTION', 'Core', 'ArrayCore', 'CoreCell',
+           'PackedCore', 'PackedCell']
 
 DEFAULT_INITIAL_INSTRUCTION = Instruction('DAT', 'F', '$', 0, '$', 0)
 
@@ -48,9 +50,12 @@ class Core(object):
         return result
 
     def __getitem__(self, address):
+        if isinstance(address, slice):
+            return self._getslice(address.start, address.stop)
         return self.instructions[address % self.size]
 
-    def __getslice__(self, start, stop):
+    def _getslice(self, start, stop):
+        start, stop = start % self.size, stop % self.size
         if start > stop:
             return self.instructions[start:] + self.instructions[:stop]
         else:
@@ -68,3 +73,222 @@ class Core(object):
     def __repr__(self):
         return "<Core size=%d>" % self.size
 
+
+class ArrayCore(Core):
+    """A Core stored as a struct of arrays: opcode, modifier, a_mode, b_mode,
+       a_number and b_number are kept in six parallel int32 arrays instead of
+       one Instruction object per cell.
+
+       Fields are stored modulo the core size, as in ICWS'94. Indexing returns
+       a CoreCell view bound to the address, so the MARS can run against it
+       unchanged.
+    """
+
+    FIELDS = ('opcode', 'modifier', 'a_mode', 'b_mode', 'a_number', 'b_number')
+
+    def clear(self, instruction=DEFAULT_INITIAL_INSTRUCTION):
+        """Writes the same instruction thorough the entire core.
+        """
+        for field in self.FIELDS:
+            value = getattr(instruction, field)
+            if field in ('a_number', 'b_number'):
+                value %= self.size
+            setattr(self, field, array('i', [value]) * self.size)
+
+    def trim_signed(self, value):
+        "Return a trimmed value to the bounds of the core size"
+        return value % self.size
+
+    def __getitem__(self, address):
+        if isinstance(address, slice):
+            return self._getslice(address.start, address.stop)
+        return CoreCell(self, address % self.size)
+
+    def _getslice(self, start, stop):
+        start, stop = start % self.size, stop % self.size
+        if start > stop:
+            addresses = list(range(start, self.size)) + list(range(stop))
+        else:
+            addresses = range(start, stop)
+        return [CoreCell(self, address) for address in addresses]
+
+    def __setitem__(self, address, instruction):
+        address %= self.size
+        self.opcode[address] = instruction.opcode
+        self.modifier[address] = instruction.modifier
+        self.a_mode[address] = instruction.a_mode
+        self.b_mode[address] = instruction.b_mode
+        self.a_number[address] = instruction.a_number % self.size
+        self.b_number[address] = instruction.b_number % self.size
+
+    def __iter__(self):
+        return (CoreCell(self, address) for address in range(self.size))
+
+    def __repr__(self):
+        return "<ArrayCore size=%d>" % self.size
+
+class CoreCell(object):
+    """A view of one address of an ArrayCore, with the same fields as an
+       Instruction. Reads and writes go straight to the core arrays; copying a
+       cell returns a detached Instruction snapshot.
+    """
+
+    __slots__ = ('core', 'address')
+
+    def __init__(self, core, address):
+        self.core = core
+        self.address = address
+
+    @property
+    def opcode(self):
+        return self.core.opcode[self.address]
+
+    @property
+    def modifier(self):
+        return self.core.modifier[self.address]
+
+    @property
+    def a_mode(self):
+        return self.core.a_mode[self.address]
+
+    @property
+    def b_mode(self):
+        return self.core.b_mode[self.address]
+
+    @property
+    def a_number(self):
+        return self.core.a_number[self.address]
+
+    @property
+    def b_number(self):
+        return self.core.b_number[self.address]
+
+    @opcode.setter
+    def opcode(self, value):
+        self.core.opcode[self.address] = value
+
+    @modifier.setter
+    def modifier(self, value):
+        self.core.modifier[self.address] = value
+
+    @a_mode.setter
+    def a_mode(self, value):
+        self.core.a_mode[self.address] = value
+
+    @b_mode.setter
+    def b_mode(self, value):
+        self.core.b_mode[self.address] = value
+
+    @a_number.setter
+    def a_number(self, number):
+        self.core.a_number[self.address] = number % self.core.size
+
+    @b_number.setter
+    def b_number(self, number):
+        self.core.b_number[self.address] = number % self.core.size
+
+    def __copy__(self):
+        core, address = self.core, self.address
+        return Instruction(core.opcode[address], core.modifier[address],
+                           core.a_mode[address], core.a_number[address],
+                           core.b_mode[address], core.b_number[address])
+
+    def __eq__(self, other):
+        return Instruction.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __str__(self):
+        return str(copy(self))
+
+    def __repr__(self):
+        return "<%s>" % self
+
+
+class PackedCore(Core):
+    """A Core stored as one flat array of packed 64-bit instructions (see
+       Instruction.pack). Copying an instruction is copying an int, comparing
+       two is comparing two ints, and snapshot() copies the whole core at
+       once. PackedMARS executes on the ints directly.
+
+       Fields are stored modulo the core size. Indexing returns a PackedCell
+       view bound to the address, so the plain MARS can run against it too.
+       Read and write limits are not supported.
+    """
+
+    def __init__(self, initial_instruction=DEFAULT_INITIAL_INSTRUCTION,
+                 size=8000, read_limit=None, write_limit=None):
+        if size > MAX_PACKED_SIZE:
+            raise ValueError("Core size %d too large to pack" % size)
+        if (read_limit or size) != size or (write_limit or size) != size:
+            raise ValueError("PackedCore does not support read or write limits")
+        super(PackedCore, self).__init__(initial_instruction, size)
+
+    def clear(self, instruction=DEFAULT_INITIAL_INSTRUCTION):
+        """Writes the same instruction thorough the entire core.
+        """
+        self.cells = array('q', [instruction.pack(self.size)]) * self.size
+
+    def trim_signed(self, value):
+        "Return a trimmed value to the bounds of the core size"
+        return value % self.size
+
+    def snapshot(self):
+        "Return a copy of the packed cells."
+        return array('q', self.cells)
+
+    def __getitem__(self, address):
+        if isinstance(address, slice):
+            return self._getslice(address.start, address.stop)
+        return PackedCell(self, address % self.size)
+
+    def _getslice(self, start, stop):
+        start, stop = start % self.size, stop % self.size
+        if start > stop:
+            addresses = list(range(start, self.size)) + list(range(stop))
+        else:
+            addresses = range(start, stop)
+        return [PackedCell(self, address) for address in addresses]
+
+    def __setitem__(self, address, instruction):
+        if not isinstance(instruction, int):
+            instruction = instruction.pack(self.size)
+        self.cells[address % self.size] = instruction
+
+    def __iter__(self):
+        return (PackedCell(self, address) for address in range(self.size))
+
+    def __repr__(self):
+        return "<PackedCore size=%d>" % self.size
+
+def _packed_field(shift, mask, trimmed=False):
+    "A property reading and writing one field of the packed cell."
+
+    def get(self):
+        return (self.core.cells[self.address] >> shift) & mask
+
+    def set(self, value):
+        if trimmed:
+            value %= self.core.size
+        cells = self.core.cells
+        cells[self.address] = (cells[self.address] & ~(mask << shift)) | (value << shift)
+
+    return property(get, set)
+
+class PackedCell(CoreCell):
+    """A view of one address of a PackedCore, with the same fields as an
+       Instruction.
+    """
+
+    __slots__ = ()
+
+    opcode = _packed_field(OPCODE_SHIFT, 31)
+    modifier = _packed_field(MODIFIER_SHIFT, 7)
+    a_mode = _packed_field(A_MODE_SHIFT, 7)
+    b_mode = _packed_field(B_MODE_SHIFT, 7)
+    a_number = _packed_field(A_NUMBER_SHIFT, NUMBER_MASK, trimmed=True)
+    b_number = _packed_field(B_NUMBER_SHIFT, NUMBER_MASK, trimmed=True)
+
+    def __copy__(self):
+        return Instruction.unpack(self.core.cells[self.address])
@@ -0,0 +1,145 @@
+# coding: utf-8
+
+import ast
+import operator
+from functools import lru_cache
+
+__all__ = ['Expression', 'compile_expression']
+
+BINARY_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub,
+                    ast.Mult: operator.mul, ast.Div: operator.truediv,
+                    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod}
+
+# bound of the magnitude of every constant and intermediate value, so that an
+# untrusted source cannot build huge ints (e.g. by squaring EQUs in a chain)
+LIMIT = 2 ** 31
+
+UNARY_OPERATORS = {ast.UAdd: operator.pos, ast.USub: operator.neg,
+                   ast.Not: operator.not_}
+
+COMPARISONS = {ast.Eq: operator.eq, ast.NotEq: operator.ne,
+               ast.Lt: operator.lt, ast.LtE: operator.le,
+               ast.Gt: operator.gt, ast.GtE: operator.ge}
+
+class Expression(object):
+    """An arithmetic expression of a Redcode source, compiled into nested
+       closures. `names` are the names it refers to; an expression without
+       names is folded into its `value` when compiled.
+
+       Only integer constants, names, parentheses, the arithmetic operators
+       + - * / // %, comparisons and not/and/or are accepted, with the same
+       semantics as in Python. Anything else (calls, attributes, strings,
+       powers, ...) raises a ValueError when compiled, and so does a constant
+       or an arithmetic result of magnitude above LIMIT when computed.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        try:
+            tree = ast.parse(source.strip(), mode='eval')
+        except SyntaxError:
+            raise ValueError('Invalid expression: "%s"' % source)
+        self.names = frozenset()
+        self.function, self.constant = self._compile(tree.body)
+        self.value = self.function(None) if self.constant else None
+
+    def __call__(self, lookup):
+        """Evaluate with lookup(name), returning the value of a name."""
+        return self.function(lookup)
+
+    def evaluate(self, environment, names=None):
+        """Evaluate like eval(source, environment, names): a name is looked up
+           in names first, then in environment."""
+        if self.constant:
+            return self.value
+        def lookup(name):
+            if names is not None and name in names:
+                return names[name]
+            if name in environment:
+                return environment[name]
+            raise NameError("name '%s' is not defined" % name)
+        return self.function(lookup)
+
+    def _compile(self, node):
+        """Returns a function of lookup computing node, and whether it is
+           constant (refers to no name)."""
+        if isinstance(node, ast.Constant):
+            value = node.value
+            if not isinstance(value, int):
+                raise ValueError('Invalid constant %r in expression: "%s"' %
+                                 (value, self.source))
+            self._bounded(value)
+            return (lambda lookup: value), True
+
+        if isinstance(node, ast.Name):
+            name = node.id
+            self.names = self.names | {name}
+            return (lambda lookup: lookup(name)), False
+
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+            op = BINARY_OPERATORS[type(node.op)]
+            left, left_constant = self._compile(node.left)
+            right, right_constant = self._compile(node.right)
+            function = lambda lookup: self._bounded(op(left(lookup), right(lookup)))
+            return self._fold(function, left_constant and right_constant)
+
+        if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+            op = UNARY_OPERATORS[type(node.op)]
+            operand, constant = self._compile(node.operand)
+            return self._fold(lambda lookup: self._bounded(op(operand(lookup))), constant)
+
+        if isinstance(node, ast.Compare) and all(type(op) in COMPARISONS for op in node.ops):
+            ops = [COMPARISONS[type(op)] for op in node.ops]
+            compiled = [self._compile(n) for n in [node.left] + node.comparators]
+            operands = [function for function, _ in compiled]
+            def compare(lookup):
+                left = operands[0](lookup)
+                for op, operand in zip(ops, operands[1:]):
+                    right = operand(lookup)
+                    if not op(left, right):
+                        return False
+                    left = right
+                return True
+            return self._fold(compare, all(constant for _, constant in compiled))
+
+        if isinstance(node, ast.BoolOp):
+            compiled = [self._compile(n) for n in node.values]
+            operands = [function for function, _ in compiled]
+            if isinstance(node.op, ast.And):
+                def boolean(lookup):
+                    for operand in operands:
+                        value = operand(lookup)
+                        if not value:
+                            return value
+                    return value
+            else:
+                def boolean(lookup):
+                    for operand in operands:
+                        value = operand(lookup)
+                        if value:
+                            return value
+                    return value
+            return self._fold(boolean, all(constant for _, constant in compiled))
+
+        raise ValueError('Invalid expression: "%s"' % self.source)
+
+    def _bounded(self, value):
+        if abs(value) > LIMIT:
+            raise ValueError('Value out of range in expression: "%s"' % self.source)
+        return value
+
+    def _fold(self, function, constant):
+        if constant:
+            try:
+                value = function(None)
+            except ArithmeticError:
+                # e.g. a division by zero, raised when (and if) evaluated
+                return function, False
+            return (lambda lookup: value), True
+        return function, False
+
+@lru_cache(maxsize=65536)
+def compile_expression(source):
+    """Compile an expression of the source once; warriors repeat the same
+       few operand expressions over and over."""
+    return Expression(source)
@@ -263,7 +263,7 @@ if __name__ == "__main__":
         simulation.reset()
 
         # start with all warriors active
-        active_warriors = list(warriors)
+        active_warriors = list(simulation.states)
 
         # how many warriors should be playing to skip to next round
         active_warrior_to_stop = 1 if len(warriors) >= 2 else 0
@@ -315,7 +315,7 @@ if __name__ == "__main__":
                     print("{} ({}) losses after {} cycles.".format(warrior.name,
                                                                     warrior.author,
                                                                     cycle))
-                    warrior.losses += 1
+                    warrior.warrior.losses += 1
                     to_remove.append(warrior)
 
             for warrior in to_remove:
@@ -327,7 +327,7 @@ if __name__ == "__main__":
                     print("{} ({}) wins after {} cycles.".format(warrior.name,
                                                                   warrior.author,
                                                                   cycle))
-                    warrior.wins += 1
+                    warrior.warrior.wins += 1
                 break
 
             step = False
@@ -359,7 +359,7 @@ if __name__ == "__main__":
                         print("{} ({}) ties after {} cycles.".format(warrior.name,
                                                                     warrior.author,
                                                                     cycle))
-                        warrior.ties += 1
+                        warrior.warrior.ties += 1
                 break
         else:
             # running until max cycles: tie
@@ -368,7 +368,7 @@ if __name__ == "__main__":
                     print("{} ({}) ties after {} cycles.".format(warrior.name,
                                                                   warrior.author,
                                                                   cycle))
-                    warrior.ties += 1
+                    warrior.warrior.ties += 1
 
         if stop_rounds:
             break
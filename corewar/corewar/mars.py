@@ -1,6 +1,7 @@
 #! /usr/bin/env python
 # coding: utf-8
 
+from collections import deque
 from copy import copy
 import operator
 from random import randint
@@ -8,7 +9,7 @@ from random import randint
 from .core import Core, DEFAULT_INITIAL_INSTRUCTION
 from .redcode import *
 
-__all__ = ['MARS', 'EVENT_EXECUTED', 'EVENT_I_WRITE', 'EVENT_I_READ',
+__all__ = ['MARS', 'WarriorState', 'EVENT_EXECUTED', 'EVENT_I_WRITE', 'EVENT_I_READ',
            'EVENT_A_DEC', 'EVENT_A_INC', 'EVENT_B_DEC', 'EVENT_B_INC',
            'EVENT_A_READ', 'EVENT_A_WRITE', 'EVENT_B_READ', 'EVENT_B_WRITE',
            'EVENT_A_ARITH', 'EVENT_B_ARITH']
@@ -28,16 +29,61 @@ EVENT_B_WRITE  = 10
 EVENT_A_ARITH  = 11
 EVENT_B_ARITH  = 12
 
+class WarriorState(object):
+    """The state of one warrior in one simulation: its task queue and, for
+       MARS subclasses that track it, its memory coverage.
+
+       Simulations keep their own states, so a Warrior is never written to and
+       may be shared by several simulations, or appear twice in the same one.
+       Other attributes (name, instructions, ...) are read from the warrior.
+    """
+
+    __slots__ = ('warrior', 'task_queue', 'coverage')
+
+    def __init__(self, warrior, task_queue, coverage=None):
+        self.warrior = warrior
+        self.task_queue = task_queue
+        self.coverage = coverage
+
+    def __getattr__(self, name):
+        if name == 'warrior':
+            raise AttributeError(name)
+        return getattr(self.warrior, name)
+
+    def __iter__(self):
+        return iter(self.warrior)
+
+    def __len__(self):
+        return len(self.warrior)
+
+    def __repr__(self):
+        return "<WarriorState %r %d processes>" % (self.warrior, len(self.task_queue))
+
 class MARS(object):
     """The MARS. Encapsulates a simulation.
+
+       Core events are only fired when an observer is registered, that is,
+       when a subclass overrides core_event (e.g. the pygame PygameMARS).
+       Otherwise the simulation runs headless.
+
+       The state of each loaded warrior is kept in `states`, in the order of
+       `warriors`. Core events and enqueue() receive these states.
     """
 
+    # whether core_event is called; set automatically for subclasses
+    observed = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.observed = cls.core_event is not MARS.core_event
+
     def __init__(self, core=None, warriors=None, minimum_separation=100,
                  randomize=True, max_processes=None):
         self.core = core if core else Core()
         self.minimum_separation = minimum_separation
         self.max_processes = max_processes if max_processes else len(self.core)
         self.warriors = warriors if warriors else []
+        self.states = []
         if self.warriors:
             self.load_warriors(randomize)
 
@@ -45,13 +91,7 @@ class MARS(object):
         """Supposed to be implemented by subclasses to handle core
            events.
         """
-        i = self.core[address]
-        assert isinstance(i.a_number, int), f"Expected int but got {type(i.a_number)}"
-        assert isinstance(i.b_number, int), f"Expected int but got {type(i.b_number)}"
-        i.a_number = min(max(i.a_number, -999999999), 999999999)
-        i.b_number = min(max(i.b_number, -999999999), 999999999)
-        assert i.a_number < 1000000000 and i.a_number > -1000000000, f"a_number out of bounds"
-        assert i.b_number < 1000000000 and i.b_number > -1000000000, f"b_number out of bounds"
+        pass
 
     def reset(self, clear_instruction=DEFAULT_INITIAL_INSTRUCTION):
         "Clears core and re-loads warriors."
@@ -64,6 +104,7 @@ class MARS(object):
         # the space between warriors - equally spaced in the core
         space = len(self.core) // len(self.warriors)
 
+        self.states = []
         for n, warrior in enumerate(self.warriors):
             # position is in the nth equally separated space plus a random
             # shift up to where the last instruction is minimum separated from
@@ -75,13 +116,23 @@ class MARS(object):
                                                       len(warrior) -
                                                       self.minimum_separation))
 
-            # add first and unique warrior task
-            warrior.task_queue = [self.core.trim(warrior_position + warrior.start)]
+            # add first and unique warrior task. The queue is a deque, so both
+            # ends are O(1) even with max_processes tasks queued
+            state = WarriorState(warrior, deque([self.core.trim(warrior_position + warrior.start)]))
+            self.states.append(state)
 
             # copy warrior's instructions to the core
             for i, instruction in enumerate(warrior.instructions):
-                self.core[warrior_position + i] = copy(instruction)
-                self.core_event(warrior, warrior_position + i, EVENT_I_WRITE)
+                self.core[warrior_position + i] = self.load_instruction(instruction)
+                if self.observed:
+                    self.core_event(state, warrior_position + i, EVENT_I_WRITE)
+
+    def load_instruction(self, instruction):
+        """The copy of a warrior's instruction written to the core when it is
+           loaded: binded to the core, so every field written is trimmed to
+           the core bounds.
+        """
+        return instruction.core_binded(self.core)
 
     def enqueue(self, warrior, address):
         """Enqueue another process into the warrior's task queue. Only if it's
@@ -102,11 +153,12 @@ class MARS(object):
     def step(self):
         """Run one simulation step: execute one task of every active warrior.
         """
-        for warrior in self.warriors:
+        observed = self.observed
+        for warrior in self.states: # the WarriorState of each warrior
             if warrior.task_queue:
                 # The process counter is the next instruction-address in the
                 # warrior's task queue
-                pc = warrior.task_queue.pop(0)
+                pc = warrior.task_queue.popleft()
 
                 # copy the current instruction to the instruction register
                 ir = copy(self.core[pc])
@@ -131,10 +183,12 @@ class MARS(object):
                         # pre-decrement, if needed
                         if ir.a_mode == PREDEC_A:
                             self.core[pc + wpa].a_number -= 1
-                            self.core_event(warrior, pc + wpa, EVENT_A_DEC)
+                            if observed:
+                                self.core_event(warrior, pc + wpa, EVENT_A_DEC)
                         elif ir.a_mode == PREDEC_B:
                             self.core[pc + wpa].b_number -= 1
-                            self.core_event(warrior, pc + wpa, EVENT_B_DEC)
+                            if observed:
+                                self.core_event(warrior, pc + wpa, EVENT_B_DEC)
 
                         # calculate the indirect address, from A or B number
                         if ir.a_mode in (PREDEC_A, INDIRECT_A, POSTINC_A):
@@ -150,10 +204,12 @@ class MARS(object):
                 # post-increment, if needed
                 if ir.a_mode == POSTINC_A:
                     self.core[pip].a_number += 1
-                    self.core_event(warrior, pip, EVENT_A_INC)
+                    if observed:
+                        self.core_event(warrior, pip, EVENT_A_INC)
                 elif ir.a_mode == POSTINC_B:
                     self.core[pip].b_number += 1
-                    self.core_event(warrior, pip, EVENT_B_INC)
+                    if observed:
+                        self.core_event(warrior, pip, EVENT_B_INC)
 
                 # evaluate the B-operand - pretty much the same as A
                 if ir.b_mode == IMMEDIATE:
@@ -167,10 +223,12 @@ class MARS(object):
 
                         if ir.b_mode == PREDEC_A:
                             self.core[pc + wpb].a_number -= 1
-                            self.core_event(warrior, pc + wpb, EVENT_A_DEC)
+                            if observed:
+                                self.core_event(warrior, pc + wpb, EVENT_A_DEC)
                         elif ir.b_mode == PREDEC_B:
                             self.core[pc + wpb].b_number -= 1
-                            self.core_event(warrior, pc + wpb, EVENT_B_DEC)
+                            if observed:
+                                self.core_event(warrior, pc + wpb, EVENT_B_DEC)
 
                         if ir.b_mode in (PREDEC_A, INDIRECT_A, POSTINC_A):
                             rpb = self.core.trim_read(rpb + self.core[pc + rpb].a_number)
@@ -183,233 +241,326 @@ class MARS(object):
 
                 if ir.b_mode == POSTINC_A:
                     self.core[pip].a_number += 1
-                    self.core_event(warrior, pip, EVENT_A_INC)
+                    if observed:
+                        self.core_event(warrior, pip, EVENT_A_INC)
                 elif ir.b_mode == POSTINC_B:
                     self.core[pip].b_number += 1
-                    self.core_event(warrior, pip, EVENT_B_INC)
-
-                # arithmetic common code
-                def do_arithmetic(op):
-                    try:
-                        if ir.modifier == M_A:
-                            self.core[pc + wpb].a_number = op(irb.a_number, ira.a_number)
-                            self.core_event(warrior, pc + wpb, EVENT_A_WRITE)
-                            self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                            self.core_event(warrior, pc + rpb, EVENT_A_READ)
-                        elif ir.modifier == M_B:
-                            self.core[pc + wpb].b_number = op(irb.b_number, ira.b_number)
-                            self.core_event(warrior, pc + wpb, EVENT_B_WRITE)
-                            self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                            self.core_event(warrior, pc + rpb, EVENT_B_READ)
-                        elif ir.modifier == M_AB:
-                            self.core[pc + wpb].b_number = op(irb.b_number, ira.a_number)
-                            self.core_event(warrior, pc + wpb, EVENT_B_WRITE)
-                            self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                            self.core_event(warrior, pc + rpb, EVENT_B_READ)
-                        elif ir.modifier == M_BA:
-                            self.core[pc + wpb].a_number = op(irb.b_number, ira.a_number)
-                            self.core_event(warrior, pc + wpb, EVENT_A_WRITE)
-                            self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                            self.core_event(warrior, pc + rpb, EVENT_B_READ)
-                        elif ir.modifier == M_F or ir.modifier == M_I:
-                            self.core[pc + wpb].a_number = op(irb.a_number, ira.a_number)
-                            self.core[pc + wpb].b_number = op(irb.b_number, ira.b_number)
-                            self.core_event(warrior, pc + wpb, EVENT_A_WRITE)
-                            self.core_event(warrior, pc + wpb, EVENT_B_WRITE)
-                            self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                            self.core_event(warrior, pc + rpb, EVENT_A_READ)
-                            self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                            self.core_event(warrior, pc + rpb, EVENT_B_READ)
-                        elif ir.modifier == M_X:
-                            self.core[pc + wpb].b_number = op(irb.b_number, ira.a_number)
-                            self.core[pc + wpb].a_number = op(irb.a_number, ira.b_number)
-                            self.core_event(warrior, pc + wpb, EVENT_A_WRITE)
-                            self.core_event(warrior, pc + wpb, EVENT_B_WRITE)
-                            self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                            self.core_event(warrior, pc + rpb, EVENT_A_READ)
-                            self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                            self.core_event(warrior, pc + rpb, EVENT_B_READ)
-                        else:
-                            raise ValueError("Invalid modifier: %d" % ir.modifier)
-
-                        # enqueue next instruction
-                        self.enqueue(warrior, pc + 1)
-                    except ZeroDivisionError:
-                        pass
-
-                # comparison common code
-                def do_comparison(cmp):
-                    if ir.modifier == M_A:
-                        self.enqueue(warrior,
-                                     pc + (2 if cmp(ira.a_number, irb.a_number) else 1))
-                        self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                        self.core_event(warrior, pc + rpb, EVENT_A_READ)
-                    elif ir.modifier == M_B:
-                        self.enqueue(warrior,
-                                     pc + (2 if cmp(ira.b_number, irb.b_number) else 1))
-                        self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                        self.core_event(warrior, pc + rpb, EVENT_B_READ)
-                    elif ir.modifier == M_AB:
-                        self.enqueue(warrior,
-                                     pc + (2 if cmp(ira.a_number, irb.b_number) else 1))
-                        self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                        self.core_event(warrior, pc + rpb, EVENT_B_READ)
-                    elif ir.modifier == M_BA:
-                        self.enqueue(warrior,
-                                     pc + (2 if cmp(ira.b_number, irb.a_number) else 1))
-                        self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                        self.core_event(warrior, pc + rpb, EVENT_A_READ)
-                    elif ir.modifier == M_F:
-                        self.enqueue(warrior,
-                                     pc + (2 if cmp(ira.a_number, irb.a_number) and
-                                                cmp(ira.b_number, irb.b_number) else 1))
-                        self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                        self.core_event(warrior, pc + rpb, EVENT_A_READ)
-                        self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                        self.core_event(warrior, pc + rpb, EVENT_B_READ)
-                    elif ir.modifier == M_X:
-                        self.enqueue(warrior,
-                                     pc + (2 if cmp(ira.a_number, irb.b_number) and
-                                                cmp(ira.b_number, irb.a_number) else 1))
-                        self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                        self.core_event(warrior, pc + rpb, EVENT_A_READ)
-                        self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                        self.core_event(warrior, pc + rpb, EVENT_B_READ)
-                    elif ir.modifier == M_I:
-                        self.enqueue(warrior,
-                                     pc + (2 if ira == irb else 1))
-                        self.core_event(warrior, pc + rpa, EVENT_I_READ)
-                        self.core_event(warrior, pc + rpb, EVENT_I_READ)
-                    else:
-                        raise ValueError("Invalid modifier: %d" % ir.modifier)
-
-                self.core_event(warrior, pc, EVENT_EXECUTED)
-
-                if ir.opcode == DAT:
-                    # does not enqueue next instruction, therefore, killing the
-                    # process
-                    pass
-                elif ir.opcode == MOV:
-                    if ir.modifier == M_A:
-                        self.core[pc + wpb].a_number = ira.a_number
-                        self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                        self.core_event(warrior, pc + wpb, EVENT_A_WRITE)
-                    elif ir.modifier == M_B:
-                        self.core[pc + wpb].b_number = ira.b_number
-                        self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                        self.core_event(warrior, pc + wpb, EVENT_B_WRITE)
-                    elif ir.modifier == M_AB:
-                        self.core[pc + wpb].b_number = ira.a_number
-                        self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                        self.core_event(warrior, pc + wpb, EVENT_B_WRITE)
-                    elif ir.modifier == M_BA:
-                        self.core[pc + wpb].a_number = ira.b_number
-                        self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                        self.core_event(warrior, pc + wpb, EVENT_A_WRITE)
-                    elif ir.modifier == M_F:
-                        self.core[pc + wpb].a_number = ira.a_number
-                        self.core[pc + wpb].b_number = ira.b_number
-                        self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                        self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                        self.core_event(warrior, pc + wpb, EVENT_A_WRITE)
-                        self.core_event(warrior, pc + wpb, EVENT_B_WRITE)
-                    elif ir.modifier == M_X:
-                        self.core[pc + wpb].b_number = ira.a_number
-                        self.core[pc + wpb].a_number = ira.b_number
-                        self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                        self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                        self.core_event(warrior, pc + wpb, EVENT_A_WRITE)
-                        self.core_event(warrior, pc + wpb, EVENT_B_WRITE)
-                    elif ir.modifier == M_I:
-                        self.core[pc + wpb] = ira
-                        self.core_event(warrior, pc + rpa, EVENT_I_READ)
-                        self.core_event(warrior, pc + wpb, EVENT_I_WRITE)
-                    else:
-                        raise ValueError("Invalid modifier: %d" % ir.modifier)
-
-                    # enqueue next instruction
-                    self.enqueue(warrior, pc + 1)
-                elif ir.opcode == ADD:
-                    do_arithmetic(operator.add)
-                elif ir.opcode == SUB:
-                    do_arithmetic(operator.sub)
-                elif ir.opcode == MUL:
-                    do_arithmetic(operator.mul)
-                elif ir.opcode == DIV:
-                    do_arithmetic(operator.floordiv)
-                elif ir.opcode == MOD:
-                    do_arithmetic(operator.mod)
-                elif ir.opcode == JMP:
-                    self.enqueue(warrior, pc + rpa)
-                elif ir.opcode == JMZ:
-                    if ir.modifier == M_A or ir.modifier == M_BA:
-                        self.enqueue(warrior, pc + (rpa if irb.a_number == 0 else 1))
-                        self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                    elif ir.modifier == M_B or ir.modifier == M_AB:
-                        self.enqueue(warrior, pc + (rpa if irb.b_number == 0 else 1))
-                        self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                    elif ir.modifier in (M_F, M_X, M_I):
-                        self.enqueue(warrior,
-                                     pc + (rpa if irb.a_number == irb.b_number == 0 else 1))
-                        self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                        self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                    else:
-                        raise ValueError("Invalid modifier: %d" % ir.modifier)
-                elif ir.opcode == JMN:
-                    if ir.modifier == M_A or ir.modifier == M_BA:
-                        self.enqueue(warrior, pc + (rpa if irb.a_number != 0 else 1))
-                        self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                    elif ir.modifier == M_B or ir.modifier == M_AB:
-                        self.enqueue(warrior, pc + (rpa if irb.b_number != 0 else 1))
-                        self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                    elif ir.modifier in (M_F, M_X, M_I):
-                        self.enqueue(warrior,
-                                     pc + (rpa if irb.a_number != 0 or
-                                                  irb.b_number != 0 else 1))
-                        self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                        self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                    else:
-                        raise ValueError("Invalid modifier: %d" % ir.modifier)
-                elif ir.opcode == DJN:
-                    if ir.modifier == M_A or ir.modifier == M_BA:
-                        self.core[pc + wpb].a_number -= 1
-                        irb.a_number -= 1
-                        self.enqueue(warrior, pc + (rpa if irb.a_number != 0 else 1))
-                        self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                        self.core_event(warrior, pc + rpa, EVENT_A_DEC)
-                    elif ir.modifier == M_B or ir.modifier == M_AB:
-                        self.core[pc + wpb].b_number -= 1
-                        irb.b_number -= 1
-                        self.enqueue(warrior, pc + (rpa if irb.b_number != 0 else 1))
-                        self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                        self.core_event(warrior, pc + rpa, EVENT_B_DEC)
-                    elif ir.modifier in (M_F, M_X, M_I):
-                        self.core[pc + wpb].a_number -= 1
-                        irb.a_number -= 1
-                        self.core[pc + wpb].b_number -= 1
-                        irb.b_number -= 1
-                        self.enqueue(warrior,
-                                     pc + (rpa if irb.a_number != 0 or
-                                                  irb.b_number != 0 else 1))
-                        self.core_event(warrior, pc + rpa, EVENT_A_READ)
-                        self.core_event(warrior, pc + rpa, EVENT_B_READ)
-                        self.core_event(warrior, pc + rpa, EVENT_A_DEC)
-                        self.core_event(warrior, pc + rpa, EVENT_B_DEC)
-                    else:
-                        raise ValueError("Invalid modifier: %d" % ir.modifier)
-                elif ir.opcode == SPL:
-                    self.enqueue(warrior, pc + 1)
-                    self.enqueue(warrior, pc + rpa)
-                elif ir.opcode == SLT:
-                    do_comparison(operator.lt)
-                elif ir.opcode == CMP or ir.opcode == SEQ:
-                    do_comparison(operator.eq)
-                elif ir.opcode == SNE:
-                    do_comparison(operator.ne)
-                elif ir.opcode == NOP:
-                    self.enqueue(warrior, pc + 1)
-                else:
-                    raise ValueError("Invalid opcode: %d" % ir.opcode)
+                    if observed:
+                        self.core_event(warrior, pip, EVENT_B_INC)
+
+                if observed:
+                    self.core_event(warrior, pc, EVENT_EXECUTED)
+
+                try:
+                    handler = DISPATCH[ir.opcode][ir.modifier]
+                except IndexError:
+                    raise ValueError("Invalid instruction: %s" % ir)
+                handler(self, warrior, pc, ira, irb, rpa, rpb, wpb)
+
+# Instruction handlers. Each (opcode, modifier) pair is decoded once, at import
+# time, into a specialized function in DISPATCH, so MARS.step does a single
+# table lookup per executed instruction. All handlers take the MARS, the
+# warrior, the process counter, the A and B instruction registers and the
+# resolved read/write pointers.
+
+def _dat(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    # does not enqueue next instruction, therefore, killing the process
+    pass
+
+def _mov_a(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    mars.core[pc + wpb].a_number = ira.a_number
+    if mars.observed:
+        mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+        mars.core_event(warrior, pc + wpb, EVENT_A_WRITE)
+    mars.enqueue(warrior, pc + 1)
+
+def _mov_b(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    mars.core[pc + wpb].b_number = ira.b_number
+    if mars.observed:
+        mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+        mars.core_event(warrior, pc + wpb, EVENT_B_WRITE)
+    mars.enqueue(warrior, pc + 1)
+
+def _mov_ab(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    mars.core[pc + wpb].b_number = ira.a_number
+    if mars.observed:
+        mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+        mars.core_event(warrior, pc + wpb, EVENT_B_WRITE)
+    mars.enqueue(warrior, pc + 1)
+
+def _mov_ba(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    mars.core[pc + wpb].a_number = ira.b_number
+    if mars.observed:
+        mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+        mars.core_event(warrior, pc + wpb, EVENT_A_WRITE)
+    mars.enqueue(warrior, pc + 1)
+
+def _mov_f(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    target = mars.core[pc + wpb]
+    target.a_number = ira.a_number
+    target.b_number = ira.b_number
+    if mars.observed:
+        mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+        mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+        mars.core_event(warrior, pc + wpb, EVENT_A_WRITE)
+        mars.core_event(warrior, pc + wpb, EVENT_B_WRITE)
+    mars.enqueue(warrior, pc + 1)
+
+def _mov_x(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    target = mars.core[pc + wpb]
+    target.b_number = ira.a_number
+    target.a_number = ira.b_number
+    if mars.observed:
+        mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+        mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+        mars.core_event(warrior, pc + wpb, EVENT_A_WRITE)
+        mars.core_event(warrior, pc + wpb, EVENT_B_WRITE)
+    mars.enqueue(warrior, pc + 1)
+
+def _mov_i(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    mars.core[pc + wpb] = ira
+    if mars.observed:
+        mars.core_event(warrior, pc + rpa, EVENT_I_READ)
+        mars.core_event(warrior, pc + wpb, EVENT_I_WRITE)
+    mars.enqueue(warrior, pc + 1)
+
+def _arithmetic(op):
+    "Build the modifier handlers of an arithmetic opcode."
+
+    def do_a(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+        try:
+            mars.core[pc + wpb].a_number = op(irb.a_number, ira.a_number)
+        except ZeroDivisionError:
+            return
+        if mars.observed:
+            mars.core_event(warrior, pc + wpb, EVENT_A_WRITE)
+            mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_A_READ)
+        mars.enqueue(warrior, pc + 1)
+
+    def do_b(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+        try:
+            mars.core[pc + wpb].b_number = op(irb.b_number, ira.b_number)
+        except ZeroDivisionError:
+            return
+        if mars.observed:
+            mars.core_event(warrior, pc + wpb, EVENT_B_WRITE)
+            mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_B_READ)
+        mars.enqueue(warrior, pc + 1)
+
+    def do_ab(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+        try:
+            mars.core[pc + wpb].b_number = op(irb.b_number, ira.a_number)
+        except ZeroDivisionError:
+            return
+        if mars.observed:
+            mars.core_event(warrior, pc + wpb, EVENT_B_WRITE)
+            mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_B_READ)
+        mars.enqueue(warrior, pc + 1)
+
+    def do_ba(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+        try:
+            mars.core[pc + wpb].a_number = op(irb.b_number, ira.a_number)
+        except ZeroDivisionError:
+            return
+        if mars.observed:
+            mars.core_event(warrior, pc + wpb, EVENT_A_WRITE)
+            mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_B_READ)
+        mars.enqueue(warrior, pc + 1)
+
+    def do_f(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+        target = mars.core[pc + wpb]
+        try:
+            target.a_number = op(irb.a_number, ira.a_number)
+            target.b_number = op(irb.b_number, ira.b_number)
+        except ZeroDivisionError:
+            return
+        if mars.observed:
+            mars.core_event(warrior, pc + wpb, EVENT_A_WRITE)
+            mars.core_event(warrior, pc + wpb, EVENT_B_WRITE)
+            mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_A_READ)
+            mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_B_READ)
+        mars.enqueue(warrior, pc + 1)
+
+    def do_x(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+        target = mars.core[pc + wpb]
+        try:
+            target.b_number = op(irb.b_number, ira.a_number)
+            target.a_number = op(irb.a_number, ira.b_number)
+        except ZeroDivisionError:
+            return
+        if mars.observed:
+            mars.core_event(warrior, pc + wpb, EVENT_A_WRITE)
+            mars.core_event(warrior, pc + wpb, EVENT_B_WRITE)
+            mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_A_READ)
+            mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_B_READ)
+        mars.enqueue(warrior, pc + 1)
+
+    return {M_A: do_a, M_B: do_b, M_AB: do_ab, M_BA: do_ba,
+            M_F: do_f, M_X: do_x, M_I: do_f}
+
+def _comparison(cmp):
+    "Build the modifier handlers of a skip opcode."
+
+    def do_a(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+        mars.enqueue(warrior, pc + (2 if cmp(ira.a_number, irb.a_number) else 1))
+        if mars.observed:
+            mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_A_READ)
+
+    def do_b(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+        mars.enqueue(warrior, pc + (2 if cmp(ira.b_number, irb.b_number) else 1))
+        if mars.observed:
+            mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_B_READ)
+
+    def do_ab(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+        mars.enqueue(warrior, pc + (2 if cmp(ira.a_number, irb.b_number) else 1))
+        if mars.observed:
+            mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_B_READ)
+
+    def do_ba(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+        mars.enqueue(warrior, pc + (2 if cmp(ira.b_number, irb.a_number) else 1))
+        if mars.observed:
+            mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_A_READ)
+
+    def do_f(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+        mars.enqueue(warrior, pc + (2 if cmp(ira.a_number, irb.a_number) and
+                                         cmp(ira.b_number, irb.b_number) else 1))
+        if mars.observed:
+            mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_A_READ)
+            mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_B_READ)
+
+    def do_x(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+        mars.enqueue(warrior, pc + (2 if cmp(ira.a_number, irb.b_number) and
+                                         cmp(ira.b_number, irb.a_number) else 1))
+        if mars.observed:
+            mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_A_READ)
+            mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_B_READ)
+
+    def do_i(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+        mars.enqueue(warrior, pc + (2 if ira == irb else 1))
+        if mars.observed:
+            mars.core_event(warrior, pc + rpa, EVENT_I_READ)
+            mars.core_event(warrior, pc + rpb, EVENT_I_READ)
+
+    return {M_A: do_a, M_B: do_b, M_AB: do_ab, M_BA: do_ba,
+            M_F: do_f, M_X: do_x, M_I: do_i}
+
+def _jmp(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    mars.enqueue(warrior, pc + rpa)
+
+def _jmz_a(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    mars.enqueue(warrior, pc + (rpa if irb.a_number == 0 else 1))
+    if mars.observed:
+        mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+
+def _jmz_b(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    mars.enqueue(warrior, pc + (rpa if irb.b_number == 0 else 1))
+    if mars.observed:
+        mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+
+def _jmz_f(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    mars.enqueue(warrior, pc + (rpa if irb.a_number == irb.b_number == 0 else 1))
+    if mars.observed:
+        mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+        mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+
+def _jmn_a(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    mars.enqueue(warrior, pc + (rpa if irb.a_number != 0 else 1))
+    if mars.observed:
+        mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+
+def _jmn_b(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    mars.enqueue(warrior, pc + (rpa if irb.b_number != 0 else 1))
+    if mars.observed:
+        mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+
+def _jmn_f(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    mars.enqueue(warrior, pc + (rpa if irb.a_number != 0 or irb.b_number != 0 else 1))
+    if mars.observed:
+        mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+        mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+
+def _djn_a(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    mars.core[pc + wpb].a_number -= 1
+    irb.a_number -= 1
+    mars.enqueue(warrior, pc + (rpa if irb.a_number != 0 else 1))
+    if mars.observed:
+        mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+        mars.core_event(warrior, pc + rpa, EVENT_A_DEC)
+
+def _djn_b(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    mars.core[pc + wpb].b_number -= 1
+    irb.b_number -= 1
+    mars.enqueue(warrior, pc + (rpa if irb.b_number != 0 else 1))
+    if mars.observed:
+        mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+        mars.core_event(warrior, pc + rpa, EVENT_B_DEC)
+
+def _djn_f(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    target = mars.core[pc + wpb]
+    target.a_number -= 1
+    irb.a_number -= 1
+    target.b_number -= 1
+    irb.b_number -= 1
+    mars.enqueue(warrior, pc + (rpa if irb.a_number != 0 or irb.b_number != 0 else 1))
+    if mars.observed:
+        mars.core_event(warrior, pc + rpa, EVENT_A_READ)
+        mars.core_event(warrior, pc + rpa, EVENT_B_READ)
+        mars.core_event(warrior, pc + rpa, EVENT_A_DEC)
+        mars.core_event(warrior, pc + rpa, EVENT_B_DEC)
+
+def _spl(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    mars.enqueue(warrior, pc + 1)
+    mars.enqueue(warrior, pc + rpa)
+
+def _nop(mars, warrior, pc, ira, irb, rpa, rpb, wpb):
+    mars.enqueue(warrior, pc + 1)
+
+def _same(handler):
+    return dict.fromkeys((M_A, M_B, M_AB, M_BA, M_F, M_X, M_I), handler)
+
+def _by_field(a, b, f):
+    return {M_A: a, M_BA: a, M_B: b, M_AB: b, M_F: f, M_X: f, M_I: f}
+
+_HANDLERS = {
+    DAT: _same(_dat),
+    MOV: {M_A: _mov_a, M_B: _mov_b, M_AB: _mov_ab, M_BA: _mov_ba,
+          M_F: _mov_f, M_X: _mov_x, M_I: _mov_i},
+    ADD: _arithmetic(operator.add),
+    SUB: _arithmetic(operator.sub),
+    MUL: _arithmetic(operator.mul),
+    DIV: _arithmetic(operator.floordiv),
+    MOD: _arithmetic(operator.mod),
+    JMP: _same(_jmp),
+    JMZ: _by_field(_jmz_a, _jmz_b, _jmz_f),
+    JMN: _by_field(_jmn_a, _jmn_b, _jmn_f),
+    DJN: _by_field(_djn_a, _djn_b, _djn_f),
+    SPL: _same(_spl),
+    SLT: _comparison(operator.lt),
+    CMP: _comparison(operator.eq),
+    SEQ: _comparison(operator.eq),
+    SNE: _comparison(operator.ne),
+    NOP: _same(_nop),
+}
+
+# DISPATCH[opcode][modifier] -> handler
+DISPATCH = tuple(tuple(_HANDLERS[opcode][modifier] for modifier in range(M_A, M_I + 1))
+                 for opcode in range(DAT, NOP + 1))
 
 if __name__ == "__main__":
     import argparse
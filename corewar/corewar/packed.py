@@ -0,0 +1,308 @@
+# coding: utf-8
+
+import operator
+
+from .core import PackedCore
+from .mars import MARS
+from .redcode import *
+
+__all__ = ['PackedMARS', 'PACKED_DISPATCH']
+
+A_FIELD = NUMBER_MASK << A_NUMBER_SHIFT
+B_FIELD = NUMBER_MASK << B_NUMBER_SHIFT
+
+class PackedMARS(MARS):
+    """A headless MARS executing directly on the packed instructions of a
+       PackedCore.
+
+       The instruction registers are plain ints, so copying them is free and
+       .I comparisons are one int comparison. Without read and write limits
+       the read and write pointers of an operand are the same, so each
+       operand resolves to a single pointer. It follows the semantics of the
+       MARS over an ArrayCore exactly, but never fires core events.
+    """
+
+    def __init__(self, core=None, warriors=None, minimum_separation=100,
+                 randomize=True, max_processes=None):
+        core = core if core else PackedCore()
+        if not isinstance(core, PackedCore):
+            raise TypeError("PackedMARS runs on a PackedCore, not %r" % core)
+        super(PackedMARS, self).__init__(core, warriors, minimum_separation,
+                                         randomize, max_processes)
+
+    def step(self):
+        """Run one simulation step: execute one task of every active warrior.
+        """
+        cells = self.core.cells
+        size = self.core.size
+        for warrior in self.states:
+            task_queue = warrior.task_queue
+            if not task_queue:
+                continue
+            pc = task_queue.popleft()
+            ir = cells[pc]
+
+            # evaluate the A-operand
+            mode = (ir >> A_MODE_SHIFT) & 7
+            if mode == IMMEDIATE:
+                pa = 0
+            else:
+                pa = (ir >> A_NUMBER_SHIFT) & NUMBER_MASK
+                if mode != DIRECT:
+                    pip = (pc + pa) % size
+                    if mode == PREDEC_A:
+                        cell = cells[pip]
+                        cells[pip] = (cell & ~A_FIELD) | (((((cell >> A_NUMBER_SHIFT) & NUMBER_MASK) - 1) % size) << A_NUMBER_SHIFT)
+                    elif mode == PREDEC_B:
+                        cell = cells[pip]
+                        cells[pip] = (cell & ~B_FIELD) | ((((cell & NUMBER_MASK) - 1) % size) << B_NUMBER_SHIFT)
+                    if mode >= INDIRECT_A:
+                        pa = (pa + ((cells[pip] >> A_NUMBER_SHIFT) & NUMBER_MASK)) % size
+                    else:
+                        pa = (pa + (cells[pip] & NUMBER_MASK)) % size
+            ira = cells[(pc + pa) % size]
+            if mode == POSTINC_A:
+                cell = cells[pip]
+                cells[pip] = (cell & ~A_FIELD) | (((((cell >> A_NUMBER_SHIFT) & NUMBER_MASK) + 1) % size) << A_NUMBER_SHIFT)
+            elif mode == POSTINC_B:
+                cell = cells[pip]
+                cells[pip] = (cell & ~B_FIELD) | ((((cell & NUMBER_MASK) + 1) % size) << B_NUMBER_SHIFT)
+
+            # evaluate the B-operand - pretty much the same as A
+            mode = (ir >> B_MODE_SHIFT) & 7
+            if mode == IMMEDIATE:
+                pb = 0
+            else:
+                pb = ir & NUMBER_MASK
+                if mode != DIRECT:
+                    pip = (pc + pb) % size
+                    if mode == PREDEC_A:
+                        cell = cells[pip]
+                        cells[pip] = (cell & ~A_FIELD) | (((((cell >> A_NUMBER_SHIFT) & NUMBER_MASK) - 1) % size) << A_NUMBER_SHIFT)
+                    elif mode == PREDEC_B:
+                        cell = cells[pip]
+                        cells[pip] = (cell & ~B_FIELD) | ((((cell & NUMBER_MASK) - 1) % size) << B_NUMBER_SHIFT)
+                    if mode >= INDIRECT_A:
+                        pb = (pb + ((cells[pip] >> A_NUMBER_SHIFT) & NUMBER_MASK)) % size
+                    else:
+                        pb = (pb + (cells[pip] & NUMBER_MASK)) % size
+            irb = cells[(pc + pb) % size]
+            if mode == POSTINC_A:
+                cell = cells[pip]
+                cells[pip] = (cell & ~A_FIELD) | (((((cell >> A_NUMBER_SHIFT) & NUMBER_MASK) + 1) % size) << A_NUMBER_SHIFT)
+            elif mode == POSTINC_B:
+                cell = cells[pip]
+                cells[pip] = (cell & ~B_FIELD) | ((((cell & NUMBER_MASK) + 1) % size) << B_NUMBER_SHIFT)
+
+            handler = PACKED_DISPATCH[ir >> MODIFIER_SHIFT]
+            if handler is None:
+                raise ValueError("Invalid instruction: %s" % Instruction.unpack(ir))
+            handler(self, warrior, pc, ira, irb, pa, pb, cells, size)
+
+# Instruction handlers, as in mars.py, over packed ints. They take the MARS,
+# the warrior, the process counter, the A and B instruction registers, the
+# resolved A and B pointers, and the cells and size of the core.
+
+def _a(instruction):
+    return (instruction >> A_NUMBER_SHIFT) & NUMBER_MASK
+
+def _b(instruction):
+    return instruction & NUMBER_MASK
+
+def _set_a(cells, address, number, size):
+    cells[address] = (cells[address] & ~A_FIELD) | ((number % size) << A_NUMBER_SHIFT)
+
+def _set_b(cells, address, number, size):
+    cells[address] = (cells[address] & ~B_FIELD) | ((number % size) << B_NUMBER_SHIFT)
+
+def _dat(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    # does not enqueue next instruction, therefore, killing the process
+    pass
+
+def _mov_a(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    _set_a(cells, (pc + pb) % size, _a(ira), size)
+    mars.enqueue(warrior, pc + 1)
+
+def _mov_b(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    _set_b(cells, (pc + pb) % size, _b(ira), size)
+    mars.enqueue(warrior, pc + 1)
+
+def _mov_ab(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    _set_b(cells, (pc + pb) % size, _a(ira), size)
+    mars.enqueue(warrior, pc + 1)
+
+def _mov_ba(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    _set_a(cells, (pc + pb) % size, _b(ira), size)
+    mars.enqueue(warrior, pc + 1)
+
+def _mov_f(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    target = (pc + pb) % size
+    cells[target] = (cells[target] & ~(A_FIELD | B_FIELD)) | (ira & (A_FIELD | B_FIELD))
+    mars.enqueue(warrior, pc + 1)
+
+def _mov_x(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    target = (pc + pb) % size
+    cells[target] = ((cells[target] & ~(A_FIELD | B_FIELD)) |
+                     (_b(ira) << A_NUMBER_SHIFT) | (_a(ira) << B_NUMBER_SHIFT))
+    mars.enqueue(warrior, pc + 1)
+
+def _mov_i(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    cells[(pc + pb) % size] = ira
+    mars.enqueue(warrior, pc + 1)
+
+def _arithmetic(op):
+    "Build the modifier handlers of an arithmetic opcode."
+
+    def do_a(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+        try:
+            _set_a(cells, (pc + pb) % size, op(_a(irb), _a(ira)), size)
+        except ZeroDivisionError:
+            return
+        mars.enqueue(warrior, pc + 1)
+
+    def do_b(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+        try:
+            _set_b(cells, (pc + pb) % size, op(_b(irb), _b(ira)), size)
+        except ZeroDivisionError:
+            return
+        mars.enqueue(warrior, pc + 1)
+
+    def do_ab(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+        try:
+            _set_b(cells, (pc + pb) % size, op(_b(irb), _a(ira)), size)
+        except ZeroDivisionError:
+            return
+        mars.enqueue(warrior, pc + 1)
+
+    def do_ba(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+        try:
+            _set_a(cells, (pc + pb) % size, op(_b(irb), _a(ira)), size)
+        except ZeroDivisionError:
+            return
+        mars.enqueue(warrior, pc + 1)
+
+    def do_f(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+        target = (pc + pb) % size
+        try:
+            _set_a(cells, target, op(_a(irb), _a(ira)), size)
+            _set_b(cells, target, op(_b(irb), _b(ira)), size)
+        except ZeroDivisionError:
+            return
+        mars.enqueue(warrior, pc + 1)
+
+    def do_x(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+        target = (pc + pb) % size
+        try:
+            _set_b(cells, target, op(_b(irb), _a(ira)), size)
+            _set_a(cells, target, op(_a(irb), _b(ira)), size)
+        except ZeroDivisionError:
+            return
+        mars.enqueue(warrior, pc + 1)
+
+    return {M_A: do_a, M_B: do_b, M_AB: do_ab, M_BA: do_ba,
+            M_F: do_f, M_X: do_x, M_I: do_f}
+
+def _comparison(cmp):
+    "Build the modifier handlers of a skip opcode."
+
+    def do_a(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+        mars.enqueue(warrior, pc + (2 if cmp(_a(ira), _a(irb)) else 1))
+
+    def do_b(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+        mars.enqueue(warrior, pc + (2 if cmp(_b(ira), _b(irb)) else 1))
+
+    def do_ab(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+        mars.enqueue(warrior, pc + (2 if cmp(_a(ira), _b(irb)) else 1))
+
+    def do_ba(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+        mars.enqueue(warrior, pc + (2 if cmp(_b(ira), _a(irb)) else 1))
+
+    def do_f(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+        mars.enqueue(warrior, pc + (2 if cmp(_a(ira), _a(irb)) and
+                                         cmp(_b(ira), _b(irb)) else 1))
+
+    def do_x(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+        mars.enqueue(warrior, pc + (2 if cmp(_a(ira), _b(irb)) and
+                                         cmp(_b(ira), _a(irb)) else 1))
+
+    def do_i(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+        mars.enqueue(warrior, pc + (2 if ira == irb else 1))
+
+    return {M_A: do_a, M_B: do_b, M_AB: do_ab, M_BA: do_ba,
+            M_F: do_f, M_X: do_x, M_I: do_i}
+
+def _jmp(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    mars.enqueue(warrior, pc + pa)
+
+def _jmz_a(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    mars.enqueue(warrior, pc + (pa if _a(irb) == 0 else 1))
+
+def _jmz_b(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    mars.enqueue(warrior, pc + (pa if _b(irb) == 0 else 1))
+
+def _jmz_f(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    mars.enqueue(warrior, pc + (pa if _a(irb) == _b(irb) == 0 else 1))
+
+def _jmn_a(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    mars.enqueue(warrior, pc + (pa if _a(irb) != 0 else 1))
+
+def _jmn_b(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    mars.enqueue(warrior, pc + (pa if _b(irb) != 0 else 1))
+
+def _jmn_f(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    mars.enqueue(warrior, pc + (pa if _a(irb) != 0 or _b(irb) != 0 else 1))
+
+def _djn_a(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    target = (pc + pb) % size
+    _set_a(cells, target, _a(cells[target]) - 1, size)
+    mars.enqueue(warrior, pc + (pa if _a(irb) != 1 else 1))
+
+def _djn_b(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    target = (pc + pb) % size
+    _set_b(cells, target, _b(cells[target]) - 1, size)
+    mars.enqueue(warrior, pc + (pa if _b(irb) != 1 else 1))
+
+def _djn_f(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    target = (pc + pb) % size
+    _set_a(cells, target, _a(cells[target]) - 1, size)
+    _set_b(cells, target, _b(cells[target]) - 1, size)
+    mars.enqueue(warrior, pc + (pa if _a(irb) != 1 or _b(irb) != 1 else 1))
+
+def _spl(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    mars.enqueue(warrior, pc + 1)
+    mars.enqueue(warrior, pc + pa)
+
+def _nop(mars, warrior, pc, ira, irb, pa, pb, cells, size):
+    mars.enqueue(warrior, pc + 1)
+
+def _same(handler):
+    return dict.fromkeys((M_A, M_B, M_AB, M_BA, M_F, M_X, M_I), handler)
+
+def _by_field(a, b, f):
+    return {M_A: a, M_BA: a, M_B: b, M_AB: b, M_F: f, M_X: f, M_I: f}
+
+_HANDLERS = {
+    DAT: _same(_dat),
+    MOV: {M_A: _mov_a, M_B: _mov_b, M_AB: _mov_ab, M_BA: _mov_ba,
+          M_F: _mov_f, M_X: _mov_x, M_I: _mov_i},
+    ADD: _arithmetic(operator.add),
+    SUB: _arithmetic(operator.sub),
+    MUL: _arithmetic(operator.mul),
+    DIV: _arithmetic(operator.floordiv),
+    MOD: _arithmetic(operator.mod),
+    JMP: _same(_jmp),
+    JMZ: _by_field(_jmz_a, _jmz_b, _jmz_f),
+    JMN: _by_field(_jmn_a, _jmn_b, _jmn_f),
+    DJN: _by_field(_djn_a, _djn_b, _djn_f),
+    SPL: _same(_spl),
+    SLT: _comparison(operator.lt),
+    CMP: _comparison(operator.eq),
+    SEQ: _comparison(operator.eq),
+    SNE: _comparison(operator.ne),
+    NOP: _same(_nop),
+}
+
+# PACKED_DISPATCH[instruction >> MODIFIER_SHIFT], that is [opcode << 3 | modifier]
+# -> handler, None for an invalid modifier
+PACKED_DISPATCH = tuple(_HANDLERS[opcode].get(modifier)
+                        for opcode in range(DAT, NOP + 1) for modifier in range(8))
@@ -0,0 +1,82 @@
+# coding: utf-8
+
+from copy import copy
+
+from .core import DEFAULT_INITIAL_INSTRUCTION
+from .redcode import *
+
+__all__ = ['dead_on_arrival', 'EMPTY', 'EXECUTES_DAT', 'DIVIDES_BY_ZERO']
+
+EMPTY = 'empty'                       # no instructions: starts on an empty cell
+EXECUTES_DAT = 'executes DAT'         # its first instruction is a DAT
+DIVIDES_BY_ZERO = 'divides by zero'   # its first instruction is a DIV/MOD by 0
+
+# the A-instruction fields an arithmetic modifier divides by (see
+# mars._arithmetic, the process dies if any is zero)
+DIVISORS = {M_A: ('a_number',), M_B: ('b_number',), M_AB: ('a_number',),
+            M_BA: ('a_number',), M_F: ('a_number', 'b_number'),
+            M_X: ('a_number', 'b_number'), M_I: ('a_number', 'b_number')}
+
+def dead_on_arrival(warrior, size=8000, minimum_separation=100):
+    """Whether a warrior's only process is certain to die on its first
+       step, without simulating it. Returns the reason (EMPTY, EXECUTES_DAT
+       or DIVIDES_BY_ZERO), or None if it may survive or it cannot be known.
+
+       The first warrior loaded in a MARS executes its first instruction
+       before any other warrior runs, so the core around it is exactly its
+       own code surrounded by minimum_separation empty cells on each side
+       (the MARS keeps warriors that far apart as long as they fit in their
+       share of the core). Whatever the instruction at its start reads
+       outside of this region is unknown, and so is its outcome. A warrior
+       dead on arrival scores nothing, spawns nothing and covers no cell.
+    """
+    n = len(warrior.instructions)
+    changed = {} # cells written by pre-decrements, by address
+
+    def cell(address):
+        address %= size
+        if address in changed:
+            return changed[address]
+        if address < n:
+            return warrior.instructions[address]
+        if address < n + minimum_separation or address >= size - minimum_separation:
+            return DEFAULT_INITIAL_INSTRUCTION
+        return None
+
+    pc = warrior.start % size
+    ir = cell(pc)
+    if ir is None:
+        return None
+    if ir.opcode == DAT:
+        return EMPTY if n == 0 else EXECUTES_DAT
+    if ir.opcode not in (DIV, MOD):
+        return None
+
+    # evaluate the A-operand as MARS.step does, up to the A-instruction register
+    if ir.a_mode == IMMEDIATE:
+        pa = 0
+    else:
+        pa = ir.a_number
+        if ir.a_mode != DIRECT:
+            pip = pc + pa
+            target = cell(pip)
+            if target is None:
+                return None
+            if ir.a_mode in (PREDEC_A, PREDEC_B):
+                target = copy(target)
+                if ir.a_mode == PREDEC_A:
+                    target.a_number = (target.a_number - 1) % size
+                else:
+                    target.b_number = (target.b_number - 1) % size
+                changed[pip % size] = target
+            if ir.a_mode in (PREDEC_A, INDIRECT_A, POSTINC_A):
+                pa += target.a_number
+            else:
+                pa += target.b_number
+    ira = cell(pc + pa)
+    if ira is None:
+        return None
+
+    if any(getattr(ira, field) % size == 0 for field in DIVISORS[ir.modifier]):
+        return DIVIDES_BY_ZERO
+    return None
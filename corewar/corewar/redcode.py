@@ -3,11 +3,15 @@
 from copy import copy
 import re
 
+from .expression import compile_expression
+
 __all__ = ['parse', 'DAT', 'MOV', 'ADD', 'SUB', 'MUL', 'DIV', 'MOD', 'JMP',
            'JMZ', 'JMN', 'DJN', 'SPL', 'SLT', 'CMP', 'SEQ', 'SNE', 'NOP',
            'M_A', 'M_B', 'M_AB', 'M_BA', 'M_F', 'M_X', 'M_I', 'IMMEDIATE',
            'DIRECT', 'INDIRECT_B', 'PREDEC_B', 'POSTINC_B', 'INDIRECT_A',
-           'PREDEC_A', 'POSTINC_A', 'Instruction', 'Warrior']
+           'PREDEC_A', 'POSTINC_A', 'Instruction', 'Warrior',
+           'OPCODE_SHIFT', 'MODIFIER_SHIFT', 'A_MODE_SHIFT', 'B_MODE_SHIFT',
+           'A_NUMBER_SHIFT', 'B_NUMBER_SHIFT', 'NUMBER_MASK', 'MAX_PACKED_SIZE']
 
 DAT = 0     # terminate process
 MOV = 1     # move from A to B
@@ -61,12 +65,43 @@ INDIRECT_A = 5  # indirect using A-field
 PREDEC_A = 6    # predecrement indirect using A-field
 POSTINC_A = 7   # postincrement indirect using A-field
 
+# Packed instructions: one int holding, from the most significant bits,
+# opcode (5 bits), modifier (3), A-mode (3), B-mode (3), A-number (24) and
+# B-number (24). Numbers are stored modulo the core size, so two packed
+# instructions are equal exactly when all their fields are.
+OPCODE_SHIFT = 57
+MODIFIER_SHIFT = 54
+A_MODE_SHIFT = 51
+B_MODE_SHIFT = 48
+A_NUMBER_SHIFT = 24
+B_NUMBER_SHIFT = 0
+NUMBER_MASK = (1 << 24) - 1
+MAX_PACKED_SIZE = 1 << 24
+
 INSTRUCTION_REGEX = re.compile(r'([a-z]{3})'  # opcode
                                r'(?:\s*\.\s*([abfxi]{1,2}))?' # optional modifier
                                r'(?:\s*([#\$\*@\{<\}>])?\s*([^,$]+))?' # optional first value
                                r'(?:\s*,\s*([#\$\*@\{<\}>])?\s*(.+))?$', # optional second value
                                re.I)
 
+# parser line patterns, compiled once
+REDCODE_REGEX = re.compile(r'^;redcode\w*$', re.I)
+INFO_REGEXES = [(key, re.compile(r'^;%s\s+(.+)$' % pattern, re.I))
+                for key, pattern in (('name', 'name'), ('author', 'author'),
+                                     ('date', 'date'), ('version', 'version'),
+                                     ('strategy', 'strat(?:egy)?'))]
+ASSERT_REGEX = re.compile(r'^;assert\s+(.+)$', re.I)
+COMMENT_REGEX = re.compile(r'^([^;]*)\s*;')
+ORG_REGEX = re.compile(r'^ORG\s+(.+)\s*$', re.I)
+END_REGEX = re.compile(r'^END(?:\s+([^\s]+))?$', re.I)
+EQU_REGEX = re.compile(r'^([a-z]\w*)\s+EQU\s+(.*)\s*$', re.I)
+LABEL_REGEX = re.compile(r'^([a-z]\w*)\s+(.+)\s*$')
+
+def evaluate(expression, environment, names=None):
+    """Evaluate an expression of the source like eval(expression,
+       environment, names), but only if it is arithmetic (see Expression)."""
+    return compile_expression(expression).evaluate(environment, names)
+
 OPCODES = {'DAT': DAT, 'MOV': MOV, 'ADD': ADD, 'SUB': SUB, 'MUL': MUL,
            'DIV': DIV, 'MOD': MOD, 'JMP': JMP, 'JMZ': JMZ, 'JMN': JMN,
            'DJN': DJN, 'SPL': SPL, 'SLT': SLT, 'CMP': CMP, 'SEQ': SEQ,
@@ -156,6 +191,22 @@ class Instruction(object):
         instruction.core = core
         return instruction
 
+    def pack(self, size=8000):
+        """Return this instruction packed into an int, for a core of the
+           given size.
+        """
+        return ((self.opcode << OPCODE_SHIFT) | (self.modifier << MODIFIER_SHIFT) |
+                (self.a_mode << A_MODE_SHIFT) | (self.b_mode << B_MODE_SHIFT) |
+                ((self.a_number % size) << A_NUMBER_SHIFT) |
+                ((self.b_number % size) << B_NUMBER_SHIFT))
+
+    @classmethod
+    def unpack(cls, value):
+        "Return the Instruction of a packed int."
+        return cls((value >> OPCODE_SHIFT) & 31, (value >> MODIFIER_SHIFT) & 7,
+                   (value >> A_MODE_SHIFT) & 7, (value >> A_NUMBER_SHIFT) & NUMBER_MASK,
+                   (value >> B_MODE_SHIFT) & 7, (value >> B_NUMBER_SHIFT) & NUMBER_MASK)
+
     def default_modifier(self):
         for opcodes, modes_modifiers in DEFAULT_MODIFIERS.items():
             if self.opcode in opcodes:
@@ -206,9 +257,25 @@ class Instruction(object):
     def __repr__(self):
         return "<%s>" % self
 
-def parse(input, definitions={}):
+class RelativeLabels(object):
+    """The addresses of labels relative to the instruction at address n."""
+
+    __slots__ = ('labels', 'n')
+
+    def __init__(self, labels, n):
+        self.labels = labels
+        self.n = n
+
+    def __contains__(self, name):
+        return name in self.labels
+
+    def __getitem__(self, name):
+        return self.labels[name] - self.n
+
+def parse(input, definitions={}, packed=False):
     """ Parse a Redcode code from a line iterator (input) returning a Warrior
-        object."""
+        object. If packed, the warrior also gets `packed`, its instructions
+        packed for a core of CORESIZE (see Instruction.pack)."""
 
     found_recode_info_comment = False
     labels = {}
@@ -224,55 +291,41 @@ def parse(input, definitions={}):
     for n, line in enumerate(input):
         line = line.strip()
         if line:
-            # process info comments
-            m = re.match(r'^;redcode\w*$', line, re.I)
-            if m:
-                if found_recode_info_comment:
-                    # stop reading, found second ;redcode
-                    break;
-                else:
-                    # first ;redcode ignore all input before
-                    warrior.instructions = []
-                    labels = {}
-                    environment = copy(definitions)
-                    code_address = 0
-                    found_recode_info_comment = True
-                continue
-
-            m = re.match(r'^;name\s+(.+)$', line, re.I)
-            if m:
-                warrior.name = m.group(1).strip()
-                continue
-
-            m = re.match(r'^;author\s+(.+)$', line, re.I)
-            if m:
-                warrior.author = m.group(1).strip()
-                continue
-
-            m = re.match(r'^;date\s+(.+)$', line, re.I)
-            if m:
-                warrior.date = m.group(1).strip()
-                continue
-
-            m = re.match(r'^;version\s+(.+)$', line, re.I)
-            if m:
-                warrior.version = m.group(1).strip()
-                continue
-
-            m = re.match(r'^;strat(?:egy)?\s+(.+)$', line, re.I)
-            if m:
-                warrior.strategy.append(m.group(1).strip())
-                continue
+            if line[0] == ';':
+                # process info comments
+                if REDCODE_REGEX.match(line):
+                    if found_recode_info_comment:
+                        # stop reading, found second ;redcode
+                        break;
+                    else:
+                        # first ;redcode ignore all input before
+                        warrior.instructions = []
+                        labels = {}
+                        environment = copy(definitions)
+                        code_address = 0
+                        found_recode_info_comment = True
+                    continue
+
+                for key, regex in INFO_REGEXES:
+                    m = regex.match(line)
+                    if m:
+                        if key == 'strategy':
+                            warrior.strategy.append(m.group(1).strip())
+                        else:
+                            setattr(warrior, key, m.group(1).strip())
+                        break
+                if m:
+                    continue
 
-            # Test if assert expression evaluates to true
-            m = re.match(r'^;assert\s+(.+)$', line, re.I)
-            if m:
-                if not eval(m.group(1), environment):
-                    raise AssertionError("Assertion failed: %s, line %d" % (line, n))
-                continue
+                # Test if assert expression evaluates to true
+                m = ASSERT_REGEX.match(line)
+                if m:
+                    if not evaluate(m.group(1), environment):
+                        raise AssertionError("Assertion failed: %s, line %d" % (line, n))
+                    continue
 
             # ignore other comments
-            m = re.match(r'^([^;]*)\s*;', line)
+            m = COMMENT_REGEX.match(line)
             if m:
                 # rip off comment from the line
                 line = m.group(1).strip()
@@ -280,30 +333,30 @@ def parse(input, definitions={}):
                 if not line: continue
 
             # Match ORG
-            m = re.match(r'^ORG\s+(.+)\s*$', line, re.I)
+            m = ORG_REGEX.match(line)
             if m:
                 warrior.start = m.group(1)
                 continue
 
             # Match END
-            m = re.match(r'^END(?:\s+([^\s]+))?$', line, re.I)
+            m = END_REGEX.match(line)
             if m:
                 if m.group(1):
                     warrior.start = m.group(1)
                 break # stop processing (end of redcode)
 
             # Match EQU
-            m = re.match(r'^([a-z]\w*)\s+EQU\s+(.*)\s*$', line, re.I)
+            m = EQU_REGEX.match(line)
             if m:
                 name, value = m.groups()
                 # evaluate EQU expression using previous EQU definitions,
                 # add result to a name variable in environment
-                environment[name] = eval(value, environment)
+                environment[name] = evaluate(value, environment)
                 continue
 
             # Keep matching the first word until it's no label anymore
             while True:
-                m = re.match(r'^([a-z]\w*)\s+(.+)\s*$', line)
+                m = LABEL_REGEX.match(line)
                 if m:
                     label_candidate = m.group(1)
                     if label_candidate.upper() not in OPCODES:
@@ -346,21 +399,31 @@ def parse(input, definitions={}):
 
     # evaluate start expression
     if isinstance(warrior.start, str):
-        warrior.start = eval(warrior.start, environment, labels)
+        warrior.start = evaluate(warrior.start, environment, labels)
 
     # second pass
-    for n, instruction in enumerate(warrior.instructions):
-
-        # create a dictionary of relative labels addresses to be used as a local
-        # eval environment
-        relative_labels = dict((name, address-n) for name, address in labels.items())
+    # labels are relative to the address of the instruction using them.
+    # expressions without labels have the same value in every instruction, so
+    # each of them is evaluated once per warrior
+    folded = {}
+
+    def evaluate_field(source, n):
+        expression = compile_expression(source)
+        if expression.constant:
+            return expression.value
+        if expression.names.isdisjoint(labels):
+            if source not in folded:
+                folded[source] = expression.evaluate(environment)
+            return folded[source]
+        return expression.evaluate(environment, RelativeLabels(labels, n))
 
+    for n, instruction in enumerate(warrior.instructions):
         # evaluate instruction fields using global environment and labels
         if isinstance(instruction.a_number, str):
-            instruction.a_number = eval(instruction.a_number, environment, relative_labels)
+            instruction.a_number = evaluate_field(instruction.a_number, n)
         if isinstance(instruction.b_number, str):
-            instruction.b_number = eval(instruction.b_number, environment, relative_labels)
-    
+            instruction.b_number = evaluate_field(instruction.b_number, n)
+
     for i in warrior.instructions:
         assert isinstance(i.opcode, int), f"opcode is not an int: {i.opcode}"
         assert i.opcode>=0 and i.opcode<=16, f"opcode is not in range 0-16: {i.opcode}"
@@ -373,5 +436,9 @@ def parse(input, definitions={}):
         assert isinstance(i.b_mode, int), f"b_mode is not an int: {i.b_mode}"
         assert i.b_mode>=0 and i.b_mode<=7, f"b_mode is not in range 0-7: {i.b_mode}"
 
+    if packed:
+        size = definitions.get('CORESIZE', 8000)
+        warrior.packed = [i.pack(size) for i in warrior.instructions]
+
     return warrior
 
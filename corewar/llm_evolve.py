@@ -38,7 +38,7 @@ def run_single_round(args, warriors, seed):
     for t in range(args.cycles):
         simulation.step()
 
-        alive_flags = np.array([len(warrior.task_queue)>0 for warrior in simulation.warriors]).astype(int)
+        alive_flags = np.array([len(warrior.task_queue)>0 for warrior in simulation.states]).astype(int)
         n_alive = sum(alive_flags)
         if n_alive==0:
             break
@@ -5,6 +5,9 @@ import unittest
 
 from tests.redcode_test import TestRedcodeAssembler
 from tests.mars_test import TestMars
+from tests.core_test import TestArrayCore, TestPackedCore
+from tests.batch_test import TestBatchMars
+from tests.prescreen_test import TestPrescreen
 
 if __name__ == '__main__':
     unittest.main()
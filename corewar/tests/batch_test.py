@@ -0,0 +1,62 @@
+#! /usr/bin/env python
+#! coding: utf-8
+
+import os
+import random
+import unittest
+
+import numpy as np
+
+from corewar import redcode
+from corewar.batch import BatchMARS
+from corewar.core import ArrayCore
+from corewar.mars import MARS
+
+DEFAULT_ENV = {'CORESIZE': 8000, 'MAXLENGTH': 100}
+FIELDS = ('opcode', 'modifier', 'a_mode', 'b_mode', 'a_number', 'b_number')
+
+class TestBatchMars(unittest.TestCase):
+
+    def parse(self, filename):
+        current_path = os.path.dirname(os.path.realpath(__file__))
+        with open(os.path.join(current_path, "..", "warriors", filename), encoding="latin1") as f:
+            return redcode.parse(f, DEFAULT_ENV)
+
+    def assert_same_as_mars(self, filenames, cycles, seeds=(0, 1, 2)):
+        warriors = [self.parse(filename) for filename in filenames]
+        batch = BatchMARS.from_seeds(warriors, seeds, max_processes=64)
+        for c in range(cycles):
+            batch.step()
+
+        for r, seed in enumerate(seeds):
+            random.seed(seed)
+            simulation = MARS(core=ArrayCore(), warriors=warriors, max_processes=64)
+            for c in range(cycles):
+                simulation.step()
+
+            for field in FIELDS:
+                self.assertEqual(list(getattr(simulation.core, field)),
+                                 getattr(batch, field)[r * 8000:(r + 1) * 8000].tolist(),
+                                 "%s differs in round %d" % (field, r))
+            for n, state in enumerate(simulation.states):
+                self.assertEqual(list(state.task_queue), batch.task_queue(r, n))
+
+    def test_validate(self):
+        self.assert_same_as_mars(["validate.red"], 500)
+
+    def test_dwarf_versus_mice(self):
+        self.assert_same_as_mars(["dwarf.red", "mice.red"], 500)
+
+    def test_three_warriors(self):
+        self.assert_same_as_mars(["crazy.red", "scanvampire.red", "twill.red"], 500)
+
+    def test_running_mask(self):
+        warriors = [self.parse("imp.red")]
+        batch = BatchMARS.from_seeds(warriors, [0, 1], max_processes=64)
+        before = [batch.task_queue(r, 0) for r in range(2)]
+        batch.step(running=np.array([True, False]))
+        self.assertNotEqual(before[0], batch.task_queue(0, 0))
+        self.assertEqual(before[1], batch.task_queue(1, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+#! coding: utf-8
+
+import unittest
+from copy import copy
+
+from corewar.core import ArrayCore, PackedCore, DEFAULT_INITIAL_INSTRUCTION
+from corewar.redcode import *
+
+class TestArrayCore(unittest.TestCase):
+
+    def test_clear(self):
+        core = ArrayCore(size=100)
+        self.assertEqual(100, len(core))
+        for cell in core:
+            self.assertEqual(DEFAULT_INITIAL_INSTRUCTION, cell)
+
+    def test_fields_are_trimmed(self):
+        core = ArrayCore(size=100)
+        core[105] = Instruction(MOV, M_I, DIRECT, -1, INDIRECT_B, 250)
+        self.assertEqual(Instruction(MOV, M_I, DIRECT, 99, INDIRECT_B, 50), core[5])
+
+        core[5].a_number -= 100
+        core[5].b_number += 1
+        self.assertEqual(99, core.a_number[5])
+        self.assertEqual(51, core.b_number[5])
+
+    def test_copy_is_detached(self):
+        core = ArrayCore(size=100)
+        core[0] = Instruction(ADD, M_AB, IMMEDIATE, 4, DIRECT, 3)
+        snapshot = copy(core[0])
+        core[0].b_number = 7
+        self.assertIsInstance(snapshot, Instruction)
+        self.assertEqual(3, snapshot.b_number)
+        self.assertEqual(7, core[0].b_number)
+
+    def test_wrapping_slice(self):
+        core = ArrayCore(size=10)
+        for i in range(10):
+            core[i] = Instruction(DAT, M_F, IMMEDIATE, i, IMMEDIATE, 0)
+        self.assertEqual([8, 9, 0, 1], [cell.a_number for cell in core[-2:2]])
+
+class TestPackedCore(unittest.TestCase):
+
+    def test_clear(self):
+        core = PackedCore(size=100)
+        self.assertEqual(100, len(core))
+        for cell in core:
+            self.assertEqual(DEFAULT_INITIAL_INSTRUCTION, cell)
+
+    def test_fields_are_trimmed(self):
+        core = PackedCore(size=100)
+        core[105] = Instruction(MOV, M_I, DIRECT, -1, INDIRECT_B, 250)
+        self.assertEqual(Instruction(MOV, M_I, DIRECT, 99, INDIRECT_B, 50), core[5])
+
+        core[5].a_number -= 100
+        core[5].b_number += 1
+        self.assertEqual(Instruction(MOV, M_I, DIRECT, 99, INDIRECT_B, 51), core[5])
+
+    def test_packed_cells(self):
+        core = PackedCore(size=100)
+        instruction = Instruction(ADD, M_AB, IMMEDIATE, 4, DIRECT, 3)
+        core[0] = instruction.pack(100)
+        self.assertEqual(instruction, core[0])
+        self.assertEqual(instruction.pack(100), core.cells[0])
+
+    def test_snapshot(self):
+        core = PackedCore(size=100)
+        snapshot = core.snapshot()
+        core[0] = Instruction(ADD, M_AB, IMMEDIATE, 4, DIRECT, 3)
+        self.assertEqual(DEFAULT_INITIAL_INSTRUCTION.pack(100), snapshot[0])
+        self.assertNotEqual(snapshot[0], core.cells[0])
+
+    def test_no_limits(self):
+        self.assertRaises(ValueError, PackedCore, size=100, read_limit=50)
+
+if __name__ == '__main__':
+    unittest.main()
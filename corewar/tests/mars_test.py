@@ -6,6 +6,8 @@ import re
 import unittest
 
 from corewar import redcode, mars
+from corewar.core import ArrayCore, PackedCore
+from corewar.packed import PackedMARS
 
 DEFAULT_ENV = {'CORESIZE': 8000, 'MAXLENGTH': 100}
 
@@ -35,17 +37,80 @@ class TestMars(unittest.TestCase):
         sitting_duck = redcode.parse(sitting_duck_code.split('\n'), DEFAULT_ENV)
 
         simulation = mars.MARS(warriors=[dwarf, sitting_duck])
+        dwarf_state, sitting_duck_state = simulation.states
 
         # run simulation for at most
-        for x in xrange(8000):
+        for x in range(8000):
             simulation.step()
-            if not dwarf.task_queue or not sitting_duck.task_queue:
+            if not dwarf_state.task_queue or not sitting_duck_state.task_queue:
                 break
         else:
             self.fail("Running for too long and both warriors still alive")
 
-        self.assertEquals(1, len(dwarf.task_queue))
-        self.assertEquals(0, len(sitting_duck.task_queue))
+        self.assertEquals(1, len(dwarf_state.task_queue))
+        self.assertEquals(0, len(sitting_duck_state.task_queue))
+
+    def test_shared_warrior(self):
+        imp = redcode.parse(['mov 0, 1'], DEFAULT_ENV)
+        simulation = mars.MARS(warriors=[imp, imp], randomize=False)
+        other = mars.MARS(warriors=[imp], randomize=False)
+
+        # every simulation keeps its own states, the warrior is not written to
+        self.assertFalse(hasattr(imp, 'task_queue'))
+        self.assertEqual([0], list(simulation.states[0].task_queue))
+        self.assertEqual([4000], list(simulation.states[1].task_queue))
+        self.assertEqual('Unnamed', simulation.states[1].name)
+
+        simulation.step()
+        self.assertEqual([1], list(simulation.states[0].task_queue))
+        self.assertEqual([4001], list(simulation.states[1].task_queue))
+        self.assertEqual([0], list(other.states[0].task_queue))
+
+    def test_max_processes(self):
+        spl_code = """
+            spl 0
+            jmp -1
+        """
+        spl = redcode.parse(spl_code.split('\n'), DEFAULT_ENV)
+        simulation = mars.MARS(warriors=[spl], randomize=False, max_processes=10)
+        task_queue = simulation.states[0].task_queue
+
+        for x in range(100):
+            simulation.step()
+        self.assertEqual(10, len(task_queue))
+
+        # tasks are executed from the front, new ones are queued at the end
+        before = list(task_queue)
+        simulation.step()
+        self.assertEqual(before[1:], list(task_queue)[:-1])
+        self.assertEqual(10, len(task_queue))
+
+    def test_core_events_only_when_observed(self):
+        class RecordingMARS(mars.MARS):
+            def core_event(self, warrior, address, event_type):
+                self.events.append((address, event_type))
+
+        class HeadlessMARS(mars.MARS):
+            pass
+
+        self.assertFalse(mars.MARS.observed)
+        self.assertFalse(HeadlessMARS.observed)
+        self.assertTrue(RecordingMARS.observed)
+
+        imp = redcode.parse(['mov 0, 1'], DEFAULT_ENV)
+        simulation = RecordingMARS(randomize=False)
+        simulation.events = []
+        simulation.warriors = [imp]
+        simulation.load_warriors(randomize=False)
+        simulation.step()
+        self.assertIn((0, mars.EVENT_EXECUTED), simulation.events)
+        self.assertIn((1, mars.EVENT_I_WRITE), simulation.events)
+
+    def test_dispatch_table(self):
+        self.assertEqual(redcode.NOP + 1, len(mars.DISPATCH))
+        for handlers in mars.DISPATCH:
+            self.assertEqual(redcode.M_I + 1, len(handlers))
+            self.assertTrue(all(callable(handler) for handler in handlers))
 
     def test_validate(self):
 
@@ -56,9 +121,9 @@ class TestMars(unittest.TestCase):
 
         simulation = mars.MARS(warriors=[validate], randomize=False)
 
-        for i in xrange(8000):
+        for i in range(8000):
             simulation.step()
-            if not validate.task_queue:
+            if not simulation.states[0].task_queue:
                 self.fail("Interpreter is not ICWS88-compliant. died in %d steps" % i)
 
     def test_crazy_warrrior(self):
@@ -67,13 +132,38 @@ class TestMars(unittest.TestCase):
     def test_validate_warrior(self):
         self.warrior_step_by_step("validate.red", "validate-steps.red", 0, 90)
 
-    def warrior_step_by_step(self, warrior_filename, log_filename, core_start, core_end):
+    def test_crazy_warrrior_array_core(self):
+        self.warrior_step_by_step("crazy.red", "crazy-steps.red", -22, 22, ArrayCore())
+
+    def test_validate_warrior_array_core(self):
+        self.warrior_step_by_step("validate.red", "validate-steps.red", 0, 90, ArrayCore())
+
+    def test_crazy_warrrior_packed_core(self):
+        self.warrior_step_by_step("crazy.red", "crazy-steps.red", -22, 22, PackedCore())
+
+    def test_validate_warrior_packed_core(self):
+        self.warrior_step_by_step("validate.red", "validate-steps.red", 0, 90, PackedCore())
+
+    def test_crazy_warrrior_packed_mars(self):
+        self.warrior_step_by_step("crazy.red", "crazy-steps.red", -22, 22, PackedCore(),
+                                  PackedMARS)
+
+    def test_validate_warrior_packed_mars(self):
+        self.warrior_step_by_step("validate.red", "validate-steps.red", 0, 90, PackedCore(),
+                                  PackedMARS)
+
+    def test_packed_mars_needs_packed_core(self):
+        self.assertRaises(TypeError, PackedMARS, core=ArrayCore())
+
+    def warrior_step_by_step(self, warrior_filename, log_filename, core_start, core_end,
+                             core=None, mars_class=mars.MARS):
 
         current_path = os.path.dirname(os.path.realpath(__file__))
         with open(os.path.join(current_path, "..", "warriors", warrior_filename)) as f:
             test_w = redcode.parse(f, DEFAULT_ENV)
 
-        simulation = mars.MARS(warriors=[test_w], randomize=False)
+        simulation = mars_class(core=core, warriors=[test_w], randomize=False)
+        task_queue = simulation.states[0].task_queue
 
         nth = 0
 
@@ -88,24 +178,29 @@ class TestMars(unittest.TestCase):
                     next_queued = int(m.group(1))
                     # has a full program, parse it
                     expected = redcode.parse(accum_lines)
+                    if core is not None:
+                        # array and packed cores store fields modulo the core size
+                        for e in expected:
+                            e.a_number %= len(core)
+                            e.b_number %= len(core)
 
                     # compare with next in queue
-                    if not test_w.task_queue:
+                    if not task_queue:
                         self.fail("No tasks in queue. step %d, line %d" % (nth, n))
-                    if test_w.task_queue[0] != next_queued:
+                    if task_queue[0] != next_queued:
                         self.fail("Task address does not match (%d != %d). step %d, line %d" %
-                                  (next_queued, test_w.task_queue[0], nth, n))
+                                  (next_queued, task_queue[0], nth, n))
 
                     # compare it with the current state
                     for e, i in zip(expected, simulation.core[core_start:core_end]):
                         if e != i:
-                            print
+                            print()
                             x = core_start
                             for e, i in zip(expected, simulation.core[core_start:core_end]):
                                 if e != i:
-                                    print "%05d %s != %s" % (x, str(e), str(i))
+                                    print("%05d %s != %s" % (x, str(e), str(i)))
                                 else:
-                                    print "%05d %s == %s" % (x, str(e), str(i))
+                                    print("%05d %s == %s" % (x, str(e), str(i)))
                                 x += 1
                             self.fail("Core don't match, step %d, line %d" % (nth, n))
 
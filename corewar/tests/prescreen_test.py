@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+#! coding: utf-8
+
+import os
+import glob
+import random
+import unittest
+
+from corewar import redcode, mars
+from corewar.core import ArrayCore
+from corewar.prescreen import *
+
+DEFAULT_ENV = {'CORESIZE': 8000, 'MAXLENGTH': 100}
+
+# known cases: (source, expected classification)
+CORPUS = [
+    ("", EMPTY),
+    (";name nothing\n; only comments", EMPTY),
+    ("dat #0, #0", EXECUTES_DAT),
+    ("start dat 0, 0\nmov 0, 1\nend start", EXECUTES_DAT),
+    ("mov 0, 1\ndat <-1, >1\nend 1", EXECUTES_DAT),
+    ("mov 0, 1\nend 50", EXECUTES_DAT),           # starts in the empty cells after it
+    ("mov 0, 1\nend -1", EXECUTES_DAT),           # starts in the empty cells before it
+    ("div #0, 1", DIVIDES_BY_ZERO),
+    ("mod.b 1, 2\ndat 0, 0", DIVIDES_BY_ZERO),
+    ("mod.f $1, $1\ndat 3, 0", DIVIDES_BY_ZERO),
+    ("div.x $1, $1\ndat 0, 3", DIVIDES_BY_ZERO),
+    ("div.ba $1, $1\ndat 0, 3", DIVIDES_BY_ZERO),
+    ("div.a {1, 0\ndat 1, 0", DIVIDES_BY_ZERO),   # reads the cell it decremented
+    ("div.a <1, 0\ndat 0, 4\ndat 0, 0\ndat 7, 0", DIVIDES_BY_ZERO),
+    ("div.a 8000, 1", DIVIDES_BY_ZERO),           # reads itself, with a zero A-field
+    ("div.a 50, 1", DIVIDES_BY_ZERO),             # reads an empty cell
+    ("mov 0, 1", None),
+    ("jmp 0\ndat 0", None),
+    ("spl 0\ndat 0", None),
+    ("div.a #5, 1", None),
+    ("mod.ab $1, 0\ndat 3, 0", None),
+    ("div.a <1, 0\ndat 0, 3\ndat 0, 0\ndat 7, 0", None),
+    ("div.a 4000, 1", None),                      # reads an unknown cell
+    ("mov 0, 1\nend 150", None),                  # starts in an unknown cell
+]
+
+def parse(source):
+    return redcode.parse(source.split('\n'), DEFAULT_ENV)
+
+class TestPrescreen(unittest.TestCase):
+
+    def test_corpus(self):
+        for source, expected in CORPUS:
+            self.assertEqual(expected, dead_on_arrival(parse(source)), source)
+
+    def test_corpus_dies_when_simulated(self):
+        # every warrior classified dead has no process left after its first
+        # step, whatever the opponent and the placement
+        with open(os.path.join(os.path.dirname(__file__), '..', 'warriors', 'dwarf.red')) as f:
+            dwarf = parse(f.read())
+        for source, expected in CORPUS:
+            if expected is None:
+                continue
+            for seed in range(5):
+                random.seed(seed)
+                simulation = mars.MARS(core=ArrayCore(size=8000), warriors=[parse(source), dwarf])
+                simulation.step()
+                self.assertEqual(0, len(simulation.states[0].task_queue), source)
+
+    def test_warriors_are_not_dead(self):
+        for path in glob.glob(os.path.join(os.path.dirname(__file__), '..', 'warriors', '*.red')):
+            with open(path, encoding='latin1') as f:
+                warrior = parse(f.read())
+            self.assertIsNone(dead_on_arrival(warrior), path)
+
+if __name__ == '__main__':
+    unittest.main()
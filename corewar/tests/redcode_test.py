@@ -4,6 +4,7 @@
 import unittest
 
 from corewar.redcode import *
+from corewar.expression import compile_expression
 
 DEFAULT_ENV = {'CORESIZE': 8000}
 
@@ -37,6 +38,62 @@ class TestRedcodeAssembler(unittest.TestCase):
         self.assertEquals(Instruction(JMP, M_F, DIRECT, -2, DIRECT, 0),
                           warrior.instructions[2])
 
+    def test_packed(self):
+        warrior = parse(['loop add.ab #4, -1', 'jmp.f $loop, }8001'], DEFAULT_ENV, packed=True)
+
+        self.assertEquals([i.pack(8000) for i in warrior.instructions], warrior.packed)
+        self.assertEquals(Instruction(ADD, M_AB, IMMEDIATE, 4, DIRECT, 7999),
+                          Instruction.unpack(warrior.packed[0]))
+        self.assertEquals(Instruction(JMP, M_F, DIRECT, 7999, POSTINC_A, 1),
+                          Instruction.unpack(warrior.packed[1]))
+
+        # equal packed instructions are equal in every field
+        self.assertNotEqual(Instruction(MOV, M_I, DIRECT, 0, DIRECT, 1).pack(),
+                            Instruction(MOV, M_I, DIRECT, 1, DIRECT, 0).pack())
+        self.assertEquals(Instruction(DAT, M_F, IMMEDIATE, -1, IMMEDIATE, 0).pack(),
+                          Instruction(DAT, M_F, IMMEDIATE, 7999, IMMEDIATE, 0).pack())
+
+    def test_expressions(self):
+        input = """
+                ;assert CORESIZE % 4 == 0 and 0 < MAXLENGTH <= 100
+                step  equ CORESIZE//4 - -1 * 4
+                start mov   step, (CORESIZE // 3) % 100
+                      jmp   start + step // step, -start
+                """
+        warrior = parse(input.split('\n'), dict(DEFAULT_ENV, MAXLENGTH=100))
+
+        self.assertEquals(Instruction(MOV, M_I, DIRECT, 2004, DIRECT, 66),
+                          warrior.instructions[0])
+        self.assertEquals(Instruction(JMP, M_B, DIRECT, 0, DIRECT, 1),
+                          warrior.instructions[1])
+
+        # constant expressions are folded when compiled
+        expression = compile_expression('(1 + 2) * -3')
+        self.assertTrue(expression.constant)
+        self.assertEquals(-9, expression.value)
+        self.assertEquals(frozenset(['a', 'b']), compile_expression('a - 2 * b').names)
+        # and/or short-circuit as in Python
+        self.assertEquals(0, compile_expression('0 and 1 / 0').evaluate({}))
+
+        self.assertRaises(NameError, parse, ['mov 0, nowhere'], DEFAULT_ENV)
+        self.assertRaises(ZeroDivisionError, parse, ['mov 0, 1 % 0'], DEFAULT_ENV)
+        self.assertRaises(AssertionError, parse, [';assert CORESIZE == 800', 'dat 0'], DEFAULT_ENV)
+
+    def test_unsafe_expressions(self):
+        for expression in ["__import__('os').system('true')", "CORESIZE.bit_length()",
+                           "9 ** 9 ** 9", "1 << 100", "'a' * 3", "[1][0]", "1.5",
+                           "(lambda: 1)()", "x := 1", "1 if 1 else 2"]:
+            self.assertRaises(ValueError, parse, ['mov 0, ' + expression], DEFAULT_ENV)
+        self.assertRaises(ValueError, parse, ['x equ abs(-1)', 'dat x'], DEFAULT_ENV)
+        self.assertRaises(ValueError, parse, [';assert open("/etc/passwd")'], DEFAULT_ENV)
+        # huge values, directly or through a chain of EQUs squaring each other
+        self.assertRaises(ValueError, parse, ['mov 0, 99999999999999999999'], DEFAULT_ENV)
+        self.assertRaises(ValueError, parse, ['mov 0, 99999 * 99999'], DEFAULT_ENV)
+        chain = ['a0 equ 99999999*99999999'] + ['a%d equ a%d*a%d' % (i + 1, i, i) for i in range(23)]
+        self.assertRaises(ValueError, parse, chain + ['dat a23'], DEFAULT_ENV)
+        chain = ['a0 equ 9999'] + ['a%d equ a%d*a%d' % (i + 1, i, i) for i in range(23)]
+        self.assertRaises(ValueError, parse, chain + ['dat a23'], DEFAULT_ENV)
+
 if __name__ == '__main__':
     unittest.main()
 
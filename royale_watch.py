@@ -90,7 +90,6 @@ def main():
         for i, w in enumerate(combatants):
             w.color = viz.WARRIOR_COLORS[i % len(viz.WARRIOR_COLORS)]
             w.wins = w.ties = w.losses = 0
-            w.task_queue = []
         
         sim.warriors = combatants
         sim.reset()
@@ -107,7 +106,7 @@ def main():
 
             if not paused:
                 sim.step(); cycle += 1
-                alive = [w for w in sim.warriors if w.task_queue]
+                alive = [w for w in sim.states if w.task_queue]
                 if len(alive) <= 1 or cycle >= 80000:
                     print(f"Winner: {alive[0].name if alive else 'Draw'}")
                     round_over = True
@@ -116,7 +115,7 @@ def main():
             sim.blit_into(screen, (0,0))
             pygame.draw.rect(screen, (20, 20, 20), (grid_w, 0, SIDEBAR_WIDTH, grid_h))
             y = 10
-            for w in sorted(combatants, key=lambda x: len(x.task_queue), reverse=True):
+            for w in sorted(sim.states, key=lambda x: len(x.task_queue), reverse=True):
                 cnt = len(w.task_queue)
                 color = w.color[1] if cnt > 0 else (80,80,80)
                 screen.blit(font.render(f"{w.name[:15]}: {cnt}", True, color), (grid_w+10, y))
@@ -0,0 +1,86 @@
+import os
+import json
+import pickle
+import sqlite3
+import hashlib
+import dataclasses
+
+ENGINE_VERSION = 2 # bump when the simulation changes the outputs of a round
+MAX_VARIABLES = 500 # keys per query, below the 999 variables SQLite allows in a statement by default
+
+def warrior_hash(warrior):
+    """
+    sha256 of an assembled warrior: its start and the fields of its instructions.
+    Names, comments, labels and whitespace of the source do not change it.
+    """
+    program = [(i.opcode, i.modifier, i.a_mode, i.a_number, i.b_mode, i.b_number) for i in warrior.instructions]
+    return hashlib.sha256(repr((warrior.start, program)).encode()).hexdigest()
+
+def canonical_form(warrior, size):
+    """
+    What a warrior does in a core of size: its start and the fields of its instructions, numbers
+    modulo size. Warriors with the same canonical form play identical rounds.
+    """
+    program = tuple((i.opcode, i.modifier, i.a_mode, i.a_number % size, i.b_mode, i.b_number % size) for i in warrior.instructions)
+    return (warrior.start % size, program)
+
+def canonical_hash(warrior, size):
+    return hashlib.sha256(repr(canonical_form(warrior, size)).encode()).hexdigest()
+
+def battle_hash(warrior, simargs):
+    """
+    Hash of a warrior in the keys of its rounds: warriors with the same one play identical rounds.
+    Its canonical_hash, or with legacy_core, whose fields are not reduced modulo the core size, its warrior_hash.
+    """
+    return warrior_hash(warrior) if simargs.legacy_core else canonical_hash(warrior, simargs.size)
+
+def battle_key(simargs, warrior_hashes, seed):
+    """
+    Key of one round: the ordered battle_hash of the warriors (the evaluated warrior first, then its opponents),
+    the SimulationArgs fields, the seed and the engine version. The number of rounds and the choice of
+    core (packed) are left out, since they do not change a round.
+    """
+    fields = {k: v for k, v in dataclasses.asdict(simargs).items() if k not in ("rounds", "packed")}
+    item = dict(warriors=list(warrior_hashes), simargs=fields, seed=seed, version=ENGINE_VERSION)
+    return hashlib.sha256(json.dumps(item, sort_keys=True).encode()).hexdigest()
+
+class BattleCache:
+    """
+    Persistent on-disk (SQLite) cache of the outputs of single rounds, keyed by battle_key.
+    Safe to share between runs: writes are committed as they happen.
+    """
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute("CREATE TABLE IF NOT EXISTS rounds (key TEXT PRIMARY KEY, outputs BLOB)")
+        self.db.commit()
+        self.hits, self.misses = 0, 0
+
+    def keys(self, simargs, warriors, seeds, opponent_hashes=()):
+        """Keys of the rounds of warriors, followed by opponents with opponent_hashes, for every seed."""
+        hashes = [battle_hash(w, simargs) for w in warriors] + list(opponent_hashes)
+        return [battle_key(simargs, hashes, seed) for seed in seeds]
+
+    def get_many(self, keys):
+        """Returns a dict key -> outputs of the cached rounds."""
+        found = {}
+        keys = list(keys)
+        for i in range(0, len(keys), MAX_VARIABLES):
+            chunk = keys[i:i + MAX_VARIABLES]
+            query = "SELECT key, outputs FROM rounds WHERE key IN (%s)" % ", ".join("?" * len(chunk))
+            for key, outputs in self.db.execute(query, chunk):
+                found[key] = pickle.loads(outputs)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """Stores a dict key -> outputs."""
+        self.db.executemany("INSERT OR REPLACE INTO rounds (key, outputs) VALUES (?, ?)",
+                            [(key, pickle.dumps(outputs)) for key, outputs in items.items()])
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
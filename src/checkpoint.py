@@ -0,0 +1,76 @@
+import threading
+from collections import deque
+
+class Checkpointer:
+    """
+    Runs checkpoint writes on a background thread, in the order they are submitted, so that the caller never
+    waits on disk. The caller hands over a cheap snapshot of its state (copies of the containers, sharing the
+    objects they hold) and the thread serializes and writes it. A write submitted with a key replaces the write
+    with the same key still waiting to run, so that saves coalesce while a slow one is running.
+    An exception raised by a write is raised again by the next submit, flush or close.
+    """
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.tasks = deque() # (key, fn) waiting to run
+        self.busy = False
+        self.closed = False
+        self.error = None
+        self.n_written, self.n_coalesced = 0, 0
+        self.thread = threading.Thread(target=self.work, name="checkpointer", daemon=True)
+        self.thread.start()
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def submit(self, fn, key=None):
+        """Runs fn() on the background thread after the writes submitted before it."""
+        with self.cond:
+            self.raise_error()
+            if self.closed:
+                raise RuntimeError("Checkpointer is closed")
+            if key is not None:
+                n_tasks = len(self.tasks)
+                self.tasks = deque(task for task in self.tasks if task[0] != key)
+                self.n_coalesced += n_tasks - len(self.tasks)
+            self.tasks.append((key, fn))
+            self.cond.notify_all()
+
+    def work(self):
+        while True:
+            with self.cond:
+                while not self.tasks and not self.closed:
+                    self.cond.wait()
+                if not self.tasks:
+                    return
+                key, fn = self.tasks.popleft()
+                self.busy = True
+            try:
+                fn()
+            except BaseException as e:
+                with self.cond:
+                    self.error = e
+            with self.cond:
+                self.busy = False
+                self.n_written += 1
+                self.cond.notify_all()
+
+    def flush(self):
+        """Waits for every write submitted so far."""
+        with self.cond:
+            while self.tasks or self.busy:
+                self.cond.wait()
+            self.raise_error()
+
+    def close(self):
+        """Flushes and stops the thread."""
+        with self.cond:
+            if self.closed:
+                return
+            while self.tasks or self.busy:
+                self.cond.wait()
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+        self.raise_error()
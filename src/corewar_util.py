@@ -3,9 +3,18 @@ import random
 import numpy as np
 from functools import partial
 from tqdm import tqdm
+import time
+from copy import copy
+import queue
+import asyncio
+import multiprocessing
 from multiprocessing import Pool
 
-from corewar import MARS, Core, redcode
+from corewar import MARS, Core, ArrayCore, PackedCore, redcode
+from corewar.batch import BatchMARS
+from corewar.packed import PackedMARS
+from warrior_registry import WarriorRegistry, attach_results, resolve_warriors
+from parse_cache import parse_cached
 
 @dataclass
 class SimulationArgs:
@@ -15,55 +24,77 @@ class SimulationArgs:
     processes: int = 8000 # Max processes
     length: int = 100 # Max warrior length
     distance: int = 100 # Minimum warrior distance
+    early_exit: bool = True # Stop a round as soon as at most one warrior is alive
+    solo: bool = False # After an early exit, keep simulating the survivor alone for exact tsp/mc
+    legacy_core: bool = True # The original simulation, whose fields are not reduced modulo the core size. False simulates ICWS'94 fields modulo the core size on the faster ArrayCore/PackedCore; outputs differ
+    packed: bool = True # Without legacy_core, simulate on a PackedCore (64-bit instructions) instead of an ArrayCore; same outputs
 
 def simargs_to_environment(args):
     return dict(ROUNDS=args.rounds, CORESIZE=args.size, CYCLES=args.cycles,
                 MAXPROCESSES=args.processes, MAXLENGTH=args.length, MINDISTANCE=args.distance)
 
-class MyMARS(MARS):
-    def __init__(self, core=None, warriors=None, minimum_separation=100, randomize=True, max_processes=None):
-        self.core = core if core else Core()
-        self.minimum_separation = minimum_separation
-        self.max_processes = max_processes if max_processes else len(self.core)
-        self.warriors = warriors if warriors else []
-        self.warrior_cov = {w: np.zeros(len(self.core), dtype=bool) for w in self.warriors}
-        # self.warrior_tsp = {w: 0 for w in self.warriors}  # total spawned processes
+class CoverageMixin:
+    """Tracks in state.coverage every core address a warrior enqueued a process at."""
+    def load_warriors(self, randomize=True):
+        super().load_warriors(randomize)
+        for state in self.states:
+            state.coverage = np.zeros(len(self.core), dtype=bool)
 
-        if self.warriors:
-            self.load_warriors(randomize)
-
-    def core_event(self, warrior, address, event_type):
-        i = self.core[address]
-        assert isinstance(i.a_number, int), f"Expected int but got {type(i.a_number)}"
-        assert isinstance(i.b_number, int), f"Expected int but got {type(i.b_number)}"
-        i.a_number = min(max(i.a_number, -999999999), 999999999)
-        i.b_number = min(max(i.b_number, -999999999), 999999999)
-        assert i.a_number < 1000000000 and i.a_number > -1000000000, f"a_number out of bounds"
-        assert i.b_number < 1000000000 and i.b_number > -1000000000, f"b_number out of bounds"
-    
     def enqueue(self, warrior, address):
         """Enqueue another process into the warrior's task queue. Only if it's
            not already full.
         """
         if len(warrior.task_queue) < self.max_processes:
-            warrior.task_queue.append(self.core.trim(address))
-            self.warrior_cov[warrior][self.core.trim(address)] = True
-            # self.warrior_tsp[warrior] += 1
+            address = self.core.trim(address)
+            warrior.task_queue.append(address)
+            warrior.coverage[address] = True
+
+class MyMARS(CoverageMixin, MARS):
+    pass
+
+class MyPackedMARS(CoverageMixin, PackedMARS):
+    pass
+
+class MyLegacyMARS(MyMARS):
+    """
+    The original simulation: warrior code is loaded as unbinded copies, whose fields are not trimmed to the core
+    but clamped to +-999999999 on every core event.
+    """
+    def load_instruction(self, instruction):
+        return copy(instruction)
+
+    def core_event(self, warrior, address, event_type):
+        i = self.core[address]
+        i.a_number = min(max(i.a_number, -999999999), 999999999)
+        i.b_number = min(max(i.b_number, -999999999), 999999999)
+
+def make_simulation(simargs, warriors):
+    """
+    The MARS of a round. By default (legacy_core) the original simulation, where a field of the core is only
+    reduced beyond +-size and one of warrior code is clamped to +-999999999. Otherwise ArrayCore or PackedCore,
+    which store fields modulo the core size (ICWS'94): faster, but comparisons, zero tests and divisions, hence
+    outcomes, differ from the original.
+    """
+    if simargs.legacy_core:
+        return MyLegacyMARS(core=Core(size=simargs.size), warriors=warriors, minimum_separation=simargs.distance, max_processes=simargs.processes, randomize=True)
+    if simargs.packed:
+        return MyPackedMARS(core=PackedCore(size=simargs.size), warriors=warriors, minimum_separation=simargs.distance, max_processes=simargs.processes, randomize=True)
+    return MyMARS(core=ArrayCore(size=simargs.size), warriors=warriors, minimum_separation=simargs.distance, max_processes=simargs.processes, randomize=True)
 
 def run_single_round(simargs, warriors, seed, pbar=False):
     random.seed(seed)
-    simulation = MyMARS(warriors=warriors, minimum_separation=simargs.distance, max_processes=simargs.processes, randomize=True)
+    simulation = make_simulation(simargs, warriors)
     score = np.zeros(len(warriors), dtype=float)
     alive_score = np.zeros(len(warriors), dtype=float)
 
-    prev_nprocs = np.array([len(w.task_queue) for w in simulation.warriors], dtype=int)
-    total_spawned_procs = np.zeros(len(simulation.warriors), dtype=int)
+    prev_nprocs = np.array([len(w.task_queue) for w in simulation.states], dtype=int)
+    total_spawned_procs = np.zeros(len(simulation.states), dtype=int)
 
     # memory_coverage = [set(w.task_queue) for w in simulation.warriors]
     for t in tqdm(range(simargs.cycles), disable=not pbar):
         simulation.step()
 
-        nprocs = np.array([len(w.task_queue) for w in simulation.warriors], dtype=int)
+        nprocs = np.array([len(w.task_queue) for w in simulation.states], dtype=int)
 
         alive_flags = (nprocs>0).astype(int)
         n_alive = alive_flags.sum()
@@ -75,34 +106,498 @@ def run_single_round(simargs, warriors, seed, pbar=False):
         total_spawned_procs = total_spawned_procs + np.maximum(0, nprocs - prev_nprocs)
         prev_nprocs = nprocs
 
+        if simargs.early_exit and n_alive == 1 and len(warriors) > 1:
+            # the outcome is decided: the survivor gets 1/n_alive = 1 for every
+            # cycle it stays alive, so credit the rest of the round at once
+            i_survivor = int(np.argmax(alive_flags))
+            remaining = simargs.cycles - t - 1
+            if simargs.solo:
+                alive_cycles, spawned = run_solo(simulation, simulation.states[i_survivor], remaining)
+            else:
+                alive_cycles, spawned = remaining, 0
+            score[i_survivor] += alive_cycles / simargs.cycles
+            alive_score[i_survivor] += alive_cycles / simargs.cycles
+            total_spawned_procs[i_survivor] += spawned
+            break
+
         # memory_coverage = [mc.union(set(w.task_queue)) for mc, w in zip(memory_coverage, simulation.warriors)]
     # memory_coverage = np.array([len(mc) for mc in memory_coverage], dtype=int)
-    memory_coverage = np.array([cov.sum() for cov in simulation.warrior_cov.values()], dtype=int)
+    memory_coverage = np.array([w.coverage.sum() for w in simulation.states], dtype=int)
     score = score * len(warriors)
     outputs = dict(score=score, alive_score=alive_score, total_spawned_procs=total_spawned_procs, memory_coverage=memory_coverage)
     return outputs
 
-def run_multiple_rounds(simargs, warriors, n_processes=1, timeout=900):
-    try:
-        run_single_round_fn = partial(run_single_round, simargs, warriors)
+def run_resolved_round(simargs, payload, seed):
+    """run_single_round of the warriors of a task (see warrior_registry.resolve_warriors)."""
+    return run_single_round(simargs, resolve_warriors(payload), seed)
+
+def run_shared_round(simargs, names, results_handle, slot_seed):
+    """run_single_round for warriors of a WarriorRegistry, given by name. The outputs are
+    written into slot of the SharedResults with this handle instead of being returned."""
+    slot, seed = slot_seed
+    outputs = run_single_round(simargs, resolve_warriors(names), seed)
+    attach_results(*results_handle).write(slot, outputs)
+    return slot
+
+def run_battle_rounds(simargs, chunk):
+    """run_single_round of a chunk of (battle index, seed, warriors) tasks of EvaluationService.iter_battles,
+    returning (battle index, seed, outputs) of each. The warriors are resolved by warrior_registry.resolve_warriors."""
+    finished = []
+    for i_battle, seed, warriors in chunk:
+        finished.append((i_battle, seed, run_single_round(simargs, resolve_warriors(warriors), seed)))
+    return finished
+
+def run_solo(simulation, warrior, cycles):
+    """Keep stepping a simulation where only `warrior` (a WarriorState) is alive, for at most
+    `cycles` cycles. Returns the number of cycles it stayed alive and the
+    number of processes it spawned."""
+    task_queue = warrior.task_queue
+    prev_nprocs, spawned = len(task_queue), 0
+    for t in range(cycles):
+        simulation.step()
+        nprocs = len(task_queue)
+        if nprocs == 0:
+            return t, spawned
+        spawned += max(0, nprocs - prev_nprocs)
+        prev_nprocs = nprocs
+    return cycles, spawned
+
+def run_batched_rounds(simargs, warriors, seeds=None, pbar=False):
+    """Run all rounds of a matchup in lockstep on a BatchMARS, one round per
+    seed. Produces the same outputs as running run_single_round for every seed,
+    with shape (len(warriors), len(seeds)). Finished rounds are masked out."""
+    if simargs.legacy_core:
+        raise ValueError("BatchMARS stores fields modulo the core size, it cannot simulate the legacy Core")
+    seeds = list(range(simargs.rounds)) if seeds is None else list(seeds)
+    batch = BatchMARS.from_seeds(warriors, seeds, size=simargs.size, minimum_separation=simargs.distance,
+                                 max_processes=simargs.processes)
+    n_rounds, n_warriors = len(seeds), len(warriors)
+    score = np.zeros((n_rounds, n_warriors), dtype=float)
+    alive_score = np.zeros((n_rounds, n_warriors), dtype=float)
+    total_spawned_procs = np.zeros((n_rounds, n_warriors), dtype=int)
+    prev_nprocs = batch.nprocs().copy()
+
+    running = np.ones(n_rounds, dtype=bool) # rounds still being simulated
+    solo = np.zeros(n_rounds, dtype=bool) # rounds where only the survivor is simulated (simargs.solo)
+    survivor = np.zeros(n_rounds, dtype=int)
+    alive_cycles = np.zeros(n_rounds, dtype=int) # cycles alive of the survivor after an early exit
+    spawned = np.zeros(n_rounds, dtype=int) # processes spawned by the survivor after an early exit
+    rows = np.arange(n_rounds)
+
+    for t in tqdm(range(simargs.cycles), disable=not pbar):
+        batch.step(running)
+        nprocs = batch.nprocs()
+
+        # solo rounds: same bookkeeping as run_solo
+        s = np.flatnonzero(running & solo)
+        if len(s):
+            n = nprocs[s, survivor[s]]
+            running[s[n == 0]] = False
+            s, n = s[n > 0], n[n > 0]
+            alive_cycles[s] += 1
+            spawned[s] += np.maximum(0, n - prev_nprocs[s, survivor[s]])
+            prev_nprocs[s, survivor[s]] = n
+
+        # regular rounds: same bookkeeping as run_single_round
+        r = np.flatnonzero(running & ~solo)
+        if len(r):
+            alive_flags = (nprocs[r] > 0).astype(int)
+            n_alive = alive_flags.sum(axis=1)
+            running[r[n_alive == 0]] = False
+            r, alive_flags, n_alive = r[n_alive > 0], alive_flags[n_alive > 0], n_alive[n_alive > 0]
+            score[r] += (alive_flags * (1./n_alive[:, None])) / simargs.cycles
+            alive_score[r] += alive_flags / simargs.cycles
+            total_spawned_procs[r] += np.maximum(0, nprocs[r] - prev_nprocs[r])
+            prev_nprocs[r] = nprocs[r]
+
+            if simargs.early_exit and n_warriors > 1:
+                decided = n_alive == 1
+                r, alive_flags = r[decided], alive_flags[decided]
+                survivor[r] = np.argmax(alive_flags, axis=1)
+                if simargs.solo:
+                    solo[r] = True
+                else:
+                    alive_cycles[r] = simargs.cycles - t - 1
+                    running[r] = False
+        if not running.any():
+            break
+
+    # credit the survivors of early exits
+    decided = (alive_cycles > 0) | solo
+    score[rows[decided], survivor[decided]] += alive_cycles[decided] / simargs.cycles
+    alive_score[rows[decided], survivor[decided]] += alive_cycles[decided] / simargs.cycles
+    total_spawned_procs[rows[decided], survivor[decided]] += spawned[decided]
+
+    memory_coverage = batch.coverage.sum(axis=-1)
+    score = score * n_warriors
+    outputs = dict(score=score, alive_score=alive_score, total_spawned_procs=total_spawned_procs, memory_coverage=memory_coverage)
+    return {k: v.T for k, v in outputs.items()} # shape: (len(warriors), len(seeds))
+
+class EvaluationService:
+    """A long-lived pool of evaluation workers, shared by every battle of a run.
+    The pool is started on first use and reused until close(). If a battle
+    times out, its workers may still be busy, so the pool is restarted, and
+    the rounds that other battles still wait for are submitted again.
+    With a cache (see battle_cache.BattleCache), rounds that were already
+    simulated are read back instead of being simulated again. With shared,
+    warriors and outputs go through shared memory (see warrior_registry)
+    instead of being pickled with every round. The methods simulating battles
+    take opponents, an OpponentBundle (see warrior_registry) whose warriors
+    play every battle after the given ones, sent to the workers only once."""
+    def __init__(self, n_processes=1, cache=None, shared=False):
+        self.n_processes = n_processes
+        self.cache = cache
+        self.registry = WarriorRegistry() if shared else None
+        self.pool = None
+        # the rounds submitted by submit_async: asyncio future -> (fn, args, its number in submission order)
+        self.tasks = {}
+        # processes take rounds in submission order, so a round is running once fewer than n_processes
+        # rounds submitted before it are unfinished. Counts of the rounds submitted to the current pool
+        self.n_submitted, self.n_started, self.n_finished = 0, 0, 0
+        self.n_restarts = 0
+        self.wakeup = None # asyncio future resolved when rounds start running
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = Pool(processes=self.n_processes)
+        return self.pool
+
+    def restart(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        self.n_submitted, self.n_started, self.n_finished = 0, 0, 0
+        self.n_restarts += 1
+        # the rounds other battles wait for died with the pool, run them again
+        for future, (fn, args, _) in list(self.tasks.items()):
+            if not future.done() and not future.get_loop().is_closed():
+                self.apply_async(future, fn, args)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+        if self.registry is not None:
+            self.registry.close()
+
+    def payload(self, warriors, opponents=None):
+        """What the tasks of a battle carry for its warriors: the warriors or their names in the registry, then the handle of opponents."""
+        payload = [self.registry.register(w) for w in warriors] if self.registry is not None else list(warriors)
+        return payload + [opponents.handle] if opponents is not None else payload
+
+    def cache_keys(self, simargs, warriors, seeds, opponents=None):
+        return self.cache.keys(simargs, warriors, seeds, opponents.hashes if opponents is not None else ())
+
+    def simulate_rounds(self, simargs, warriors, seeds, timeout=900, batched=False, opponents=None):
+        """Simulate one round per seed. Returns a list of per-round outputs."""
+        if batched:
+            outputs = run_batched_rounds(simargs, battle_warriors(warriors, opponents), seeds=seeds)
+            return [{k: v[:, i] for k, v in outputs.items()} for i in range(len(seeds))]
+        payload = self.payload(warriors, opponents)
+        if self.registry is not None:
+            results = self.registry.results(len(seeds), len(battle_warriors(warriors, opponents)))
+            try:
+                run_shared_round_fn = partial(run_shared_round, simargs, payload, results.handle)
+                self.get_pool().map_async(run_shared_round_fn, enumerate(seeds)).get(timeout=timeout)
+                return [results.read(slot) for slot in range(len(seeds))]
+            finally:
+                results.unlink()
+        run_single_round_fn = partial(run_resolved_round, simargs, payload)
+        result = self.get_pool().map_async(run_single_round_fn, seeds)
+        return result.get(timeout=timeout)  # Timeout in seconds
+
+    def iter_rounds(self, simargs, warriors, seeds, timeout=900, batched=False, opponents=None):
+        """Simulate one round per seed, yielding (seed, outputs) as rounds finish.
+        At most n_processes rounds are in flight, so a consumer that stops early
+        does not pay for the rounds it never asked for."""
+        deadline = time.time() + timeout
+        seeds = list(seeds)
+        if batched:
+            for i in range(0, len(seeds), self.n_processes):
+                wave = seeds[i:i+self.n_processes]
+                yield from zip(wave, self.simulate_rounds(simargs, warriors, wave, batched=True, opponents=opponents))
+            return
+        pool = self.get_pool()
+        payload = self.payload(warriors, opponents)
+        if self.registry is not None:
+            results = self.registry.results(len(seeds), len(battle_warriors(warriors, opponents)))
+            task = partial(run_shared_round, simargs, payload, results.handle)
+            args = enumerate(seeds) # tasks return their slot
+        else:
+            results = None
+            task = partial(run_resolved_round, simargs, payload)
+            args = seeds # tasks return their outputs
+        finished = queue.SimpleQueue()
+        pending = iter(args)
+        def submit():
+            for arg in pending:
+                pool.apply_async(task, (arg,),
+                                 callback=lambda o, arg=arg: finished.put((arg, o)),
+                                 error_callback=lambda e: finished.put((None, e)))
+                return 1
+            return 0
+        try:
+            in_flight = sum(submit() for _ in range(self.n_processes))
+            while in_flight > 0:
+                try:
+                    arg, output = finished.get(timeout=max(0., deadline - time.time()))
+                except queue.Empty:
+                    raise multiprocessing.TimeoutError
+                if isinstance(output, BaseException):
+                    raise output
+                in_flight += submit() - 1
+                if results is not None:
+                    slot, seed = arg
+                    yield seed, results.read(slot)
+                else:
+                    yield arg, output
+        finally:
+            if results is not None:
+                results.unlink()
+
+    def run_multiple_rounds(self, simargs, warriors, timeout=900, batched=False, stop=None, opponents=None):
+        """Simulate simargs.rounds rounds. If stop is given, rounds are streamed and
+        stop(outputs, n_left) is called after each one with the outputs of the rounds
+        finished so far; once it returns True the battle ends early and only the
+        finished rounds are returned."""
+        try:
+            seeds = list(range(simargs.rounds))
+            finished, missing = {}, seeds
+            if self.cache is not None:
+                keys = dict(zip(seeds, self.cache_keys(simargs, warriors, seeds, opponents)))
+                cached = self.cache.get_many(list(keys.values()))
+                finished = {seed: cached[key] for seed, key in keys.items() if key in cached}
+                missing = [seed for seed in seeds if seed not in finished]
+            new = {}
+            if missing and stop is None:
+                new = dict(zip(missing, self.simulate_rounds(simargs, warriors, missing, timeout=timeout, batched=batched, opponents=opponents)))
+            elif missing:
+                for seed, output in self.iter_rounds(simargs, warriors, missing, timeout=timeout, batched=batched, opponents=opponents):
+                    new[seed] = output
+                    if stop(stack_rounds({**finished, **new}), len(missing) - len(new)):
+                        break
+            if self.cache is not None and new:
+                self.cache.put_many({keys[seed]: output for seed, output in new.items()})
+            finished.update(new)
+            return stack_rounds(finished) # shape: (len(warriors), number of finished rounds)
+        except multiprocessing.TimeoutError:
+            print(f"Timed out after {timeout}s, restarting the evaluation pool")
+            self.restart()
+            return None
+        except Exception as e:
+            print(e)
+            return None
+
+    def iter_battles(self, simargs, battles, timeout=900, batched=False, chunksize=None, opponents=None):
+        """Simulate simargs.rounds rounds of every battle (a list of warriors, the evaluated one first),
+        yielding (i_battle, outputs) as battles finish, outputs as returned by run_multiple_rounds.
+        The rounds of all battles go through the pool as one stream of (battle, seed) tasks, in chunks
+        of chunksize (by default a quarter of the tasks per process), so that every process stays busy
+        and stragglers are picked up by idle ones. If the stream times out or fails, the unfinished
+        battles are yielded with None."""
+        if batched:
+            for i_battle, warriors in enumerate(battles):
+                yield i_battle, self.run_multiple_rounds(simargs, warriors, timeout=timeout, batched=True, opponents=opponents)
+            return
         seeds = list(range(simargs.rounds))
-        # print("Launching pool")
-        with Pool(processes=n_processes) as pool:
-            # outputs = pool.map(run_single_round_fn, seeds)
-            result = pool.map_async(run_single_round_fn, seeds)
-            # print("Blocking and waiting for results")
-            outputs = result.get(timeout=timeout)  # Timeout in seconds
-        outputs = {k: np.stack([o[k] for o in outputs], axis=-1) for k in outputs[0].keys()}
-        # print("Got results!")
-        return outputs # shape: (len(warriors), simargs.rounds)
-    except Exception as e:
-        print(e)
-        return None
+        finished = [{} for _ in battles]
+        keys = None
+        if self.cache is not None:
+            keys = [dict(zip(seeds, self.cache_keys(simargs, warriors, seeds, opponents))) for warriors in battles]
+            for i_battle, battle_keys in enumerate(keys):
+                cached = self.cache.get_many(list(battle_keys.values()))
+                finished[i_battle] = {seed: cached[key] for seed, key in battle_keys.items() if key in cached}
+        for i_battle in range(len(battles)):
+            if len(finished[i_battle]) == len(seeds):
+                yield i_battle, stack_rounds(finished[i_battle])
+        if self.registry is not None and len({id(w) for ws in battles for w in ws}) <= self.registry.blocks.capacity:
+            payloads = [self.payload(warriors, opponents) for warriors in battles]
+        else:
+            payloads = [list(warriors) + ([opponents.handle] if opponents is not None else []) for warriors in battles]
+        tasks = [(i_battle, seed, payloads[i_battle]) for i_battle in range(len(battles))
+                 for seed in seeds if seed not in finished[i_battle]]
+        if not tasks:
+            return
+        chunksize = chunksize or max(1, len(tasks) // (4 * self.n_processes))
+        deadline = time.time() + timeout
+        try:
+            chunks = [tasks[i:i+chunksize] for i in range(0, len(tasks), chunksize)]
+            results = self.get_pool().imap_unordered(partial(run_battle_rounds, simargs), chunks)
+            for _ in range(len(chunks)):
+                for i_battle, seed, output in results.next(timeout=max(0., deadline - time.time())):
+                    finished[i_battle][seed] = output
+                    if len(finished[i_battle]) == len(seeds):
+                        if self.cache is not None:
+                            self.cache.put_many({keys[i_battle][seed]: output for seed, output in finished[i_battle].items()})
+                        yield i_battle, stack_rounds(finished[i_battle])
+        except multiprocessing.TimeoutError:
+            print(f"Timed out after {timeout}s, restarting the evaluation pool")
+            self.restart()
+            unfinished = {i_battle for i_battle, _, _ in tasks if len(finished[i_battle]) < len(seeds)}
+            yield from ((i_battle, None) for i_battle in sorted(unfinished))
+        except Exception as e:
+            print(e)
+            unfinished = {i_battle for i_battle, _, _ in tasks if len(finished[i_battle]) < len(seeds)}
+            yield from ((i_battle, None) for i_battle in sorted(unfinished))
+
+    def run_battles(self, simargs, battles, timeout=900, batched=False, chunksize=None, opponents=None):
+        """iter_battles, returning the list of outputs of every battle (None for those that failed)."""
+        outputs = [None] * len(battles)
+        for i_battle, output in self.iter_battles(simargs, battles, timeout=timeout, batched=batched, chunksize=chunksize, opponents=opponents):
+            outputs[i_battle] = output
+        return outputs
+
+    def submit_async(self, fn, *args):
+        """Runs fn(*args) in the pool, returning an asyncio future of its result.
+        Cancel the future to abandon the round: it is then not run again by restart."""
+        future = asyncio.get_running_loop().create_future()
+        self.apply_async(future, fn, args)
+        future.add_done_callback(lambda future: self.tasks.pop(future, None))
+        # rounds of abandoned battles may fail unawaited, do not warn about them
+        future.add_done_callback(lambda future: future.cancelled() or future.exception())
+        return future
+
+    def apply_async(self, future, fn, args):
+        loop, n_restarts = future.get_loop(), self.n_restarts
+        def resolve(set_result, value):
+            # called by the result thread of the pool
+            def set_value():
+                if n_restarts == self.n_restarts: # else the round was counted in an earlier pool
+                    self.n_finished += 1
+                    self.start_rounds()
+                if not future.done():
+                    set_result(value)
+            try:
+                loop.call_soon_threadsafe(set_value)
+            except RuntimeError: # the event loop is closed
+                pass
+        self.tasks[future] = (fn, args, self.n_submitted)
+        self.n_submitted += 1
+        self.start_rounds()
+        self.get_pool().apply_async(fn, args, callback=lambda result: resolve(future.set_result, result),
+                                    error_callback=lambda e: resolve(future.set_exception, e))
+
+    def start_rounds(self):
+        n_started = min(self.n_submitted, self.n_finished + self.n_processes)
+        if n_started > self.n_started:
+            self.n_started = n_started
+            if self.wakeup is not None and not self.wakeup.done():
+                self.wakeup.set_result(None)
+
+    def started(self, futures):
+        """Whether one of the rounds of futures, submitted by submit_async, is running."""
+        return any(self.tasks[future][2] < self.n_started for future in futures if future in self.tasks)
+
+    async def wait_rounds(self, futures, clock, timeout):
+        """Waits for the first of futures, rounds of one battle submitted by submit_async, to finish. Returns the
+        futures done and the clock of the battle: None until one of its rounds starts running, then the time it
+        did and n_restarts. The battle times out timeout seconds after, unless the pool was restarted since."""
+        loop = asyncio.get_running_loop()
+        while True:
+            if clock is not None and clock[1] != self.n_restarts:
+                clock = None # its rounds were submitted again, to a new pool
+            if clock is None and self.started(futures):
+                clock = (time.time(), self.n_restarts)
+            if clock is None:
+                if self.wakeup is None or self.wakeup.done() or self.wakeup.get_loop() is not loop:
+                    self.wakeup = loop.create_future()
+                wakeup = self.wakeup
+                done, _ = await asyncio.wait([*futures, wakeup], return_when=asyncio.FIRST_COMPLETED)
+                done.discard(wakeup)
+                if done:
+                    return done, (time.time(), self.n_restarts)
+                continue
+            done, _ = await asyncio.wait(futures, timeout=max(0., clock[0] + timeout - time.time()), return_when=asyncio.FIRST_COMPLETED)
+            if done:
+                return done, clock
+            if clock[1] == self.n_restarts:
+                raise multiprocessing.TimeoutError
+
+    async def run_multiple_rounds_async(self, simargs, warriors, timeout=900, batched=False, stop=None, opponents=None):
+        """Awaitable run_multiple_rounds: the rounds run in the pool while the event loop goes on, so that
+        several battles and other coroutines (e.g. LLM requests) overlap. With stop, at most n_processes rounds
+        of this battle are in flight at once, as in iter_rounds. The timeout counts from when the first round of
+        the battle starts running, not while its rounds wait behind those of other battles."""
+        pending = {} # future -> seed of the rounds in flight
+        try:
+            seeds = list(range(simargs.rounds))
+            finished, missing = {}, seeds
+            if self.cache is not None:
+                keys = dict(zip(seeds, self.cache_keys(simargs, warriors, seeds, opponents)))
+                cached = self.cache.get_many(list(keys.values()))
+                finished = {seed: cached[key] for seed, key in keys.items() if key in cached}
+                missing = [seed for seed in seeds if seed not in finished]
+            new = {}
+            if missing and batched:
+                future = self.submit_async(partial(run_batched_rounds, seeds=missing), simargs, battle_warriors(warriors, opponents))
+                pending[future] = None
+                await self.wait_rounds(pending, None, timeout)
+                outputs = future.result()
+                new = {seed: {k: v[:, i] for k, v in outputs.items()} for i, seed in enumerate(missing)}
+            elif missing:
+                payload = self.payload(warriors, opponents)
+                todo = iter(missing)
+                def submit():
+                    for seed in todo:
+                        pending[self.submit_async(run_battle_rounds, simargs, [(0, seed, payload)])] = seed
+                        return
+                for _ in range(len(missing) if stop is None else self.n_processes):
+                    submit()
+                clock, stopped = None, False
+                while pending and not stopped:
+                    done, clock = await self.wait_rounds(pending, clock, timeout)
+                    for future in done:
+                        seed = pending.pop(future)
+                        [(_, _, new[seed])] = future.result()
+                        if stop is not None and stop(stack_rounds({**finished, **new}), len(missing) - len(new)):
+                            stopped = True
+                            break
+                        submit()
+            if self.cache is not None and new:
+                self.cache.put_many({keys[seed]: output for seed, output in new.items()})
+            finished.update(new)
+            return stack_rounds(finished) # shape: (len(warriors), number of finished rounds)
+        except multiprocessing.TimeoutError:
+            print(f"Timed out after {timeout}s, restarting the evaluation pool")
+            for future in pending:
+                future.cancel()
+            self.restart()
+            return None
+        except Exception as e:
+            print(e)
+            return None
+        finally:
+            for future in pending: # rounds of a battle that stopped early are not run again by restart
+                future.cancel()
+
+def battle_warriors(warriors, opponents=None):
+    """The warriors of a battle: warriors, followed by those of an OpponentBundle."""
+    return list(warriors) + opponents.warriors if opponents is not None else list(warriors)
+
+def stack_rounds(outputs):
+    """Stacks a dict seed -> per-round outputs into arrays of shape (len(warriors), len(outputs)), in seed order."""
+    seeds = sorted(outputs)
+    return {k: np.stack([outputs[seed][k] for seed in seeds], axis=-1) for k in outputs[seeds[0]].keys()}
+
+def run_multiple_rounds(simargs, warriors, n_processes=1, timeout=900, batched=False):
+    with EvaluationService(n_processes) as service:
+        return service.run_multiple_rounds(simargs, warriors, timeout=timeout, batched=batched)
 
 def parse_warrior_from_file(simargs, file):
     environment = simargs_to_environment(simargs)
     with open(file, encoding="latin1") as f:
         warrior_str = f.read()
-    warrior = redcode.parse(warrior_str.split("\n"), environment)
+    warrior = parse_cached(warrior_str, environment)
     return warrior_str, warrior
 
@@ -9,7 +9,8 @@ import os
 import psutil
 import copy
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
+from functools import partial
 import tyro
 import asyncio
 from tqdm.auto import tqdm
@@ -17,9 +18,17 @@ from collections import defaultdict
 
 from llm_corewar import CorewarGPT, GPTWarrior
 
-from corewar_util import SimulationArgs, simargs_to_environment, parse_warrior_from_file, run_multiple_rounds
+from corewar_util import SimulationArgs, simargs_to_environment, parse_warrior_from_file, EvaluationService
 from corewar import MARS, Warrior
 import util
+from battle_cache import BattleCache, battle_hash
+from warrior_registry import OUTPUT_DTYPES, OpponentBundle
+from corewar.prescreen import dead_on_arrival
+from parse_cache import use_parse_cache
+from warrior_library import read_warriors
+from run_journal import RunJournal
+from checkpoint import Checkpointer
+from phenotype_store import PhenotypeStore
 
 @dataclass
 class Args:
@@ -28,19 +37,26 @@ class Args:
     save_dir: str | None = None
     n_processes: int = 24
     resume: bool | None = False # resume training from save_dir if it exists
+    journal: bool = True # record the run in an append-only journal in save_dir instead of re-pickling it on every save (see run_journal.py)
+    snapshot_every: int = 100 # with journal, snapshot the archives every this many iterations
     job_timeout: int = 24 * 60 * 60 # entire job timeout in seconds
 
     # Core War arguments
     simargs: SimulationArgs = field(default_factory=SimulationArgs) # Simulation arguments
     timeout: int = 900 # timeout for each simulation in seconds
+    batched: bool | None = False # run all rounds of a battle in lockstep on one core (BatchMARS) instead of a pool, requires --simargs.legacy_core False
+    cache_path: str | None = None # sqlite file caching the outputs of every simulated round, shared across runs
+    shared_memory: bool | None = False # send warriors and outputs to the pool through shared memory instead of pickling them
+    parse_cache_path: str | None = None # sqlite file caching parsed warriors by source, shared across runs
 
     # DRQ arguments
-    initial_opps: list[str] = field(default_factory=list) # list of initial opponents
+    initial_opps: list[str] = field(default_factory=list) # list of initial opponents, .red files or .cwl warrior libraries
     n_rounds: int = 10 # number of ruonds of DRQ
     n_iters: int = 100 # iterations of evolution per round
     log_every: int = 10 # log every n iterations
     last_k_opps: int | None = None # number of previous rounds' champions to use for current round
     sample_new_percent: float = 0.1 # probability of sampling a new warrior from LLM
+    sample_weighting: str = "uniform" # how parents are sampled from the archive: uniform, fitness or novelty (see MapElites.sample)
     bc_axes: str = "tsp,mc" # comma separated list of two bc axes to use
     # crossover_prob: float = 0.0 # probability of crossover
     warmup_with_init_opps: bool | None = False
@@ -49,6 +65,13 @@ class Args:
     n_mutate: int = 1 # number of mutated warriors
     fitness_threshold: float = 0.8 # if this fitness is not reached, continue to next round
     single_cell: bool | None = False # for testing: only use one cell in map elites
+    fidelities: str | None = None # comma separated rounds:cycles screening levels run before the full evaluation, e.g. "2:8000,8:40000"
+    promote_margin: float = 0.1 # a screened warrior is promoted if its fitness is within this margin of the occupant of its cell
+    race: bool | None = False # stop evaluating a warrior once it can no longer beat the occupant of its cell
+    race_delta: float | None = None # confidence of the Hoeffding bound on the remaining rounds in a race, None uses the worst case
+    prescreen: bool = True # give warriors certain to die on their first step their outcome without simulating them, only without --simargs.legacy_core
+    llm_in_flight: int = 0 # if > 0, overlap LLM requests and evaluations: at most this many steps wait for the LLM at once
+    evals_in_flight: int = 2 # with llm_in_flight, at most this many steps are evaluated at once
 
     # LLM arguments
     gpt_model: str = "gpt-4.1-mini-2025-04-14" # The GPT model to use
@@ -58,33 +81,144 @@ class Args:
     mutate_prompt: str = os.path.expanduser("./prompts/mutate_prompt_0.txt")
 
 class MapElites:
-    def __init__(self):
+    """
+    MAP-Elites archive over a grid of two bc axes. self.archive (bc -> phenotype) holds the elites. The grid holds the
+    fitness of the elite of every cell and the order in which the cells were first occupied, and the best cell, the
+    coverage and the QD score are kept up to date on every placement, so none of them scans the archive.
+    The grid grows if a bc falls outside of it. The history is kept compact in a PhenotypeStore, spilled to history_path.
+    """
+    def __init__(self, shape=(6, 6), history_path=None):
         self.archive = {} # bc -> phenotype
-        self.history = [] # list of phenotypes which were placed
+        self.history = PhenotypeStore(history_path) # phenotypes which were placed
 
         self.coverage_history = [] # history of coverage at every place step
         self.fitness_history = [] # history of best fitness in the archive at every place step
 
-    def sample(self):
-        random_key = random.choice(list(self.archive.keys()))
-        return self.archive[random_key]
+        self.grid_fitness = np.full(shape, -np.inf) # fitness of the elite of every cell
+        self.grid_order = np.full(shape, -1, dtype=np.int64) # index of every cell in self.cells, -1 if empty
+        self.cells = [] # the occupied cells, in the order they were first occupied (the order of self.archive)
+        self.best_cell = None
+        self.total_fitness = 0.0 # sum of the fitness of the elites
+
+    def __setstate__(self, state):
+        """Unpickling an older MapElites puts its history in a temporary file, until attach_history is called."""
+        self.__dict__.update(state)
+        if "grid_fitness" not in state: # pickled before the archive had a grid: rebuild it
+            archive, history = self.archive, self.history
+            coverage_history, fitness_history = self.coverage_history, self.fitness_history
+            self.__init__()
+            for phenotype in archive.values():
+                self.insert(phenotype)
+            self.history.extend(history)
+            self.coverage_history, self.fitness_history = coverage_history, fitness_history
+        elif not isinstance(self.history, PhenotypeStore): # pickled before the history was a PhenotypeStore
+            history, self.history = self.history, PhenotypeStore()
+            self.history.extend(history)
+        # pickled when the grid indexed a list of every elite
+        self.__dict__.pop("elites", None)
+        self.__dict__.pop("grid_index", None)
+
+    def attach_history(self, history_path):
+        """Moves the history to a PhenotypeStore at history_path, if it is not there already."""
+        if self.history.path != history_path:
+            history, self.history = self.history, PhenotypeStore(history_path)
+            self.history.extend(history)
+
+    def sample(self, weighting="uniform"):
+        """
+        An elite chosen uniformly among the occupied cells, or with weighting="fitness" in proportion to the rank of
+        its fitness (the worst has weight 1, the best the number of cells), or with weighting="novelty" in inverse
+        proportion to 1 + the number of occupied cells around its own, favoring the sparse regions of the archive.
+        """
+        if weighting == "uniform":
+            return self.archive[random.choice(self.cells)]
+        cells = np.array(self.cells)
+        if weighting == "fitness":
+            weights = np.argsort(np.argsort(self.grid_fitness[cells[:, 0], cells[:, 1]], kind="stable"), kind="stable") + 1.
+        elif weighting == "novelty":
+            occupied = np.pad(self.grid_order >= 0, 1).astype(np.int64)
+            h, w = self.grid_order.shape
+            neighbors = sum(occupied[1 + di:1 + di + h, 1 + dj:1 + dj + w] for di in (-1, 0, 1) for dj in (-1, 0, 1)) - occupied[1:-1, 1:-1]
+            weights = 1. / (1. + neighbors[cells[:, 0], cells[:, 1]])
+        else:
+            raise ValueError(f"Unknown weighting {weighting}")
+        return self.archive[self.cells[np.random.choice(len(cells), p=weights / weights.sum())]]
 
     def place(self, phenotype):
         place = (phenotype.bc is not None) and (phenotype.fitness is not None)
         place = place and ((phenotype.bc not in self.archive) or (phenotype.fitness > self.archive[phenotype.bc].fitness))
         if place:
-            self.archive[phenotype.bc] = phenotype
+            self.insert(phenotype)
         self.history.append(phenotype)
-        self.coverage_history.append(len(self.archive))
-        self.fitness_history.append(self.get_best().fitness if len(self.archive) > 0 else -np.inf)
+        self.coverage_history.append(self.coverage())
+        self.fitness_history.append(self.best_fitness())
         return place
-    
+
+    def insert(self, phenotype):
+        """Makes phenotype the elite of its cell."""
+        bc = phenotype.bc
+        if any(b >= n for b, n in zip(bc, self.grid_order.shape)):
+            self.grow(bc)
+        fitness = phenotype.fitness
+        if self.grid_order[bc] < 0:
+            self.grid_order[bc] = len(self.cells)
+            self.cells.append(bc)
+            self.total_fitness += fitness
+        else:
+            self.total_fitness += fitness - self.grid_fitness[bc]
+        self.grid_fitness[bc] = fitness
+        self.archive[bc] = phenotype
+        # as a cell's fitness only increases, the best is either the previous best or this cell (the first occupied on ties)
+        best = self.best_cell
+        if best is None or fitness > self.grid_fitness[best] or (fitness == self.grid_fitness[best] and self.grid_order[bc] < self.grid_order[best]):
+            self.best_cell = bc
+
+    def grow(self, bc):
+        shape = tuple(max(b + 1, n) for b, n in zip(bc, self.grid_order.shape))
+        pad = [(0, n - m) for n, m in zip(shape, self.grid_order.shape)]
+        self.grid_fitness = np.pad(self.grid_fitness, pad, constant_values=-np.inf)
+        self.grid_order = np.pad(self.grid_order, pad, constant_values=-1)
+
+    def copy(self, history=True):
+        """A copy sharing the phenotypes, which stays as it is while this one keeps changing. Without the history if not history."""
+        me = copy.copy(self)
+        me.archive, me.cells = dict(self.archive), list(self.cells)
+        me.grid_fitness, me.grid_order = self.grid_fitness.copy(), self.grid_order.copy()
+        me.history = self.history.copy() if history else PhenotypeStore(self.history.path)
+        me.coverage_history, me.fitness_history = list(self.coverage_history), list(self.fitness_history)
+        return me
+
     def get_best(self):
-        best_key, best_fitness = None, -np.inf
-        for k, v in self.archive.items():
-            if v.fitness > best_fitness:
-                best_key, best_fitness = k, v.fitness
-        return self.archive[best_key] if best_key in self.archive else None
+        return self.archive[self.best_cell] if self.best_cell is not None else None
+
+    def best_fitness(self):
+        return self.grid_fitness[self.best_cell].item() if self.best_cell is not None else -np.inf
+
+    def coverage(self):
+        """Number of occupied cells."""
+        return len(self.cells)
+
+    def qd_score(self, offset=0.):
+        """Sum over the occupied cells of the fitness of their elite minus offset."""
+        return self.total_fitness - offset * len(self.cells)
+
+def drive(battles, run_battle):
+    """Runs a generator of battles (see Main.processing), simulating each with run_battle. Returns its return value."""
+    try:
+        battle = next(battles)
+        while True:
+            battle = battles.send(run_battle(*battle))
+    except StopIteration as e:
+        return e.value
+
+async def drive_async(battles, run_battle_async):
+    """drive with an awaitable run_battle_async."""
+    try:
+        battle = next(battles)
+        while True:
+            battle = battles.send(await run_battle_async(*battle))
+    except StopIteration as e:
+        return e.value
 
 class Main:
     """
@@ -97,6 +231,8 @@ class Main:
         nproc_all = os.popen("nproc --all").read().strip()
         print(f"Number of cores: {nproc} / {nproc_all}")
 
+        if args.batched and args.simargs.legacy_core:
+            raise ValueError("BatchMARS stores fields modulo the core size, batched requires --simargs.legacy_core False")
         random.seed(args.seed)
         np.random.seed(args.seed)
 
@@ -112,17 +248,30 @@ class Main:
         self.corewar_gpt = CorewarGPT(args.gpt_model, system_prompt, new_warrior_prompt, mutate_warrior_prompt,
                                       temperature=args.temperature, environment=simargs_to_environment(args.simargs))
 
+        use_parse_cache(args.parse_cache_path)
         self.init_opps = []
-        for file in args.initial_opps:
-            warrior_str, warrior = parse_warrior_from_file(args.simargs, file)
+        for file, warrior_str, warrior in read_warriors(args.simargs, args.initial_opps):
             gpt_warrior = GPTWarrior(prompt=file, llm_response=warrior_str, warrior=warrior)
-            gpt_warrior.id = hashlib.sha256(gpt_warrior.llm_response.encode()).hexdigest()
+            # libraries built without sources are identified by the file each warrior came from
+            gpt_warrior.id = hashlib.sha256((warrior_str if warrior_str is not None else file).encode()).hexdigest()
             self.init_opps.append(gpt_warrior)
         print(f"Loaded {len(self.init_opps)} opponent warriors")
 
+        # screening levels (rounds, cycles) run before the full evaluation
+        self.fidelities = [tuple(int(x) for x in f.split(":")) for f in args.fidelities.split(",")] if args.fidelities else []
+        self.evaluation_service = EvaluationService(n_processes=args.n_processes, cache=BattleCache(args.cache_path) if args.cache_path else None,
+                                                  shared=args.shared_memory) # workers shared by the whole run
         self.timestamps = []
-        self.all_rounds_map_elites = {i_round: MapElites() for i_round in range(self.args.n_rounds)} # map elites of each round
+        self.all_rounds_map_elites = {i_round: MapElites(history_path=self.history_path(i_round)) for i_round in range(self.args.n_rounds)} # map elites of each round
+        self.evaluated = {} # i_round -> canonical_id -> (outputs, fitness, bc, fidelity) of the warriors evaluated this round
+        self.opponents = {} # i_round -> OpponentBundle of the opponents of this round
+        self.checkpointer = Checkpointer() if args.save_dir is not None else None # writes the saves in the background
+        self.journal = RunJournal(args.save_dir, self.checkpointer) if args.journal and args.save_dir is not None else None
     
+    def history_path(self, i_round):
+        """File the bulky fields of the history of round i_round spill to, a temporary file without save_dir."""
+        return f"{self.args.save_dir}/history_{i_round:03d}.bin" if self.args.save_dir is not None else None
+
     def get_fitness(self, phenotype):
         return phenotype.outputs["score"].item()
 
@@ -161,68 +310,318 @@ class Main:
         # print(f"bc1: {bc1}, bc2: {bc2}")
         return (bc1, bc2)
 
-    def process_warrior(self, i_round, gpt_warrior):
-        gpt_warrior = copy.deepcopy(gpt_warrior)
-        map_elites = self.all_rounds_map_elites[i_round]
+    def get_opps(self, i_round):
         # print(f"Processing with {list(range(i_round))} prev champs")
         prev_champs = [self.all_rounds_map_elites[i].get_best() for i in range(i_round)]
         # print([p is None for p in prev_champs])
         prev_champs = prev_champs[-self.args.last_k_opps:] if self.args.last_k_opps is not None else prev_champs
         # print("processing with previous champions:")
         # print([f"{pc.warrior.name}, {pc.fitness}" for pc in prev_champs])
+        return self.init_opps + prev_champs
+
+    def get_opponents(self, i_round):
+        """
+        The opponents of round i_round (get_opps) as an OpponentBundle, built when the round is first asked for:
+        they are fixed during a round, so every battle of the round shares it and the workers receive it once.
+        """
+        if i_round not in self.opponents:
+            for bundle in self.opponents.values():
+                bundle.close()
+            opps = self.get_opps(i_round)
+            self.opponents = {i_round: OpponentBundle([w.warrior for w in opps], self.args.simargs)}
+        return self.opponents[i_round]
+
+    def get_evaluated(self, i_round):
+        """canonical_id -> (outputs, fitness, bc, fidelity) of the warriors evaluated in round i_round."""
+        if i_round not in self.evaluated:
+            self.evaluated = {i_round: {}}
+        return self.evaluated[i_round]
+
+    def process_warriors(self, i_round, gpt_warriors):
+        """
+        process_warrior for every warrior. Without screening levels or racing, the evaluation of a warrior
+        does not depend on the archive, so the battles of all of them are simulated together first,
+        as one stream of (battle, seed) rounds (see EvaluationService.iter_battles).
+        """
+        if not self.fidelities and not self.args.race and len(gpt_warriors) > 1:
+            opponents = self.get_opponents(i_round)
+            evaluated = self.get_evaluated(i_round)
+            battles = {}
+            for gpt_warrior in gpt_warriors:
+                if gpt_warrior.warrior is None:
+                    continue
+                canonical_id = battle_hash(gpt_warrior.warrior, self.args.simargs)
+                if canonical_id not in evaluated and not (self.args.prescreen and self.dead_on_arrival([gpt_warrior.warrior, *opponents.warriors])):
+                    battles[canonical_id] = (gpt_warrior, [gpt_warrior.warrior])
+            outputs = self.evaluation_service.run_battles(self.args.simargs, [warriors for _, warriors in battles.values()],
+                                                          timeout=self.args.timeout * len(battles), batched=self.args.batched, opponents=opponents)
+            for (canonical_id, (gpt_warrior, _)), battle_outputs in zip(battles.items(), outputs):
+                if battle_outputs is not None: # the others are evaluated again by process_warrior
+                    phenotype = copy.copy(gpt_warrior)
+                    self.set_outputs(phenotype, battle_outputs, self.args.simargs)
+                    evaluated[canonical_id] = (phenotype.outputs, phenotype.fitness, phenotype.bc, phenotype.fidelity)
+        for gpt_warrior in gpt_warriors:
+            self.process_warrior(i_round, gpt_warrior)
+
+    def process_warrior(self, i_round, gpt_warrior):
+        drive(self.processing(i_round, gpt_warrior), self.run_battle)
+
+    async def process_warrior_async(self, i_round, gpt_warrior):
+        await drive_async(self.processing(i_round, gpt_warrior), self.run_battle_async)
 
+    async def process_warriors_async(self, i_round, gpt_warriors):
+        """process_warriors without blocking the event loop. Unless screening levels or racing make the
+        evaluations depend on the archive, the warriors are evaluated concurrently."""
+        if not self.fidelities and not self.args.race:
+            await asyncio.gather(*[self.process_warrior_async(i_round, w) for w in gpt_warriors])
+        else:
+            for gpt_warrior in gpt_warriors:
+                await self.process_warrior_async(i_round, gpt_warrior)
+
+    def run_battle(self, simargs, warriors, opponents, stop):
+        return self.evaluation_service.run_multiple_rounds(simargs, warriors, timeout=self.args.timeout, batched=self.args.batched,
+                                                           stop=stop, opponents=opponents)
+
+    async def run_battle_async(self, simargs, warriors, opponents, stop):
+        return await self.evaluation_service.run_multiple_rounds_async(simargs, warriors, timeout=self.args.timeout, batched=self.args.batched,
+                                                                       stop=stop, opponents=opponents)
+
+    def processing(self, i_round, gpt_warrior):
+        """
+        Evaluates a copy of gpt_warrior and places it in the archive of round i_round. A generator yielding the
+        battles to simulate, (simargs, warriors, opponents, stop) as taken by run_battle, and sent their outputs (see drive).
+        """
+        gpt_warrior = copy.copy(gpt_warrior) # its fields are replaced, never modified in place
+        map_elites = self.all_rounds_map_elites[i_round]
         if gpt_warrior.warrior is None:
             gpt_warrior.bc, gpt_warrior.fitness = None, -np.inf
         else:
-            opps = self.init_opps + prev_champs
-            warriors = [w.warrior for w in [gpt_warrior, *opps]]
-            outputs = run_multiple_rounds(self.args.simargs, warriors, n_processes=self.args.n_processes, timeout=self.args.timeout)
+            # the opponents are fixed during a round, so an equivalent warrior evaluated earlier in it
+            # played the same rounds. Its archive cell only got harder to enter since then.
+            gpt_warrior.canonical_id = battle_hash(gpt_warrior.warrior, self.args.simargs)
+            evaluated = self.get_evaluated(i_round)
+            if gpt_warrior.canonical_id in evaluated:
+                outputs, gpt_warrior.fitness, gpt_warrior.bc, gpt_warrior.fidelity = evaluated[gpt_warrior.canonical_id]
+                gpt_warrior.outputs = dict(outputs)
+            elif (yield from self.evaluation(map_elites, gpt_warrior, self.get_opponents(i_round))):
+                evaluated[gpt_warrior.canonical_id] = (gpt_warrior.outputs, gpt_warrior.fitness, gpt_warrior.bc, gpt_warrior.fidelity)
+        map_elites.place(gpt_warrior)
+
+    def evaluation(self, map_elites, gpt_warrior, opponents):
+        """
+        Sets the outputs, fitness, bc and fidelity of gpt_warrior against opponents (an OpponentBundle), through the
+        screening levels and, if promoted and not raced out, the full evaluation. Returns False if a simulation timed out.
+        A generator of battles, as processing.
+        """
+        warriors = [gpt_warrior.warrior]
+        if self.args.prescreen and self.dead_on_arrival([gpt_warrior.warrior, *opponents.warriors]):
+            # it scores nothing, spawns nothing and covers no cell in every round
+            gpt_warrior.outputs = {k: np.float64(0.) for k in OUTPUT_DTYPES}
+            gpt_warrior.fitness = self.get_fitness(gpt_warrior)
+            gpt_warrior.bc = self.get_bc_features(gpt_warrior)
+            gpt_warrior.fidelity = (self.args.simargs.rounds, self.args.simargs.cycles)
+            return True
+        # cheap screening levels first, then the full evaluation
+        levels = [replace(self.args.simargs, rounds=rounds, cycles=cycles) for rounds, cycles in self.fidelities]
+        for simargs in levels + [self.args.simargs]:
+            stop = partial(self.race_lost, map_elites, gpt_warrior) if self.args.race else None
+            outputs = yield simargs, warriors, opponents, stop
             if outputs is None:
                 gpt_warrior.bc, gpt_warrior.fitness = None, -np.inf
-            else:
-                gpt_warrior.outputs = {k: v.mean(axis=-1)[0] for k, v in outputs.items()}
-                gpt_warrior.fitness = self.get_fitness(gpt_warrior)
-                # gpt_warrior.fitness = self.get_fitness(gpt_warrior) * len(warriors) # normalize the fitness by the number of opponents
-                gpt_warrior.bc = self.get_bc_features(gpt_warrior)
-                # print(f"Processed Warrrior {gpt_warrior.warrior.name} with fitness {gpt_warrior.fitness} and bc {gpt_warrior.bc}")
-        map_elites.place(gpt_warrior)
+                return False
+            self.set_outputs(gpt_warrior, outputs, simargs)
+            if outputs["score"].shape[-1] < simargs.rounds: # lost the race
+                break
+            if not self.should_promote(map_elites, gpt_warrior):
+                break
+        return True
+
+    def set_outputs(self, gpt_warrior, outputs, simargs):
+        """Sets the outputs, fitness, bc and fidelity of gpt_warrior from the outputs of its rounds with simargs."""
+        gpt_warrior.outputs = {k: v.mean(axis=-1)[0] for k, v in outputs.items()}
+        gpt_warrior.fitness = self.get_fitness(gpt_warrior)
+        # gpt_warrior.fitness = self.get_fitness(gpt_warrior) * len(warriors) # normalize the fitness by the number of opponents
+        gpt_warrior.bc = self.get_bc_features(gpt_warrior)
+        gpt_warrior.fidelity = (outputs["score"].shape[-1], simargs.cycles)
+        # print(f"Processed Warrrior {gpt_warrior.warrior.name} with fitness {gpt_warrior.fitness} and bc {gpt_warrior.bc}")
+
+    def dead_on_arrival(self, warriors):
+        """Whether the first of warriors is certain to die on its first step (see corewar.prescreen),
+        which requires every warrior to fit in its share of the core with the minimum separation.
+        corewar.prescreen follows the fields modulo the core size, so it is not used with the legacy Core."""
+        simargs = self.args.simargs
+        if simargs.legacy_core:
+            return False
+        if any(len(w) + simargs.distance > simargs.size // len(warriors) for w in warriors):
+            return False
+        return dead_on_arrival(warriors[0], simargs.size, simargs.distance) is not None
+
+    def should_promote(self, map_elites, phenotype):
+        """
+        Whether a screened phenotype could plausibly enter its archive cell: the cell is empty,
+        or its screened fitness is within promote_margin of the occupant's fitness.
+        """
+        incumbent = map_elites.archive.get(phenotype.bc)
+        return incumbent is None or phenotype.fitness + self.args.promote_margin >= incumbent.fitness
+
+    def race_lost(self, map_elites, gpt_warrior, outputs, n_left):
+        """
+        Whether a partially evaluated warrior can no longer enter the cell its finished rounds place it in,
+        or its round is already solved (the best fitness of map_elites passed fitness_threshold).
+        The mean score of the n_left remaining rounds is bounded by the maximum score of a round,
+        or with race_delta by a Hoeffding bound around the mean of the finished rounds.
+        """
+        if map_elites.best_fitness() > self.args.fitness_threshold:
+            return True
+        phenotype = replace(gpt_warrior, outputs={k: v.mean(axis=-1)[0] for k, v in outputs.items()})
+        incumbent = map_elites.archive.get(self.get_bc_features(phenotype))
+        if incumbent is None:
+            return False
+        scores = outputs["score"][0]
+        max_score = outputs["score"].shape[0] # a warrior alone alive for the whole round
+        upper = max_score
+        if self.args.race_delta is not None:
+            upper = min(upper, scores.mean() + max_score * np.sqrt(np.log(1 / self.args.race_delta) / (2 * len(scores))))
+        return (scores.sum() + n_left * upper) / (len(scores) + n_left) <= incumbent.fitness
 
     def init_round(self, i_round):
         initial_gpt_warriors = asyncio.run(self.corewar_gpt.new_warrior_async(n_warriors=1, n_responses=self.args.n_init)).flatten()
-        for w in initial_gpt_warriors:
-            self.process_warrior(i_round, w)
+        self.process_warriors(i_round, initial_gpt_warriors)
 
         if self.args.warmup_with_init_opps:
-            for w in self.init_opps:
-                self.process_warrior(i_round, w)
+            self.process_warriors(i_round, self.init_opps)
         if self.args.warmup_with_past_champs:
             prev_champs = [self.all_rounds_map_elites[i].get_best() for i in range(i_round)]
             prev_champs = prev_champs[-self.args.last_k_opps:] if self.args.last_k_opps is not None else prev_champs
-            for w in prev_champs:
-                self.process_warrior(i_round, w)
+            self.process_warriors(i_round, prev_champs)
 
     def step(self, i_round):
         if random.random() < self.args.sample_new_percent or len(self.all_rounds_map_elites[i_round].archive) == 0:
             gpt_warriors = asyncio.run(self.corewar_gpt.new_warrior_async(n_warriors=1, n_responses=self.args.n_mutate)).flatten()
-            for w in gpt_warriors:
-                self.process_warrior(i_round, w)
+            self.process_warriors(i_round, gpt_warriors)
         else:
-            gpt_warrior = self.all_rounds_map_elites[i_round].sample()
+            gpt_warrior = self.all_rounds_map_elites[i_round].sample(self.args.sample_weighting)
             gpt_warriors_mutated = asyncio.run(self.corewar_gpt.mutate_warrior_async([gpt_warrior], n_responses=self.args.n_mutate)).flatten()
-            for w in gpt_warriors_mutated:
-                self.process_warrior(i_round, w)
+            self.process_warriors(i_round, gpt_warriors_mutated)
     
+    async def init_round_async(self, i_round, llm_slots, eval_slots):
+        async with llm_slots:
+            initial_gpt_warriors = (await self.corewar_gpt.new_warrior_async(n_warriors=1, n_responses=self.args.n_init)).flatten()
+        async with eval_slots:
+            await self.process_warriors_async(i_round, initial_gpt_warriors)
+
+            if self.args.warmup_with_init_opps:
+                await self.process_warriors_async(i_round, self.init_opps)
+            if self.args.warmup_with_past_champs:
+                prev_champs = [self.all_rounds_map_elites[i].get_best() for i in range(i_round)]
+                prev_champs = prev_champs[-self.args.last_k_opps:] if self.args.last_k_opps is not None else prev_champs
+                await self.process_warriors_async(i_round, prev_champs)
+
+    async def step_async(self, i_round, llm_slots, eval_slots):
+        async with llm_slots:
+            if random.random() < self.args.sample_new_percent or len(self.all_rounds_map_elites[i_round].archive) == 0:
+                gpt_warriors = (await self.corewar_gpt.new_warrior_async(n_warriors=1, n_responses=self.args.n_mutate)).flatten()
+            else:
+                gpt_warrior = self.all_rounds_map_elites[i_round].sample(self.args.sample_weighting)
+                gpt_warriors = (await self.corewar_gpt.mutate_warrior_async([gpt_warrior], n_responses=self.args.n_mutate)).flatten()
+        async with eval_slots:
+            await self.process_warriors_async(i_round, gpt_warriors)
+
+    async def logged_step_async(self, pbar, abs_iter, i_round, i_iter, start_time, llm_slots, eval_slots):
+        """step_async, then log_iter once its warriors are placed."""
+        await self.step_async(i_round, llm_slots, eval_slots)
+        self.log_iter(pbar, abs_iter, i_round, i_iter, start_time)
+
     def run(self):
-        this_job_start_time = time.time()
+        try:
+            if self.args.llm_in_flight > 0:
+                asyncio.run(self._run_async())
+            else:
+                self._run()
+        finally:
+            if self.checkpointer is not None:
+                self.checkpointer.close() # wait for the last save
+            for bundle in self.opponents.values():
+                bundle.close()
+            self.evaluation_service.close()
+
+    def resume(self):
+        """Loads the state saved in save_dir when resuming. Returns the first iteration to run."""
         if self.args.resume and os.path.exists(f"{self.args.save_dir}/args.pkl"):
-            self.timestamps = util.load_pkl(self.args.save_dir, "timestamps")
-            self.all_rounds_map_elites = util.load_pkl(self.args.save_dir, "all_rounds_map_elites")
-            self.corewar_gpt.all_generations = util.load_pkl(self.args.save_dir, "all_generations")
+            if self.journal is not None and os.path.exists(self.journal.path):
+                self.timestamps = self.journal.replay(self.all_rounds_map_elites, self.corewar_gpt.all_generations)
+            else:
+                self.timestamps = util.load_pkl(self.args.save_dir, "timestamps")
+                self.all_rounds_map_elites = util.load_pkl(self.args.save_dir, "all_rounds_map_elites")
+                self.corewar_gpt.all_generations = util.load_pkl(self.args.save_dir, "all_generations")
+            for i_round, me in self.all_rounds_map_elites.items():
+                me.attach_history(self.history_path(i_round)) # a save from an older version spilled it to a temporary file
             print(f"Resumed training from {self.args.save_dir}")
 
-            start_abs_iter = self.timestamps[-1]["abs_iter"] + 1 # start from the next iteration
-        else:
-            start_abs_iter = 0
+            # start from the next iteration; with llm_in_flight, iterations are logged as their steps finish, in any order
+            return max(timestamp["abs_iter"] for timestamp in self.timestamps) + 1
+        return 0
+
+    def log_iter(self, pbar, abs_iter, i_round, i_iter, start_time):
+        """Records the timestamp of an iteration, saving every log_every iterations."""
+        me = self.all_rounds_map_elites[i_round]
+        process = psutil.Process(os.getpid())
+        rss = process.memory_info().rss  # Resident Set Size: memory used in bytes
+        vms = process.memory_info().vms  # Virtual Memory Size: total virtual memory used in bytes
+        self.timestamps.append(dict(abs_iter=abs_iter, i_round=i_round, i_iter=i_iter, dt=time.time()-start_time, rss=rss, vms=vms))
+
+        if self.journal is not None:
+            self.journal.record(self.timestamps, self.all_rounds_map_elites, self.corewar_gpt.all_generations)
+        if abs_iter % self.args.log_every == 0:
+            self.save(snapshot=abs_iter % self.args.snapshot_every == 0)
+        
+        if len(me.archive) > 0:
+            pbar.set_postfix(best_fitness=me.best_fitness(), coverage=me.coverage())
+
+    async def _run_async(self):
+        """
+        _run with LLM requests and evaluations overlapping: up to llm_in_flight steps wait for the LLM while up to
+        evals_in_flight steps are evaluated, and warriors are placed as their evaluations finish. A step samples its
+        parent from the archive as it is then, without the results of the steps still in flight. Rounds still run one
+        after another, since each one plays against the champions of the previous ones. An iteration is logged
+        (timestamp, journal, saves) once its step has placed its warriors.
+        """
+        this_job_start_time = time.time()
+        start_abs_iter = self.resume()
+        llm_slots, eval_slots = asyncio.Semaphore(self.args.llm_in_flight), asyncio.Semaphore(self.args.evals_in_flight)
+        in_flight = set()
+
+        pbar = tqdm(range(start_abs_iter, self.args.n_rounds * self.args.n_iters))
+        for abs_iter in pbar:
+            i_round, i_iter = abs_iter // self.args.n_iters, abs_iter % self.args.n_iters
+            start_time = time.time()
+            if i_iter == 0 and in_flight:
+                await asyncio.gather(*in_flight) # finish the previous round, whose champion is an opponent of this one
+                in_flight = set()
+
+            me = self.all_rounds_map_elites[i_round]
+            best_fitness = me.best_fitness()
+            should_skip = best_fitness > self.args.fitness_threshold
+
+            if not should_skip:
+                while len(in_flight) >= self.args.llm_in_flight + self.args.evals_in_flight:
+                    done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        task.result() # raise the errors of finished steps
+                start_time = time.time() # the iteration runs from here to the placement of its warriors
+                if i_iter == 0:
+                    await self.init_round_async(i_round, llm_slots, eval_slots)
+                in_flight.add(asyncio.create_task(self.logged_step_async(pbar, abs_iter, i_round, i_iter, start_time, llm_slots, eval_slots)))
+            else:
+                self.log_iter(pbar, abs_iter, i_round, i_iter, start_time)
+            if (time.time() - this_job_start_time) > self.args.job_timeout:
+                break # manual stop after to avoid slurm job timeout
+        await asyncio.gather(*in_flight)
+        self.save()
+
+    def _run(self):
+        this_job_start_time = time.time()
+        start_abs_iter = self.resume()
 
         pbar = tqdm(range(start_abs_iter, self.args.n_rounds * self.args.n_iters))
         for abs_iter in pbar:
@@ -231,7 +630,7 @@ class Main:
             start_time = time.time()
 
             me = self.all_rounds_map_elites[i_round]
-            best_fitness = me.get_best().fitness if len(me.archive) > 0 else -np.inf
+            best_fitness = me.best_fitness()
             should_skip = best_fitness > self.args.fitness_threshold
 
             if not should_skip:
@@ -239,33 +638,37 @@ class Main:
                     self.init_round(i_round)
                 self.step(i_round)
 
-            process = psutil.Process(os.getpid())
-            rss = process.memory_info().rss  # Resident Set Size: memory used in bytes
-            vms = process.memory_info().vms  # Virtual Memory Size: total virtual memory used in bytes
-            self.timestamps.append(dict(abs_iter=abs_iter, i_round=i_round, i_iter=i_iter, dt=time.time()-start_time, rss=rss, vms=vms))
-
-            if abs_iter % self.args.log_every == 0:
-                self.save()
-            
-            if len(me.archive) > 0:
-                pbar.set_postfix(best_fitness=me.get_best().fitness)
-
+            self.log_iter(pbar, abs_iter, i_round, i_iter, start_time)
             if (time.time() - this_job_start_time) > self.args.job_timeout:
                 break # manual stop after to avoid slurm job timeout
         self.save()
     
-    def save(self):
+    def save(self, snapshot=True):
+        """
+        Saves the run in save_dir. Only copies of the containers of the state are made here, they are
+        written by the checkpointer in the background (see checkpoint.py), coalescing with the saves still waiting.
+        """
         if self.args.save_dir is not None:
-            util.save_pkl(self.args.save_dir, "args", self.args)
-            util.save_pkl(self.args.save_dir, "timestamps", self.timestamps)
-            util.save_pkl(self.args.save_dir, "all_rounds_map_elites", self.all_rounds_map_elites)
-            util.save_pkl(self.args.save_dir, "all_generations", self.corewar_gpt.all_generations)
+            save_dir, checkpointer = self.args.save_dir, self.checkpointer
+            checkpointer.submit(lambda args=self.args: util.save_pkl(save_dir, "args", args), key="args")
+            if self.journal is not None:
+                self.journal.record(self.timestamps, self.all_rounds_map_elites, self.corewar_gpt.all_generations)
+                if snapshot:
+                    self.journal.snapshot(self.timestamps, self.all_rounds_map_elites)
+            else:
+                state = dict(timestamps=list(self.timestamps),
+                             all_rounds_map_elites={i_round: me.copy() for i_round, me in self.all_rounds_map_elites.items()},
+                             all_generations=[(kind, gpt_warriors.copy()) for kind, gpt_warriors in self.corewar_gpt.all_generations])
+                def save_state():
+                    for name, item in state.items():
+                        util.save_pkl(save_dir, name, item, compress=True)
+                checkpointer.submit(save_state, key="state")
             for i_round, me in self.all_rounds_map_elites.items():
                 if len(me.archive) > 0:
                     champion = me.get_best()
                     code = re.sub(r"```.*", "", champion.llm_response) # remove the backticks and language tag
-                    with open(f"{self.args.save_dir}/round_{i_round:03d}_champion.red", "w") as f:
-                        f.write(code)
+                    checkpointer.submit(lambda i_round=i_round, code=code: util.save_text(save_dir, f"round_{i_round:03d}_champion.red", code),
+                                        key=("champion", i_round))
 
 if __name__ == "__main__":
     main = Main(tyro.cli(Args))
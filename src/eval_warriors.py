@@ -13,9 +13,12 @@ from collections import defaultdict
 
 from llm_corewar import CorewarGPT, GPTWarrior
 
-from corewar_util import SimulationArgs, simargs_to_environment, parse_warrior_from_file, run_multiple_rounds
+from corewar_util import SimulationArgs, simargs_to_environment, parse_warrior_from_file, EvaluationService
 from corewar import MARS, Warrior
 import util
+from battle_cache import BattleCache
+from parse_cache import use_parse_cache
+from warrior_library import read_warriors
 
 @dataclass
 class Args:
@@ -27,9 +30,14 @@ class Args:
     # Core War arguments
     simargs: SimulationArgs = field(default_factory=SimulationArgs) # Simulation arguments
     timeout: int = 900 # timeout for each simulation in seconds
+    chunksize: int | None = None # (opponent, seed) rounds per pool task, None picks one from the number of rounds and processes
+    batched: bool | None = False # run all rounds of a battle in lockstep on one core (BatchMARS) instead of a pool, requires --simargs.legacy_core False
+    cache_path: str | None = None # sqlite file caching the outputs of every simulated round, shared across runs
+    shared_memory: bool | None = False # send warriors and outputs to the pool through shared memory instead of pickling them
+    parse_cache_path: str | None = None # sqlite file caching parsed warriors by source, shared across runs
 
     warrior_path: str | None = None
-    opponents_path_glob: str | None = None
+    opponents_path_glob: str | None = None # .red files and/or .cwl warrior libraries (see warrior_library.py)
 
 def main(args: Args):
     print(args)
@@ -37,19 +45,27 @@ def main(args: Args):
     nproc_all = os.popen("nproc --all").read().strip()
     print(f"Number of cores: {nproc} / {nproc_all}")
 
+    if args.batched and args.simargs.legacy_core:
+        raise ValueError("BatchMARS stores fields modulo the core size, batched requires --simargs.legacy_core False")
     random.seed(args.seed)
     np.random.seed(args.seed)
 
+    use_parse_cache(args.parse_cache_path)
     _, warrior = parse_warrior_from_file(args.simargs, args.warrior_path)
     results = {}
 
     files = sorted(glob.glob(args.opponents_path_glob))
-    for i, file in enumerate(tqdm(files)):
-        _, warrior2 = parse_warrior_from_file(args.simargs, file)
-        outputs = run_multiple_rounds(args.simargs, [warrior, warrior2], n_processes=args.n_processes, timeout=args.timeout)
-        results[(args.warrior_path, file)] = outputs
-        if args.save_dir is not None and i % 10 == 0:
-            util.save_pkl(args.save_dir, "results", results)
+    with EvaluationService(n_processes=args.n_processes, cache=BattleCache(args.cache_path) if args.cache_path else None,
+                           shared=args.shared_memory) as service:
+        opponents = list(read_warriors(args.simargs, files))
+        battles = [[warrior, warrior2] for _, _, warrior2 in opponents]
+        # the rounds of all opponents are scheduled at once, in any order
+        finished = service.iter_battles(args.simargs, battles, timeout=args.timeout * len(battles), batched=args.batched, chunksize=args.chunksize)
+        for i, (i_battle, outputs) in enumerate(tqdm(finished, total=len(battles))):
+            results[(args.warrior_path, opponents[i_battle][0])] = outputs
+            if args.save_dir is not None and i % 10 == 0:
+                util.save_pkl(args.save_dir, "results", results)
+    results = {(args.warrior_path, file): results[(args.warrior_path, file)] for file, _, _ in opponents}
     if args.save_dir is not None:
         util.save_pkl(args.save_dir, "results", results)
 
@@ -6,6 +6,7 @@ from dataclasses import dataclass
 from corewar import redcode, Warrior
 
 from llm_async import GPT
+from parse_cache import parse_cached
 
 @dataclass
 class GPTWarrior:
@@ -15,11 +16,13 @@ class GPTWarrior:
     error: str = None
     id: str = None
     parent_id: str = None
+    canonical_id: str = None # battle_hash of the warrior, equal for warriors playing identical rounds
 
     full_outputs: dict = None
     outputs: dict = None
     fitness: float = -np.inf
     bc: tuple[int, int] | None = None
+    fidelity: tuple[int, int] | None = None # (rounds, cycles) of the evaluation behind outputs
 
 
 class CorewarGPT():
@@ -35,7 +38,7 @@ class CorewarGPT():
         try:
             # a = re.search(r"```.*\n[\s\S]*?```", warrior_str)
             llm_response = re.sub(r"```.*", "", llm_response) # remove the backticks and language tag
-            warrior = redcode.parse(llm_response.split("\n"), self.environment)
+            warrior = parse_cached(llm_response, self.environment)
             gpt_warrior.warrior = warrior
         except Exception as e:
             gpt_warrior.error = str(e)
@@ -0,0 +1,83 @@
+import os
+import json
+import pickle
+import sqlite3
+import hashlib
+
+from corewar import redcode
+from warrior_registry import LRU
+
+PARSER_VERSION = 2 # bump when redcode.parse changes what it returns for a source
+
+def source_key(source, environment):
+    """sha256 of a Redcode source, the environment it is parsed in and the parser version."""
+    item = dict(source=source, environment=environment, version=PARSER_VERSION)
+    return hashlib.sha256(json.dumps(item, sort_keys=True).encode()).hexdigest()
+
+class ParseCache:
+    """
+    Cache of redcode.parse results keyed by source_key: a bounded in-memory LRU, backed by
+    an optional on-disk (SQLite) cache shared across runs. Parse errors are cached as well.
+    Results are kept pickled, so every call returns a fresh Warrior the caller may modify.
+    """
+    def __init__(self, path=None, capacity=4096):
+        self.path = path
+        self.memory = LRU(capacity, on_evict=lambda blob: None)
+        self.db = None
+        if path is not None:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.db = sqlite3.connect(path, timeout=60)
+            self.db.execute("CREATE TABLE IF NOT EXISTS warriors (key TEXT PRIMARY KEY, result BLOB)")
+            self.db.commit()
+        self.hits, self.misses = 0, 0
+
+    def lookup(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+        if self.db is not None:
+            row = self.db.execute("SELECT result FROM warriors WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.memory[key] = row[0]
+                return row[0]
+        return None
+
+    def parse(self, source, environment):
+        """redcode.parse of the lines of source, raising the same exception it raises."""
+        key = source_key(source, environment)
+        blob = self.lookup(key)
+        if blob is None:
+            self.misses += 1
+            try:
+                result = redcode.parse(source.split("\n"), environment)
+            except Exception as e:
+                result = e
+            blob = pickle.dumps(result)
+            self.memory[key] = blob
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO warriors (key, result) VALUES (?, ?)", (key, blob))
+                self.db.commit()
+        else:
+            self.hits += 1
+        result = pickle.loads(blob)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+_cache = ParseCache()
+
+def use_parse_cache(path=None, capacity=4096):
+    """Replaces the process-wide cache used by parse_cached, e.g. by one on disk."""
+    global _cache
+    _cache.close()
+    _cache = ParseCache(path, capacity)
+    return _cache
+
+def parse_cached(source, environment):
+    return _cache.parse(source, environment)
@@ -0,0 +1,195 @@
+import os
+import zlib
+import pickle
+import tempfile
+from dataclasses import fields
+
+import numpy as np
+
+from llm_corewar import GPTWarrior
+
+BULKY_FIELDS = ("prompt", "llm_response", "warrior", "error", "full_outputs")
+# bits of the flags column
+NO_FITNESS, NO_BC, NO_FIDELITY, NO_OUTPUTS, BULKY_OUTPUTS = 1, 2, 4, 8, 16
+
+def bulky_field(name):
+    def get(self):
+        return self.bulky()[name]
+    def set(self, value):
+        self.bulky()[name] = value
+    return property(get, set)
+
+class StoredPhenotype(GPTWarrior):
+    """
+    A phenotype read from a PhenotypeStore. Its compact fields are set, its bulky ones are read from the
+    store when first accessed. Copying or pickling it gives a plain GPTWarrior.
+    """
+    def __init__(self, store, i, **compact):
+        self.__dict__.update(compact)
+        self._store, self._i, self._bulky = store, i, None
+
+    def bulky(self):
+        if self._bulky is None:
+            self._bulky = self._store.read_bulky(self._i)
+        return self._bulky
+
+    prompt = bulky_field("prompt")
+    llm_response = bulky_field("llm_response")
+    warrior = bulky_field("warrior")
+    error = bulky_field("error")
+    full_outputs = bulky_field("full_outputs")
+
+    def __reduce__(self):
+        return GPTWarrior, tuple(getattr(self, f.name) for f in fields(GPTWarrior))
+
+class PhenotypeStore:
+    """
+    Append-only list of phenotypes (GPTWarrior) that keeps no reference to them: their ids, fitness, bc,
+    fidelity and scalar outputs in columns in memory, and their bulky fields (prompt, LLM response, parsed
+    warrior, error) zlib-compressed in a file, at path or in an anonymous temporary file.
+    Indexing returns StoredPhenotypes, column gives the columns. A missing output is NaN in its column.
+
+    A store written to path stays valid for as long as the file is only appended to, so pickling it only
+    pickles its columns. Its first append truncates the file to the end of its last record, dropping what
+    a store pickled later may have written after it. Copies are read-only views of the store.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.file = None
+        self.read_only, self.writing = False, False
+        self.n, self.capacity, self.end = 0, 0, 0 # end of the last record in the file
+        self.ids, self.parent_ids, self.canonical_ids = [], [], []
+        self.columns = dict(fitness=np.empty(0), bc=np.empty((0, 2), dtype=np.int64), fidelity=np.empty((0, 2), dtype=np.int64),
+                            flags=np.empty(0, dtype=np.int8), offset=np.empty(0, dtype=np.int64), length=np.empty(0, dtype=np.int64))
+        self.outputs = {} # name of an output -> its column
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        return (self[i] for i in range(self.n))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.n))]
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError("PhenotypeStore index out of range")
+        flags = self.columns["flags"][i]
+        compact = dict(id=self.ids[i], parent_id=self.parent_ids[i], canonical_id=self.canonical_ids[i],
+                       fitness=None if flags & NO_FITNESS else self.columns["fitness"][i].item(),
+                       bc=None if flags & NO_BC else tuple(self.columns["bc"][i].tolist()),
+                       fidelity=None if flags & NO_FIDELITY else tuple(self.columns["fidelity"][i].tolist()))
+        if not flags & (NO_OUTPUTS | BULKY_OUTPUTS):
+            compact["outputs"] = {k: v[i] for k, v in self.outputs.items() if not np.isnan(v[i])}
+        phenotype = StoredPhenotype(self, i, **compact)
+        if flags & NO_OUTPUTS:
+            phenotype.outputs = None
+        elif flags & BULKY_OUTPUTS:
+            phenotype.outputs = phenotype.bulky()["outputs"]
+        return phenotype
+
+    def column(self, name):
+        """The column of a field (fitness, bc, fidelity) or of an output, over the phenotypes stored."""
+        return self.outputs[name][:self.n] if name in self.outputs else self.columns[name][:self.n]
+
+    def grow(self):
+        self.capacity = max(16, 2 * self.capacity)
+        for name, column in self.columns.items():
+            self.columns[name] = np.concatenate([column[:self.n], np.zeros((self.capacity - self.n, *column.shape[1:]), dtype=column.dtype)])
+        for name, column in self.outputs.items():
+            self.outputs[name] = np.concatenate([column[:self.n], np.full(self.capacity - self.n, np.nan)])
+
+    def open(self):
+        if self.file is None:
+            if self.path is None:
+                self.file = tempfile.TemporaryFile()
+            else:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self.file = open(self.path, "r+b" if os.path.exists(self.path) else "w+b", buffering=0)
+        return self.file
+
+    def append(self, phenotype):
+        if self.read_only:
+            raise ValueError("Cannot append to a copy of a PhenotypeStore")
+        if not self.writing:
+            self.open().truncate(self.end)
+            self.writing = True
+        if self.n == self.capacity:
+            self.grow()
+        i, columns = self.n, self.columns
+        bulky = {name: getattr(phenotype, name) for name in BULKY_FIELDS}
+        flags = 0
+        if phenotype.fitness is None:
+            flags |= NO_FITNESS
+        else:
+            columns["fitness"][i] = phenotype.fitness
+        if phenotype.bc is None:
+            flags |= NO_BC
+        else:
+            columns["bc"][i] = phenotype.bc
+        if phenotype.fidelity is None:
+            flags |= NO_FIDELITY
+        else:
+            columns["fidelity"][i] = phenotype.fidelity
+        if phenotype.outputs is None:
+            flags |= NO_OUTPUTS
+        elif all(np.ndim(v) == 0 for v in phenotype.outputs.values()):
+            for name, value in phenotype.outputs.items():
+                if name not in self.outputs:
+                    self.outputs[name] = np.full(self.capacity, np.nan)
+                self.outputs[name][i] = value
+        else:
+            flags |= BULKY_OUTPUTS
+            bulky["outputs"] = phenotype.outputs
+        columns["flags"][i] = flags
+
+        blob = zlib.compress(pickle.dumps(bulky, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        os.pwrite(self.file.fileno(), blob, self.end)
+        columns["offset"][i], columns["length"][i] = self.end, len(blob)
+        self.end += len(blob)
+        self.ids.append(phenotype.id)
+        self.parent_ids.append(phenotype.parent_id)
+        self.canonical_ids.append(phenotype.canonical_id)
+        self.n += 1
+
+    def close(self):
+        """Closes the file, which copies share. Reading bulky fields or appending opens it again."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.writing = False
+
+    def extend(self, phenotypes):
+        for phenotype in phenotypes:
+            self.append(phenotype)
+
+    def read_bulky(self, i):
+        blob = os.pread(self.open().fileno(), self.columns["length"][i].item(), self.columns["offset"][i].item())
+        return pickle.loads(zlib.decompress(blob))
+
+    def copy(self):
+        """A read-only view of the phenotypes stored so far, sharing the file."""
+        store = PhenotypeStore.__new__(PhenotypeStore)
+        store.__dict__.update(self.__dict__)
+        store.read_only, store.capacity = True, self.n
+        store.ids, store.parent_ids, store.canonical_ids = self.ids[:self.n], self.parent_ids[:self.n], self.canonical_ids[:self.n]
+        store.columns = {name: column[:self.n] for name, column in self.columns.items()}
+        store.outputs = {name: column[:self.n] for name, column in self.outputs.items()}
+        return store
+
+    def __getstate__(self):
+        state = dict(self.__dict__, file=None, read_only=False, writing=False, capacity=self.n)
+        state["columns"] = {name: column[:self.n] for name, column in self.columns.items()}
+        state["outputs"] = {name: column[:self.n] for name, column in self.outputs.items()}
+        state["ids"], state["parent_ids"], state["canonical_ids"] = self.ids[:self.n], self.parent_ids[:self.n], self.canonical_ids[:self.n]
+        if self.path is None: # the temporary file goes with it
+            state["data"] = os.pread(self.open().fileno(), self.end, 0)
+        return state
+
+    def __setstate__(self, state):
+        data = state.pop("data", None)
+        self.__dict__.update(state)
+        if data is not None:
+            os.pwrite(self.open().fileno(), data, 0)
@@ -0,0 +1,135 @@
+import os
+import json
+import numpy as np
+
+from llm_corewar import GPTWarrior
+from warrior_registry import pack_warrior, unpack_warrior
+import util
+
+def encode_phenotype(gpt_warrior):
+    """A JSON-able dict of a GPTWarrior. Its warrior is kept assembled (see pack_warrior), not as source."""
+    item = dict(prompt=gpt_warrior.prompt, llm_response=gpt_warrior.llm_response, error=gpt_warrior.error,
+                id=gpt_warrior.id, parent_id=gpt_warrior.parent_id, canonical_id=gpt_warrior.canonical_id,
+                fitness=float(gpt_warrior.fitness), bc=gpt_warrior.bc, fidelity=gpt_warrior.fidelity)
+    if gpt_warrior.warrior is not None:
+        item["warrior"] = dict(name=gpt_warrior.warrior.name, author=gpt_warrior.warrior.author,
+                               packed=pack_warrior(gpt_warrior.warrior).tolist())
+    if gpt_warrior.outputs is not None:
+        item["outputs"] = {k: float(v) for k, v in gpt_warrior.outputs.items()}
+    return item
+
+def decode_phenotype(item):
+    gpt_warrior = GPTWarrior(prompt=item["prompt"], llm_response=item["llm_response"], error=item["error"],
+                             id=item["id"], parent_id=item["parent_id"], canonical_id=item["canonical_id"],
+                             fitness=item["fitness"])
+    if "warrior" in item:
+        gpt_warrior.warrior = unpack_warrior(np.array(item["warrior"]["packed"], dtype=np.int64))
+        gpt_warrior.warrior.name, gpt_warrior.warrior.author = item["warrior"]["name"], item["warrior"]["author"]
+    if "outputs" in item:
+        gpt_warrior.outputs = {k: np.float64(v) for k, v in item["outputs"].items()}
+    gpt_warrior.bc = tuple(item["bc"]) if item["bc"] is not None else None
+    gpt_warrior.fidelity = tuple(item["fidelity"]) if item["fidelity"] is not None else None
+    return gpt_warrior
+
+class RunJournal:
+    """
+    Append-only record of a DRQ run in save_dir/journal.jsonl: every LLM generation, every placement in an archive
+    and every iteration timestamp, one JSON line each, written as they are recorded. Saving only appends what is new,
+    so its cost does not grow with the length of the run. Snapshots (save_dir/snapshot.pkl) hold the archives and
+    timestamps as of a journal line, so that resuming replays the snapshot plus the journal lines after it.
+    With a checkpointer (see checkpoint.py), records are encoded by the caller and written on its thread.
+    """
+    def __init__(self, save_dir, checkpointer=None):
+        self.save_dir = save_dir
+        self.checkpointer = checkpointer
+        self.path = f"{save_dir}/journal.jsonl"
+        self.snapshot_path = f"{save_dir}/snapshot.pkl"
+        os.makedirs(save_dir, exist_ok=True)
+        self.n_lines = 0 # lines in the journal
+        self.n_generations, self.n_timestamps, self.n_placed = 0, 0, {} # how much of the run is recorded
+
+    def append(self, records):
+        text = "".join(json.dumps(record) + "\n" for record in records)
+        self.n_lines += len(records)
+        if self.checkpointer is not None:
+            self.checkpointer.submit(lambda: self.write(text))
+        else:
+            self.write(text)
+
+    def write(self, text):
+        with open(self.path, "a") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record(self, timestamps, all_rounds_map_elites, all_generations):
+        """Appends the generations, placements and timestamps not recorded yet."""
+        records = []
+        for kind, gpt_warriors in all_generations[self.n_generations:]:
+            records.append(dict(type="generation", kind=kind, warriors=[[encode_phenotype(w) for w in row] for row in gpt_warriors]))
+        for i_round, me in all_rounds_map_elites.items():
+            for phenotype in me.history[self.n_placed.get(i_round, 0):]:
+                records.append(dict(type="place", i_round=i_round, phenotype=encode_phenotype(phenotype)))
+            self.n_placed[i_round] = len(me.history)
+        for timestamp in timestamps[self.n_timestamps:]:
+            records.append(dict(type="iter", **timestamp))
+        self.n_generations, self.n_timestamps = len(all_generations), len(timestamps)
+        if records:
+            self.append(records)
+
+    def snapshot(self, timestamps, all_rounds_map_elites):
+        """Writes the map elites (without their history) and timestamps as of the last journal line, replacing the previous snapshot."""
+        map_elites = {i_round: me.copy(history=False) for i_round, me in all_rounds_map_elites.items()}
+        snapshot = dict(n_lines=self.n_lines, timestamps=list(timestamps), map_elites=map_elites)
+        if self.checkpointer is not None:
+            self.checkpointer.submit(lambda: util.save_pkl(self.save_dir, "snapshot", snapshot, compress=True), key="snapshot")
+        else:
+            util.save_pkl(self.save_dir, "snapshot", snapshot, compress=True)
+
+    def replay(self, all_rounds_map_elites, all_generations):
+        """
+        Restores a recorded run into empty map elites and generations: the archives from the snapshot, then the
+        placements after it, while the history of the map elites and the generations are read from the whole journal.
+        Returns the timestamps. A last line cut short by a crash is dropped.
+        """
+        snapshot = dict(n_lines=0, timestamps=[], map_elites={})
+        if os.path.exists(self.snapshot_path):
+            snapshot = util.load_pkl(self.save_dir, "snapshot")
+        timestamps = list(snapshot["timestamps"])
+        all_rounds_map_elites.update(snapshot["map_elites"]) # without their history, read from the journal below
+        lines = []
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                lines = f.readlines()
+        n_lines = 0
+        for i, line in enumerate(lines):
+            if not line.endswith("\n"):
+                break
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            n_lines += 1
+            if record["type"] == "generation":
+                gpt_warriors = np.empty((len(record["warriors"]), len(record["warriors"][0]) if record["warriors"] else 0), dtype=object)
+                for i_row, row in enumerate(record["warriors"]):
+                    for i_col, item in enumerate(row):
+                        gpt_warriors[i_row, i_col] = decode_phenotype(item)
+                all_generations.append((record["kind"], gpt_warriors))
+            elif record["type"] == "place":
+                me = all_rounds_map_elites[record["i_round"]]
+                phenotype = decode_phenotype(record["phenotype"])
+                if i < snapshot["n_lines"]:
+                    me.history.append(phenotype) # already in the snapshot
+                else:
+                    me.place(phenotype)
+            elif record["type"] == "iter" and i >= snapshot["n_lines"]:
+                del record["type"]
+                timestamps.append(record)
+        if n_lines < len(lines): # drop the cut line, so that new records start on a line of their own
+            with open(self.path, "w") as f:
+                f.writelines(lines[:n_lines])
+        self.n_lines = n_lines
+        self.n_generations, self.n_timestamps = len(all_generations), len(timestamps)
+        self.n_placed = {i_round: len(me.history) for i_round, me in all_rounds_map_elites.items()}
+        return timestamps
@@ -0,0 +1,12 @@
+#! /usr/bin/env python
+# coding: utf-8
+
+import unittest
+
+from tests.run_journal_test import TestRunJournal
+from tests.phenotype_store_test import TestPhenotypeStore
+from tests.map_elites_test import TestMapElites
+from tests.battle_cache_test import TestBattleCache
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+#! /usr/bin/env python
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from dataclasses import replace
+
+from battle_cache import BattleCache, battle_key, MAX_VARIABLES
+from corewar_util import SimulationArgs
+
+class TestBattleCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_battle_key(self):
+        simargs = SimulationArgs()
+        key = battle_key(simargs, ["a", "b"], 0)
+        # the number of rounds and the choice of core do not change a round
+        self.assertEqual(key, battle_key(replace(simargs, rounds=1), ["a", "b"], 0))
+        self.assertEqual(key, battle_key(replace(simargs, packed=not simargs.packed), ["a", "b"], 0))
+        for other in [replace(simargs, cycles=simargs.cycles // 2), replace(simargs, early_exit=not simargs.early_exit),
+                      replace(simargs, solo=not simargs.solo), replace(simargs, legacy_core=not simargs.legacy_core)]:
+            self.assertNotEqual(key, battle_key(other, ["a", "b"], 0), other)
+        self.assertNotEqual(key, battle_key(simargs, ["b", "a"], 0))
+        self.assertNotEqual(key, battle_key(simargs, ["a", "b"], 1))
+
+    def test_get_many(self):
+        cache = BattleCache(os.path.join(self.dir, "cache", "battles.db"))
+        self.addCleanup(cache.close)
+        keys = ["k%d" % i for i in range(2 * MAX_VARIABLES + 10)]
+        stored = {key: dict(score=[float(i)], tsp=[i]) for i, key in enumerate(keys) if i % 3 == 0}
+        cache.put_many(stored)
+        self.assertEqual(stored, cache.get_many(keys))
+        self.assertEqual((len(stored), len(keys) - len(stored)), (cache.hits, cache.misses))
+        self.assertEqual({}, cache.get_many([]))
+
+        cache.close()
+        cache = BattleCache(cache.path) # persisted
+        self.addCleanup(cache.close)
+        self.assertEqual({"k3": stored["k3"]}, cache.get_many(["k3", "k4"]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#! /usr/bin/env python
+# coding: utf-8
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from drq import MapElites
+from llm_corewar import GPTWarrior
+from phenotype_store import PhenotypeStore
+
+def phenotype(i, bc, fitness):
+    return GPTWarrior(prompt="p%d" % i, llm_response="r%d" % i, id="id%d" % i, fitness=fitness, bc=bc)
+
+class TestMapElites(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_best_cell_ties(self):
+        me = MapElites()
+        me.place(phenotype(0, (2, 2), 0.5))
+        me.place(phenotype(1, (0, 0), 0.5))
+        self.assertEqual((2, 2), me.best_cell) # the first occupied cell wins a tie
+        me.place(phenotype(2, (0, 0), 0.6))
+        self.assertEqual((0, 0), me.best_cell)
+        me.place(phenotype(3, (2, 2), 0.6))
+        self.assertEqual((2, 2), me.best_cell)
+        self.assertEqual("id3", me.get_best().id)
+
+    def test_total_fitness_replacement(self):
+        me = MapElites()
+        self.assertTrue(me.place(phenotype(0, (0, 0), 0.5)))
+        self.assertTrue(me.place(phenotype(1, (1, 0), 0.2)))
+        self.assertTrue(me.place(phenotype(2, (0, 0), 0.7)))
+        self.assertFalse(me.place(phenotype(3, (0, 0), 0.6)))
+        self.assertAlmostEqual(0.9, me.total_fitness)
+        self.assertAlmostEqual(0.7, me.qd_score(0.1))
+        self.assertAlmostEqual(sum(p.fitness for p in me.archive.values()), me.total_fitness)
+        self.assertEqual([(0, 0), (1, 0)], me.cells)
+        self.assertEqual(2, me.coverage())
+        self.assertEqual([1, 2, 2, 2], me.coverage_history)
+        self.assertEqual([0.5, 0.5, 0.7, 0.7], me.fitness_history)
+        self.assertEqual(4, len(me.history))
+
+    def test_grow(self):
+        me = MapElites(shape=(2, 2))
+        me.place(phenotype(0, (1, 1), 0.5))
+        me.place(phenotype(1, (3, 0), 0.7))
+        self.assertEqual((4, 2), me.grid_fitness.shape)
+        self.assertEqual((4, 2), me.grid_order.shape)
+        self.assertEqual(0.5, me.grid_fitness[1, 1])
+        self.assertEqual(0.7, me.grid_fitness[3, 0])
+        self.assertEqual(-np.inf, me.grid_fitness[2, 1])
+        self.assertEqual([[-1, -1], [-1, 0], [-1, -1], [1, -1]], me.grid_order.tolist())
+        self.assertEqual((3, 0), me.best_cell)
+        self.assertEqual([(1, 1), (3, 0)], me.cells)
+
+    def sampling_weights(self, me, weighting):
+        with mock.patch("numpy.random.choice", return_value=0) as choice:
+            self.assertIs(me.archive[me.cells[0]], me.sample(weighting))
+        (n,), kwargs = choice.call_args
+        self.assertEqual(len(me.cells), n)
+        return kwargs["p"]
+
+    def test_sampling_weights(self):
+        me = MapElites()
+        me.place(phenotype(0, (0, 0), 0.5))
+        me.place(phenotype(1, (0, 1), 0.1))
+        me.place(phenotype(2, (4, 4), 0.3))
+        me.place(phenotype(3, (1, 1), 0.1))
+        # the rank of the fitness, the first occupied ranked lower on ties
+        np.testing.assert_allclose(np.array([4, 1, 3, 2]) / 10, self.sampling_weights(me, "fitness"))
+        # 1 / (1 + the number of occupied neighbors)
+        np.testing.assert_allclose(np.array([1 / 3, 1 / 3, 1, 1 / 3]) / 2, self.sampling_weights(me, "novelty"))
+        with self.assertRaises(ValueError):
+            me.sample("unknown")
+
+    def test_old_pickle_attach_history(self):
+        phenotypes = [phenotype(0, (0, 0), 0.5), phenotype(1, (0, 0), 0.7), phenotype(2, (1, 0), 0.2)]
+        old = MapElites.__new__(MapElites) # as pickled before the grid and the PhenotypeStore
+        old.__dict__.update(archive={(0, 0): phenotypes[1], (1, 0): phenotypes[2]}, history=list(phenotypes),
+                            coverage_history=[1, 1, 2], fitness_history=[0.5, 0.7, 0.7])
+        me = pickle.loads(pickle.dumps(old))
+        self.addCleanup(me.history.close)
+        self.assertIsInstance(me.history, PhenotypeStore)
+        self.assertEqual(0.7, me.best_fitness())
+        self.assertEqual(2, me.coverage())
+
+        path = os.path.join(self.dir, "history_000.bin")
+        me.attach_history(path)
+        self.addCleanup(me.history.close)
+        self.assertEqual(path, me.history.path)
+        self.assertTrue(os.path.getsize(path) > 0)
+        self.assertEqual(["id0", "id1", "id2"], [p.id for p in me.history])
+        self.assertEqual("r1", me.history[1].llm_response)
+        me.attach_history(path) # already there
+        self.assertEqual(3, len(me.history))
+
+    def test_pickle_with_elites(self):
+        me = MapElites()
+        me.place(phenotype(0, (0, 0), 0.5))
+        state = dict(me.__dict__, elites=[me.archive[(0, 0)]], grid_index=np.zeros((6, 6), dtype=np.int64)) # as pickled when the grid indexed a list of every elite
+        old = MapElites.__new__(MapElites)
+        old.__setstate__(state)
+        self.assertNotIn("elites", old.__dict__)
+        self.assertNotIn("grid_index", old.__dict__)
+        old.place(phenotype(1, (0, 0), 0.7))
+        self.assertEqual("id1", old.get_best().id)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#! /usr/bin/env python
+# coding: utf-8
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from corewar import Warrior
+from corewar.redcode import Instruction, MOV, M_I, DIRECT
+from llm_corewar import GPTWarrior
+from phenotype_store import PhenotypeStore, StoredPhenotype
+
+def phenotype(i, **fields):
+    warrior = Warrior(name="w%d" % i, author="test")
+    warrior.instructions = [Instruction(MOV, M_I, DIRECT, i, DIRECT, 1)]
+    item = dict(prompt="p%d" % i, llm_response="r%d" % i, warrior=warrior, id="id%d" % i, parent_id="id%d" % (i - 1),
+                canonical_id="c%d" % i, fitness=0.1 * i, bc=(i % 3, i % 2), fidelity=(24, 80000),
+                outputs=dict(score=np.float64(i), tsp=np.float64(2 * i)))
+    item.update(fields)
+    return GPTWarrior(**item)
+
+class TestPhenotypeStore(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "history.bin")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def store(self, path=None):
+        store = PhenotypeStore(path)
+        self.addCleanup(store.close)
+        return store
+
+    def assertPhenotype(self, expected, stored):
+        self.assertIsInstance(stored, StoredPhenotype)
+        for name in ("prompt", "llm_response", "error", "id", "parent_id", "canonical_id", "fitness", "bc", "fidelity"):
+            self.assertEqual(getattr(expected, name), getattr(stored, name), name)
+        if expected.outputs is None:
+            self.assertIsNone(stored.outputs)
+        else:
+            self.assertEqual(sorted(expected.outputs), sorted(stored.outputs))
+            for k, v in expected.outputs.items():
+                np.testing.assert_array_equal(v, stored.outputs[k])
+        if expected.warrior is None:
+            self.assertIsNone(stored.warrior)
+        else:
+            self.assertEqual(expected.warrior.name, stored.warrior.name)
+            self.assertEqual(expected.warrior.instructions, stored.warrior.instructions)
+
+    def test_round_trip(self):
+        store = self.store()
+        phenotypes = [phenotype(i) for i in range(40)]
+        store.extend(phenotypes)
+        self.assertEqual(40, len(store))
+        for expected, stored in zip(phenotypes, store):
+            self.assertPhenotype(expected, stored)
+        self.assertPhenotype(phenotypes[-1], store[-1])
+        self.assertEqual([p.id for p in phenotypes[3:6]], [p.id for p in store[3:6]])
+        np.testing.assert_array_equal([p.fitness for p in phenotypes], store.column("fitness"))
+        np.testing.assert_array_equal([2. * i for i in range(40)], store.column("tsp"))
+        with self.assertRaises(IndexError):
+            store[40]
+
+    def test_flags(self):
+        store = self.store()
+        phenotypes = [phenotype(0, fitness=None, bc=None, fidelity=None),
+                      phenotype(1, outputs=None, warrior=None, error="parse error"),
+                      phenotype(2, outputs=dict(score=np.array([1., 2.]), tsp=np.float64(3.))), # not all scalars: kept bulky
+                      phenotype(3, outputs=dict(score=np.float64(4.)))] # no tsp
+        store.extend(phenotypes)
+        for expected, stored in zip(phenotypes, store):
+            self.assertPhenotype(expected, stored)
+        self.assertTrue(np.isnan(store.column("tsp")[3]))
+
+    def test_copy_is_read_only_view(self):
+        store = self.store()
+        store.extend(phenotype(i) for i in range(3))
+        view = store.copy()
+        store.extend(phenotype(i) for i in range(3, 30)) # grows the columns past the view
+        self.assertEqual(3, len(view))
+        self.assertEqual(["id0", "id1", "id2"], [p.id for p in view])
+        self.assertPhenotype(phenotype(2), view[2])
+        with self.assertRaises(ValueError):
+            view.append(phenotype(3))
+
+    def test_pickle_without_path(self):
+        store = self.store()
+        store.extend(phenotype(i) for i in range(5))
+        data = pickle.dumps(store)
+        store.close()
+        loaded = pickle.loads(data) # the temporary file goes with it
+        self.addCleanup(loaded.close)
+        for i, stored in enumerate(loaded):
+            self.assertPhenotype(phenotype(i), stored)
+        loaded.append(phenotype(5))
+        self.assertPhenotype(phenotype(5), loaded[5])
+
+    def test_pickle_with_path(self):
+        store = self.store(self.path)
+        store.extend(phenotype(i) for i in range(5))
+        data = pickle.dumps(store)
+        self.assertNotIn("data", store.__getstate__()) # only the columns, the file stays where it is
+        store.extend(phenotype(i) for i in range(5, 8)) # written after the pickle
+        store.close()
+
+        loaded = pickle.loads(data)
+        self.addCleanup(loaded.close)
+        self.assertEqual(5, len(loaded))
+        for i, stored in enumerate(loaded):
+            self.assertPhenotype(phenotype(i), stored)
+        # its first append truncates what was written after the pickle
+        loaded.append(phenotype(10))
+        self.assertEqual(loaded.end, os.path.getsize(self.path))
+        self.assertPhenotype(phenotype(10), loaded[5])
+        self.assertPhenotype(phenotype(4), loaded[4])
+
+if __name__ == '__main__':
+    unittest.main()
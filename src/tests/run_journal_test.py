@@ -0,0 +1,122 @@
+#! /usr/bin/env python
+# coding: utf-8
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from corewar import Warrior
+from corewar.redcode import Instruction, MOV, M_I, DIRECT
+from drq import MapElites
+from llm_corewar import GPTWarrior
+from run_journal import RunJournal
+
+def phenotype(i, bc, fitness):
+    warrior = Warrior(name="w%d" % i, author="test")
+    warrior.instructions = [Instruction(MOV, M_I, DIRECT, i, DIRECT, 1)]
+    return GPTWarrior(prompt="p%d" % i, llm_response="r%d" % i, warrior=warrior, id="id%d" % i, fitness=fitness,
+                      bc=bc, fidelity=(4, 8000), outputs=dict(score=np.float64(fitness)))
+
+def summary(all_rounds_map_elites):
+    """What a replay must restore: every archive and history, by id."""
+    return {i_round: (sorted((bc, p.id, p.fitness) for bc, p in me.archive.items()), [p.id for p in me.history],
+                      me.best_fitness(), me.coverage())
+            for i_round, me in all_rounds_map_elites.items()}
+
+class TestRunJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+        self.journal = RunJournal(self.save_dir)
+        self.all_rounds_map_elites = {0: MapElites(), 1: MapElites()}
+        self.all_generations, self.timestamps = [], []
+        self.n = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def step(self, i_round, bc, fitness):
+        p = phenotype(self.n, bc, fitness)
+        self.all_generations.append(("mutate", np.array([[p]], dtype=object)))
+        self.all_rounds_map_elites[i_round].place(p)
+        self.timestamps.append(dict(abs_iter=self.n, i_round=i_round, i_iter=self.n, dt=0.5))
+        self.n += 1
+        self.journal.record(self.timestamps, self.all_rounds_map_elites, self.all_generations)
+
+    def replay(self):
+        all_rounds_map_elites, all_generations = {0: MapElites(), 1: MapElites()}, []
+        journal = RunJournal(self.save_dir)
+        timestamps = journal.replay(all_rounds_map_elites, all_generations)
+        return journal, all_rounds_map_elites, all_generations, timestamps
+
+    def assertReplayed(self, all_rounds_map_elites, all_generations, timestamps):
+        self.assertEqual(summary(self.all_rounds_map_elites), summary(all_rounds_map_elites))
+        self.assertEqual([[p.id for p in g.flatten()] for _, g in self.all_generations],
+                         [[p.id for p in g.flatten()] for _, g in all_generations])
+        self.assertEqual(self.timestamps, timestamps)
+
+    def test_no_snapshot(self):
+        for bc, fitness in [((0, 0), 0.5), ((0, 0), 0.7), ((1, 2), 0.2), ((0, 0), 0.6)]:
+            self.step(0, bc, fitness)
+        journal, all_rounds_map_elites, all_generations, timestamps = self.replay()
+        self.assertReplayed(all_rounds_map_elites, all_generations, timestamps)
+        self.assertEqual(0.7, all_rounds_map_elites[0].get_best().fitness)
+        self.assertEqual(np.float64(0.7), all_rounds_map_elites[0].get_best().outputs["score"])
+        self.assertEqual([1], [i.a_number for i in all_rounds_map_elites[0].get_best().warrior.instructions])
+
+    def test_snapshot_mid_journal(self):
+        self.step(0, (0, 0), 0.5)
+        self.step(0, (1, 1), 0.3)
+        self.journal.snapshot(self.timestamps, self.all_rounds_map_elites)
+        self.step(0, (0, 0), 0.9)
+        self.step(0, (2, 0), 0.1)
+        journal, all_rounds_map_elites, all_generations, timestamps = self.replay()
+        self.assertReplayed(all_rounds_map_elites, all_generations, timestamps)
+        self.assertEqual(4 * 3, journal.n_lines) # a generation, a placement and an iteration per step
+        self.assertEqual({0: 4, 1: 0}, journal.n_placed)
+
+    def test_truncated_last_line(self):
+        self.step(0, (0, 0), 0.5)
+        self.step(0, (1, 0), 0.4)
+        with open(self.journal.path, "a") as f:
+            f.write('{"type": "place", "i_round": 0, "phen') # cut by a crash
+        journal, all_rounds_map_elites, all_generations, timestamps = self.replay()
+        self.assertReplayed(all_rounds_map_elites, all_generations, timestamps)
+        with open(journal.path) as f:
+            lines = f.readlines()
+        self.assertEqual(journal.n_lines, len(lines))
+        self.assertTrue(all(line.endswith("\n") for line in lines))
+
+        # the run goes on from the replayed state, appending after the last whole line
+        self.journal, self.all_rounds_map_elites, self.all_generations, self.timestamps = journal, all_rounds_map_elites, all_generations, timestamps
+        self.step(0, (1, 0), 0.8)
+        with open(journal.path) as f:
+            self.assertTrue(all(json.loads(line) for line in f))
+        self.assertReplayed(*self.replay()[1:])
+
+    def test_round_first_seen_after_snapshot(self):
+        self.step(0, (0, 0), 0.5)
+        self.step(0, (0, 1), 0.6)
+        self.journal.snapshot(self.timestamps, {0: self.all_rounds_map_elites[0]}) # round 1 did not exist yet
+        self.step(1, (1, 1), 0.3)
+        self.step(1, (1, 1), 0.4)
+        journal, all_rounds_map_elites, all_generations, timestamps = self.replay()
+        self.assertReplayed(all_rounds_map_elites, all_generations, timestamps)
+        self.assertEqual({0: 2, 1: 2}, journal.n_placed)
+
+        # nothing is recorded twice after resuming, and a new snapshot covers both rounds
+        self.journal, self.all_rounds_map_elites, self.all_generations, self.timestamps = journal, all_rounds_map_elites, all_generations, timestamps
+        self.step(1, (2, 1), 0.2)
+        self.journal.snapshot(self.timestamps, self.all_rounds_map_elites)
+        self.step(0, (0, 1), 0.9)
+        journal, all_rounds_map_elites, all_generations, timestamps = self.replay()
+        self.assertReplayed(all_rounds_map_elites, all_generations, timestamps)
+        self.assertEqual({0: 3, 1: 3}, journal.n_placed)
+        self.assertEqual(6 * 3, journal.n_lines)
+
+if __name__ == '__main__':
+    unittest.main()
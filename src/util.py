@@ -1,7 +1,10 @@
 import os
 import json
+import gzip
 import pickle
 
+GZIP_MAGIC = b"\x1f\x8b"
+
 
 def save_json(save_dir, name, item):
     if save_dir is not None:
@@ -16,16 +19,39 @@ def load_json(load_dir, name):
     else:
         return None
 
-def save_pkl(save_dir, name, item):
+def save_text(save_dir, name, text):
+    """Writes text to save_dir/name through a temp file."""
+    if save_dir is not None:
+        os.makedirs(f"{save_dir}/", exist_ok=True)
+        path = f"{save_dir}/{name}"
+        with open(path + ".tmp", "w") as f:
+            f.write(text)
+        os.replace(path + ".tmp", path)
+
+
+def save_pkl(save_dir, name, item, compress=False):
+    """Pickles item to save_dir/name.pkl (gzipped if compress) through a temp file, so that the file is never left half written."""
     if save_dir is not None:
         os.makedirs(f"{save_dir}/", exist_ok=True)
-        with open(f"{save_dir}/{name}.pkl", "wb") as f:
-            pickle.dump(item, f)
+        path = f"{save_dir}/{name}.pkl"
+        with open(path + ".tmp", "wb") as raw:
+            if compress:
+                with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=1) as f: # closing it does not close raw
+                    pickle.dump(item, f, protocol=pickle.HIGHEST_PROTOCOL)
+            else:
+                pickle.dump(item, raw, protocol=pickle.HIGHEST_PROTOCOL)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(path + ".tmp", path)
 
 
 def load_pkl(load_dir, name):
+    """Loads a pickle written by save_pkl, gzipped or not."""
     if load_dir is not None:
         with open(f"{load_dir}/{name}.pkl", "rb") as f:
+            if f.peek(2)[:2] == GZIP_MAGIC:
+                with gzip.GzipFile(fileobj=f, mode="rb") as g:
+                    return pickle.load(g)
             return pickle.load(f)
     else:
-        return None
\ No newline at end of file
+        return None
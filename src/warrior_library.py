@@ -0,0 +1,147 @@
+import os
+import json
+import mmap
+import glob
+import struct
+from dataclasses import dataclass, field
+
+import numpy as np
+import tyro
+
+from corewar import Warrior, Instruction
+from corewar_util import SimulationArgs, simargs_to_environment
+from parse_cache import parse_cached
+
+LIBRARY_SUFFIX = ".cwl"
+MAGIC = b"CWLIB\x00\x00\x02"
+# magic, bytes of the parse environment, number of warriors, number of instructions, bytes of metadata
+HEADER = struct.Struct("<8sQQQQ")
+
+def save_library(path, warriors, metadata, environment):
+    """
+    Writes warriors assembled in environment (see simargs_to_environment) into a library file: a header,
+    the JSON environment, an int64 (n_warriors, 3) index of (offset, length, start), the int64 fields
+    (opcode, modifier, a_mode, a_number, b_mode, b_number) of the instructions of every warrior, as
+    assembled, then the JSON list of metadata, one dict per warrior.
+    """
+    assert len(warriors) == len(metadata)
+    index = np.zeros((len(warriors), 3), dtype="<i8")
+    code = []
+    for i, warrior in enumerate(warriors):
+        index[i] = len(code), len(warrior.instructions), warrior.start
+        code.extend((i.opcode, i.modifier, i.a_mode, i.a_number, i.b_mode, i.b_number) for i in warrior.instructions)
+    code = np.array(code, dtype="<i8").reshape(-1, 6)
+    env = json.dumps(environment, sort_keys=True).encode()
+    meta = json.dumps(metadata).encode()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(env), len(warriors), len(code), len(meta)))
+        f.write(env)
+        f.write(index.tobytes())
+        f.write(code.tobytes())
+        f.write(meta)
+    os.replace(tmp_path, path)
+
+def build_library(path, files, simargs, include_source=True):
+    """Parses .red files into a library at path. Returns the files that failed to parse, with their errors."""
+    environment = simargs_to_environment(simargs)
+    warriors, metadata, errors = [], [], {}
+    for file in files:
+        with open(file, encoding="latin1") as f:
+            source = f.read()
+        try:
+            warrior = parse_cached(source, environment)
+        except Exception as e:
+            errors[file] = str(e)
+            continue
+        warriors.append(warrior)
+        meta = dict(path=file, name=warrior.name, author=warrior.author)
+        if include_source:
+            meta["source"] = source
+        metadata.append(meta)
+    save_library(path, warriors, metadata, environment)
+    return errors
+
+class WarriorLibrary:
+    """
+    A library file written by save_library, memory-mapped read-only: opening it only reads the
+    header, the parse environment and the metadata, and warriors are unpacked from the mapping when
+    accessed. The warriors it returns are the ones assembled, fields included.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_env, n_warriors, n_instructions, n_meta = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            self.mm.close()
+            if magic[:5] == MAGIC[:5]:
+                raise ValueError(f"{path} was written by another version of warrior_library, build it again")
+            raise ValueError(f"{path} is not a warrior library")
+        offset = HEADER.size
+        self.environment = json.loads(self.mm[offset:offset + n_env].decode())
+        offset += n_env
+        self.index = np.frombuffer(self.mm, dtype="<i8", count=3 * n_warriors, offset=offset).reshape(n_warriors, 3)
+        offset += self.index.nbytes
+        self.code = np.frombuffer(self.mm, dtype="<i8", count=6 * n_instructions, offset=offset).reshape(n_instructions, 6)
+        offset += self.code.nbytes
+        self.metadata = json.loads(self.mm[offset:offset + n_meta].decode())
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        offset, length, start = self.index[i].tolist()
+        meta = self.metadata[i]
+        warrior = Warrior(name=meta["name"], author=meta["author"], start=start)
+        warrior.instructions = [Instruction(*fields) for fields in self.code[offset:offset + length].tolist()]
+        return warrior
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def close(self):
+        self.index, self.code = None, None # release the buffer before closing
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_warriors(simargs, paths):
+    """
+    Yields (path, source, warrior) for every .red file in paths and every warrior of the libraries
+    in paths (whose path is the file it was built from, and source None unless it was kept).
+    A library must have been built in the parse environment of simargs.
+    """
+    environment = simargs_to_environment(simargs)
+    for path in paths:
+        if path.endswith(LIBRARY_SUFFIX):
+            with WarriorLibrary(path) as library:
+                if library.environment != environment:
+                    raise ValueError(f"{path} was built with {library.environment}, not {environment}")
+                for meta, warrior in zip(library.metadata, library):
+                    yield meta["path"], meta.get("source"), warrior
+        else:
+            with open(path, encoding="latin1") as f:
+                source = f.read()
+            yield path, source, parse_cached(source, environment)
+
+@dataclass
+class Args:
+    output: str # library file to write, e.g. human_warriors.cwl
+    paths_glob: str = "human_warriors/*.red" # .red files to put in the library
+    simargs: SimulationArgs = field(default_factory=SimulationArgs) # Simulation arguments (the parse environment)
+    include_source: bool = True # keep the source of every warrior in the metadata
+
+def main(args: Args):
+    files = sorted(glob.glob(args.paths_glob))
+    errors = build_library(args.output, files, args.simargs, include_source=args.include_source)
+    for file, error in errors.items():
+        print(f"Skipped {file}: {error}")
+    print(f"Wrote {len(files) - len(errors)} warriors to {args.output}")
+
+if __name__ == "__main__":
+    main(tyro.cli(Args))
@@ -0,0 +1,173 @@
+import os
+import secrets
+from collections import OrderedDict, namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from corewar import Warrior, Instruction
+from battle_cache import warrior_hash, battle_hash
+
+OUTPUT_DTYPES = dict(score=float, alive_score=float, total_spawned_procs=int, memory_coverage=int) # outputs of run_single_round
+
+def pack_warrior(warrior):
+    """
+    Packs an assembled warrior into an int64 array: its start and number of instructions,
+    then opcode, modifier, a_mode, a_number, b_mode, b_number of every instruction.
+    """
+    program = [(i.opcode, i.modifier, i.a_mode, i.a_number, i.b_mode, i.b_number) for i in warrior.instructions]
+    return np.array([warrior.start, len(program)] + [x for fields in program for x in fields], dtype=np.int64)
+
+def unpack_warrior(packed):
+    start, n = int(packed[0]), int(packed[1])
+    warrior = Warrior(start=start)
+    for opcode, modifier, a_mode, a_number, b_mode, b_number in packed[2:2 + 6 * n].reshape(n, 6).tolist():
+        warrior.instructions.append(Instruction(opcode, modifier, a_mode, a_number, b_mode, b_number))
+    return warrior
+
+class LRU(OrderedDict):
+    """An OrderedDict that calls on_evict(value) on its first entries beyond capacity.
+    Users move the entries they hit to the end."""
+    def __init__(self, capacity, on_evict):
+        super().__init__()
+        self.capacity, self.on_evict = capacity, on_evict
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.capacity:
+            self.on_evict(self.popitem(last=False)[1])
+
+class SharedResults:
+    """
+    Outputs of the rounds of one battle, written by pool workers into a shared
+    (n_rounds, len(OUTPUT_DTYPES), n_warriors) float64 array. Tasks carry its
+    handle, with which workers attach to the same block (see attach_results).
+    """
+    def __init__(self, n_rounds, n_warriors, name=None):
+        self.shape = (n_rounds, len(OUTPUT_DTYPES), n_warriors)
+        size = max(1, int(np.prod(self.shape)) * 8)
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.array = np.ndarray(self.shape, dtype=np.float64, buffer=self.shm.buf)
+
+    @property
+    def handle(self):
+        return (self.shm.name, self.shape[0], self.shape[2])
+
+    def write(self, slot, outputs):
+        for i, key in enumerate(OUTPUT_DTYPES):
+            self.array[slot, i] = outputs[key]
+
+    def read(self, slot):
+        return {key: self.array[slot, i].astype(dtype) for i, (key, dtype) in enumerate(OUTPUT_DTYPES.items())}
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+        self.close()
+
+class WarriorRegistry:
+    """
+    Packs every warrior once into its own shared memory block, named after its hash,
+    so that pool tasks reference warriors by name instead of pickling them.
+    The capacity least recently registered warriors are kept; older blocks are unlinked.
+    """
+    def __init__(self, capacity=1024):
+        self.prefix = f"w{os.getpid()}_"
+        self.blocks = LRU(capacity, on_evict=lambda shm: (shm.close(), shm.unlink()))
+
+    def register(self, warrior):
+        name = self.prefix + warrior_hash(warrior)[:20]
+        if name not in self.blocks:
+            packed = pack_warrior(warrior)
+            shm = shared_memory.SharedMemory(name=name, create=True, size=packed.nbytes)
+            np.ndarray(packed.shape, dtype=packed.dtype, buffer=shm.buf)[:] = packed
+            self.blocks[name] = shm
+        else:
+            self.blocks.move_to_end(name)
+        return name
+
+    def results(self, n_rounds, n_warriors):
+        return SharedResults(n_rounds, n_warriors)
+
+    def close(self):
+        for shm in self.blocks.values():
+            shm.close()
+            shm.unlink()
+        self.blocks.clear()
+
+BundleHandle = namedtuple("BundleHandle", ["name"]) # stands for the opponents of an OpponentBundle in a task
+
+class OpponentBundle:
+    """
+    Opponents shared by many battles, e.g. the champions every warrior of a DRQ round plays against,
+    resolved and prepared once: their battle_hash under simargs (for the keys of a BattleCache) and their packed
+    programs, one after another in one shared memory block. Tasks carry its handle instead of the
+    opponents, and every worker unpacks them the first time it sees the handle and keeps them (see
+    resolve_warriors). Close it once no task uses it anymore.
+    """
+    def __init__(self, warriors, simargs):
+        self.warriors = list(warriors)
+        self.hashes = [battle_hash(w, simargs) for w in self.warriors]
+        packed = [pack_warrior(w) for w in self.warriors]
+        blob = np.concatenate([[len(packed)], [len(p) for p in packed], *packed]).astype(np.int64)
+        self.shm = shared_memory.SharedMemory(name=f"b{os.getpid()}_{secrets.token_hex(8)}", create=True, size=blob.nbytes)
+        np.ndarray(blob.shape, dtype=blob.dtype, buffer=self.shm.buf)[:] = blob
+        self.handle = BundleHandle(self.shm.name)
+
+    def __len__(self):
+        return len(self.warriors)
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+# worker side: blocks attached by this process, by name
+_warriors = LRU(1024, on_evict=lambda item: None)
+_results = LRU(8, on_evict=lambda results: results.close())
+_bundles = LRU(8, on_evict=lambda item: None)
+
+def attach_warrior(name):
+    if name not in _warriors:
+        shm = shared_memory.SharedMemory(name=name)
+        packed = np.ndarray(shm.size // 8, dtype=np.int64, buffer=shm.buf)
+        _warriors[name] = unpack_warrior(packed)
+        del packed # release the buffer before closing
+        shm.close()
+    _warriors.move_to_end(name)
+    return _warriors[name]
+
+def attach_results(name, n_rounds, n_warriors):
+    if name not in _results:
+        _results[name] = SharedResults(n_rounds, n_warriors, name=name)
+    _results.move_to_end(name)
+    return _results[name]
+
+def attach_bundle(name):
+    if name not in _bundles:
+        shm = shared_memory.SharedMemory(name=name)
+        blob = np.ndarray(shm.size // 8, dtype=np.int64, buffer=shm.buf)
+        n = int(blob[0])
+        ends = 1 + n + np.cumsum(blob[1:1 + n])
+        _bundles[name] = [unpack_warrior(blob[end - length:end]) for end, length in zip(ends.tolist(), blob[1:1 + n].tolist())]
+        del blob # release the buffer before closing
+        shm.close()
+    _bundles.move_to_end(name)
+    return _bundles[name]
+
+def resolve_warriors(payload):
+    """The warriors of a task: Warriors as they are, names of WarriorRegistry blocks and OpponentBundle handles attached."""
+    warriors = []
+    for w in payload:
+        if isinstance(w, BundleHandle):
+            warriors.extend(attach_bundle(w.name))
+        elif isinstance(w, str):
+            warriors.append(attach_warrior(w))
+        else:
+            warriors.append(w)
+    return warriors
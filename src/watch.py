@@ -120,7 +120,7 @@ def main():
             sim.step()
             cycle += 1
             
-            alive = [w for w in sim.warriors if w.task_queue]
+            alive = [w for w in sim.states if w.task_queue]
             if len(alive) < 2:
                 print(f"Battle ended at cycle {cycle}.")
                 paused = True 
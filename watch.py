@@ -122,7 +122,7 @@ def main():
         if not paused and cycle < 80000:
             sim.step()
             cycle += 1
-            alive = [w for w in sim.warriors if w.task_queue]
+            alive = [w for w in sim.states if w.task_queue]
             if len(alive) < 2:
                 print(f"Match End at cycle {cycle}.")
                 paused = True
@@ -148,8 +148,8 @@ def main():
 
         stats_y = grid_h - 80
         screen.blit(font.render(f"Cycle: {cycle}", True, (0, 255, 0)), (grid_w + 10, stats_y))
-        screen.blit(font.render(f"{w1.name}: {len(w1.task_queue)}", True, w1.color[1]), (grid_w + 10, stats_y + 20))
-        screen.blit(font.render(f"{w2.name}: {len(w2.task_queue)}", True, w2.color[1]), (grid_w + 10, stats_y + 40))
+        screen.blit(font.render(f"{w1.name}: {len(sim.states[0].task_queue)}", True, w1.color[1]), (grid_w + 10, stats_y + 20))
+        screen.blit(font.render(f"{w2.name}: {len(sim.states[1].task_queue)}", True, w2.color[1]), (grid_w + 10, stats_y + 40))
 
         pygame.display.flip()
         clock.tick(FPS)